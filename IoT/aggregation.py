@@ -0,0 +1,181 @@
+"""
+Edge aggregation of sensor readings before they are uploaded.
+
+Sits between parse_arduino_data and the upload queue, so a tank whose water
+isn't changing doesn't post the same reading every second:
+
+- Deadband: a reading is only sent when pH or temperature has moved by more
+  than a threshold since the last reading that was sent, or its status
+  changed (a SAFE -> ACIDIC change is always sent)
+- Heartbeat: while readings are being held back, the latest one is still
+  sent every heartbeat seconds, so the dashboard knows the device is alive
+- Windows: optionally, readings are summarized per tumbling window (aligned
+  to the clock, so devices' windows line up) and one summary is sent per
+  window, with the min/max/mean/EWMA of each value and the sample count.
+  The deadband and heartbeat then apply to the summaries
+
+A summary is an ordinary reading (ph_value/temperature are the window means)
+with an extra "window" object, so the API accepts it like any other reading.
+
+One EdgeAggregator is used by one reader thread; it is not thread-safe.
+"""
+
+import time
+
+from uploader import reading_timestamp
+
+VALUES = ('ph_value', 'temperature')
+
+
+class _Window:
+    __slots__ = ('start', 'end', 'count', 'sums', 'mins', 'maxs', 'status', 'device_id')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.count = 0
+        self.sums = dict.fromkeys(VALUES, 0.0)
+        self.mins = {}
+        self.maxs = {}
+        self.status = None
+        self.device_id = None
+
+    def add(self, reading):
+        self.count += 1
+        for name in VALUES:
+            value = reading[name]
+            self.sums[name] += value
+            self.mins[name] = min(self.mins.get(name, value), value)
+            self.maxs[name] = max(self.maxs.get(name, value), value)
+        self.status = reading.get('status')
+        self.device_id = reading.get('device_id')
+
+
+class EdgeAggregator:
+    """
+    Deadband filter, heartbeat and tumbling-window summaries for one device's readings.
+
+    Args:
+        ph_deadband: pH change a reading must exceed to be sent (0 = send every reading)
+        temperature_deadband: Temperature change (°C) a reading must exceed to be sent (0 = send every reading)
+        heartbeat: Seconds after which the latest held-back reading is sent anyway (0 = never)
+        window: Tumbling window length in seconds (0 = send readings, not summaries)
+        ewma_alpha: Weight of the newest reading in the exponentially weighted moving average
+        status_fn: Computes a summary's status from its mean pH (default: the last reading's status)
+    """
+
+    def __init__(self, ph_deadband=0.05, temperature_deadband=0.1, heartbeat=60.0, window=0.0, ewma_alpha=0.3,
+                 status_fn=None):
+        if not 0 < ewma_alpha <= 1:
+            raise ValueError(f'ewma_alpha must be in (0, 1], got {ewma_alpha}')
+        self.deadbands = {'ph_value': ph_deadband, 'temperature': temperature_deadband}
+        self.heartbeat = heartbeat
+        self.window = window
+        self.ewma_alpha = ewma_alpha
+        self.status_fn = status_fn
+        self.ewma = dict.fromkeys(VALUES)
+        self._window = None
+        self._last_sent = None
+        self._last_sent_at = None
+        self._held = None  # Latest reading held back by the deadband
+        self.suppressed = 0
+        self.heartbeats = 0
+        self.windows = 0
+
+    def process(self, reading, now=None):
+        """Take a parsed reading; returns the readings/summaries to send now (often none)"""
+        now = time.time() if now is None else now
+        for name in VALUES:
+            previous = self.ewma[name]
+            value = reading[name]
+            self.ewma[name] = value if previous is None else previous + self.ewma_alpha * (value - previous)
+
+        ready = self.tick(now)
+        if not self.window:
+            return ready + self._filter(reading, now)
+        if self._window is None:
+            start = now - now % self.window
+            self._window = _Window(start, start + self.window)
+        self._window.add(reading)
+        return ready
+
+    def tick(self, now=None):
+        """
+        Close a finished window and send a due heartbeat; call this regularly,
+        also when no readings arrive. Returns the readings/summaries to send.
+        """
+        now = time.time() if now is None else now
+        ready = []
+        if self._window is not None and now >= self._window.end:
+            summary = self._summarize(self._window)
+            self._window = None
+            self.windows += 1
+            ready.extend(self._filter(summary, now))
+        if (self.heartbeat and self._held is not None and self._last_sent_at is not None
+                and now - self._last_sent_at >= self.heartbeat):
+            self.heartbeats += 1
+            ready.append(self._send(self._held, now))
+        return ready
+
+    def flush(self, now=None):
+        """Everything still held back (an open window's summary, a held reading), e.g. on shutdown"""
+        now = time.time() if now is None else now
+        ready = []
+        if self._window is not None and self._window.count:
+            ready.append(self._send(self._summarize(self._window, now), now))
+            self._window = None
+            self.windows += 1
+        elif self._held is not None:
+            ready.append(self._send(self._held, now))
+        return ready
+
+    def _filter(self, reading, now):
+        if self._changed(reading):
+            return [self._send(reading, now)]
+        self._held = reading
+        self.suppressed += 1
+        return []
+
+    def _changed(self, reading):
+        last = self._last_sent
+        if last is None or reading.get('status') != last.get('status'):
+            return True
+        for name, deadband in self.deadbands.items():
+            if deadband <= 0 or round(abs(reading[name] - last[name]), 6) > deadband:
+                return True
+        return False
+
+    def _send(self, reading, now):
+        self._last_sent = reading
+        self._last_sent_at = now
+        self._held = None
+        return reading
+
+    def _summarize(self, window, end=None):
+        end = window.end if end is None else min(end, window.end)
+        summary = {'window': {
+            'start': reading_timestamp(window.start),
+            'end': reading_timestamp(end),
+            'count': window.count
+        }}
+        for name in VALUES:
+            mean = window.sums[name] / window.count
+            summary[name] = round(mean, 2)
+            summary['window'][name] = {
+                'min': window.mins[name],
+                'max': window.maxs[name],
+                'mean': round(mean, 3),
+                'ewma': round(self.ewma[name], 3)
+            }
+        summary['status'] = self.status_fn(summary['ph_value']) if self.status_fn else window.status
+        summary['timestamp'] = summary['window']['end']
+        if window.device_id is not None:
+            summary['device_id'] = window.device_id
+        return summary
+
+    def stats(self):
+        return {
+            'readings_suppressed': self.suppressed,
+            'heartbeats_sent': self.heartbeats,
+            'windows_closed': self.windows
+        }
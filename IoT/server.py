@@ -1,8 +1,18 @@
 import serial
 import serial.tools.list_ports
 import requests
+import queue
+import threading
 import time
 import os
+import math
+
+from aggregation import EdgeAggregator
+from spool import ReadingSpool
+from uploader import BatchSender, UploaderMetrics, enqueue_reading, reading_timestamp, start_metrics_server
+
+def looks_like_arduino(port):
+    return "Arduino" in port.description or "CH340" in port.description or "USB Serial" in port.description
 
 def find_arduino(port_name=None):
     """
@@ -34,7 +44,7 @@ def find_arduino(port_name=None):
     print("Available ports:")
     for port in ports:
         print(f"  - {port.device}: {port.description}")
-        if "Arduino" in port.description or "CH340" in port.description or "USB Serial" in port.description:
+        if looks_like_arduino(port):
             print(f"  >>> Found Arduino on {port.device}! <<<")
             return port.device
     
@@ -56,14 +66,6 @@ def interpret_ph_status(ph):
     else:
         return "UNKNOWN"
 
-arduino = None
-last_data_sent = ""  # Track last sent data to avoid duplicates
-session = requests.Session()
-session.headers.update({
-    'User-Agent': 'Mozilla/5.0',
-    'Content-Type': 'application/json'
-})
-
 # Use Next.js API endpoint (change to your server URL if deploying)
 # For local development, use: http://localhost:3000/api/iot-data or http://localhost:3001/api/iot-data
 # For production, use: https://smartfishcare.site/api/iot-data
@@ -71,17 +73,66 @@ session.headers.update({
 # Check if config.py exists (for custom configuration)
 try:
     import config
-    API_URL = getattr(config, 'API_URL', None)
-    ARDUINO_PORT = getattr(config, 'ARDUINO_PORT', None)
-    REQUEST_TIMEOUT = getattr(config, 'REQUEST_TIMEOUT', 10)
 except ImportError:
-    # Default configuration (no config.py file)
-    API_URL = None
-    ARDUINO_PORT = None
-    REQUEST_TIMEOUT = 10
+    config = None  # Default configuration (no config.py file)
+
+def setting(name, default):
+    """Setting from the IOT_<name> environment variable, then config.py, then the default"""
+    value = os.getenv(f'IOT_{name}')
+    if value is None:
+        value = getattr(config, name, default)
+    return parse_setting(name, value, default)
+
+def parse_setting(name, value, default):
+    """
+    Convert a setting to the type of its default (IOT_BATCH_SIZE=8.0 is 8); a value
+    that isn't a valid number, e.g. an empty variable, falls back to the default with a warning.
+    String settings (and those defaulting to None) are used as given.
+    """
+    if default is None or isinstance(default, str) or type(value) is type(default):
+        return value
+    try:
+        number = float(value)
+        if not math.isfinite(number) or (isinstance(default, int) and not number.is_integer()):
+            raise ValueError(value)
+    except (TypeError, ValueError):
+        print(f"⚠️  Invalid {name} setting {value!r}, using the default {default!r}")
+        return default
+    return int(number) if isinstance(default, int) else number
 
 # Check environment variable first, then config.py, then default
-API_URL = os.getenv('IOT_API_URL', API_URL or 'https://smartfishcare.site/api/iot-data')
+API_URL = setting('API_URL', None) or 'https://smartfishcare.site/api/iot-data'
+ARDUINO_PORT = setting('ARDUINO_PORT', None)
+REQUEST_TIMEOUT = setting('REQUEST_TIMEOUT', 10)
+
+# Several Arduinos at once, each read by its own thread: None = just ARDUINO_PORT / the first Arduino found,
+# 'all' = every Arduino-looking port, or a list of ports (IOT_ARDUINO_PORTS=COM3,COM4)
+ARDUINO_PORTS = setting('ARDUINO_PORTS', None)
+# Device IDs by USB serial number or port (IOT_DEVICE_IDS=COM3=tank-1,...); default: the USB serial number
+DEVICE_IDS = setting('DEVICE_IDS', None)
+DEVICE_SCAN_INTERVAL = setting('DEVICE_SCAN_INTERVAL', 5.0)  # Seconds between looks for new/replugged devices
+
+# Serial reading and sending are decoupled by a bounded queue (the oldest reading is dropped when it is full)
+QUEUE_SIZE = setting('QUEUE_SIZE', 1000)
+BATCH_SIZE = setting('BATCH_SIZE', 20)  # Readings per request (1 = one request per reading, old API format)
+BATCH_INTERVAL = setting('BATCH_INTERVAL', 2.0)  # Seconds to collect readings before sending a partial batch
+
+# Readings are spooled to disk until the server acknowledges them ('' = memory only, lost on outages/restarts)
+SPOOL_PATH = setting('SPOOL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool.db'))
+SPOOL_MAX_MB = setting('SPOOL_MAX_MB', 50.0)  # Oldest readings are dropped beyond this
+SPOOL_COMPACT_INTERVAL = setting('SPOOL_COMPACT_INTERVAL', 600.0)  # Seconds between spool compactions
+REPLAY_BATCH_SIZE = setting('REPLAY_BATCH_SIZE', 200)  # Readings per request when catching up on a backlog
+REPLAY_RATE = setting('REPLAY_RATE', 1.0)  # Backlog requests per second
+
+# Edge aggregation: hold back readings that haven't changed (0 = send every reading)
+PH_DEADBAND = setting('PH_DEADBAND', 0.05)  # pH change a reading must exceed to be sent
+TEMPERATURE_DEADBAND = setting('TEMPERATURE_DEADBAND', 0.1)  # Temperature change (°C) a reading must exceed
+HEARTBEAT_INTERVAL = setting('HEARTBEAT_INTERVAL', 60.0)  # Send the latest held-back reading at least this often
+WINDOW_SECONDS = setting('WINDOW_SECONDS', 0.0)  # Send one min/max/mean/EWMA summary per window (0 = off)
+EWMA_ALPHA = setting('EWMA_ALPHA', 0.3)  # Weight of the newest reading in the summaries' EWMA
+
+METRICS_PORT = setting('METRICS_PORT', 0)  # Serve Prometheus metrics on this port (0 = off)
+STATUS_INTERVAL = setting('STATUS_INTERVAL', 60.0)  # Seconds between status lines on the console (0 = off)
 
 # For local development, you can:
 # 1. Set environment variable: set IOT_API_URL=http://localhost:3001/api/iot-data
@@ -90,7 +141,6 @@ API_URL = os.getenv('IOT_API_URL', API_URL or 'https://smartfishcare.site/api/io
 # API_URL = "http://localhost:3001/api/iot-data"
 
 url = API_URL
-print(f"📡 IoT Server configured to send data to: {url}")
 
 # OPTIONAL: Specify Arduino port manually (e.g., 'COM3', 'COM4', '/dev/ttyUSB0')
 # Leave as None to auto-detect, or set in config.py
@@ -118,6 +168,8 @@ def parse_arduino_data(raw_data):
         
         ph = round(float(parts['ph_value']), 2)
         temp = round(float(parts['temperature']), 2)
+        if not (math.isfinite(ph) and math.isfinite(temp)):
+            return None  # Arduino prints "nan" when a sensor read fails; NaN isn't valid JSON
         status = parts.get('status', interpret_ph_status(ph))  # Get status or calculate it
         
         return {
@@ -133,104 +185,230 @@ def parse_arduino_data(raw_data):
         print(f"Unexpected error parsing data: {e}")
         return None
 
-print("Starting Smart Fish Care Sensor Uploader... (Press Ctrl+C to stop)")
+def open_arduino(port, label='Arduino', wait=time.sleep):
+    """Open a serial port; returns it, or None after printing why and waiting a little"""
+    try:
+        arduino = serial.Serial(port, 9600, timeout=1)
+        print(f"Connected to {label} on {port}")
+        # No delay - start reading immediately
+        return arduino
+    except serial.SerialException as e:
+        print(f"\nERROR: Could not open port {port} ({label})")
+        print(f"Error details: {e}")
+        print("\nPossible solutions:")
+        print(f"  1. Close Arduino IDE or any other program using {port}")
+        print("  2. Unplug and reconnect the Arduino USB cable")
+        print(f"  3. Check Device Manager to see if {port} is available")
+        print("  4. Try a different USB port")
+        print("\nRetrying in 2 seconds...\n")
+        wait(2)
+        return None
+
+def parse_device_ids(value):
+    """DEVICE_IDS from config.py (a dict) or the environment ('COM3=tank-1,85739313437351F0B1C1=tank-2')"""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return {str(key): str(device_id) for key, device_id in value.items()}
+    pairs = (item.split('=', 1) for item in value.split(',') if '=' in item)
+    return {key.strip(): device_id.strip() for key, device_id in pairs}
+
+def parse_port_list(value):
+    """ARDUINO_PORTS from config.py (a list) or the environment ('COM3,COM4'); 'all' stays a string"""
+    if isinstance(value, str) and value.strip().lower() != 'all':
+        return [port.strip() for port in value.split(',') if port.strip()]
+    return value
+
+DEVICE_ID_MAP = parse_device_ids(DEVICE_IDS)
+PORT_SELECTION = parse_port_list(ARDUINO_PORTS)
+
+def device_id_for(port_info):
+    """
+    Stable ID for the device on a port: DEVICE_IDS by USB serial number or port name,
+    else the USB serial number, else the USB location (the physical socket), else the port name
+    """
+    serial_number = getattr(port_info, 'serial_number', None)
+    for key in (serial_number, port_info.device):
+        if key and key in DEVICE_ID_MAP:
+            return DEVICE_ID_MAP[key]
+    if serial_number:
+        return serial_number
+    location = getattr(port_info, 'location', None)
+    if location:
+        return f"usb-{location}"
+    return os.path.basename(port_info.device)
+
+def discover_arduinos():
+    """
+    Ports to read, as ListPortInfo: every Arduino-looking port when ARDUINO_PORTS is 'all',
+    the listed ports when it is a list, else the single ARDUINO_PORT / first Arduino found
+    """
+    ports = serial.tools.list_ports.comports()
+    if PORT_SELECTION is None:
+        port_name = find_arduino(ARDUINO_PORT)
+        return [port for port in ports if port.device == port_name][:1]
+    if PORT_SELECTION == 'all':
+        return [port for port in ports if looks_like_arduino(port)]
+    return [port for port in ports if port.device in PORT_SELECTION]
+
+def port_present(port):
+    return any(info.device == port for info in serial.tools.list_ports.comports())
+
+class DeviceReader(threading.Thread):
+    """
+    Reads one Arduino in its own thread, so a slow or unplugged probe never holds up the others.
+
+    Readings get the device's ID and go through its own aggregator onto the shared queue
+    (never waiting on the network). A lost connection is retried on the same port; once
+    the port is gone the thread ends and the supervisor starts a new one when it is back.
+    """
+
+    def __init__(self, port, device_id, readings_queue, metrics, aggregator):
+        super().__init__(name=f'reader-{device_id}', daemon=True)
+        self.port = port
+        self.device_id = device_id
+        self.readings_queue = readings_queue
+        self.metrics = metrics
+        self.aggregator = aggregator
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def enqueue(self, readings):
+        for reading in readings:
+            enqueue_reading(self.readings_queue, reading, self.metrics)
+
+    def run(self):
+        arduino = None
+        try:
+            while not self._stop_event.is_set():
+                # Closes windows and sends heartbeats even while the Arduino is quiet or reconnecting
+                self.enqueue(self.aggregator.tick())
+
+                if arduino is None or not arduino.is_open:
+                    if not port_present(self.port):
+                        print(f"🔌 {self.device_id} unplugged from {self.port}")
+                        return
+                    arduino = open_arduino(self.port, self.device_id, self._stop_event.wait)
+                    continue
 
-try:
-    while True:
-        if arduino is None or not arduino.is_open:
-            arduino_port = find_arduino(ARDUINO_PORT)
-            if arduino_port:
                 try:
-                    arduino = serial.Serial(arduino_port, 9600, timeout=1)
-                    print(f"Connected to Arduino on {arduino_port}")
-                    # No delay - start reading immediately
-                except serial.SerialException as e:
-                    print(f"\nERROR: Could not open port {arduino_port}")
-                    print(f"Error details: {e}")
-                    print("\nPossible solutions:")
-                    print("  1. Close Arduino IDE or any other program using COM3")
-                    print("  2. Unplug and reconnect the Arduino USB cable")
-                    print("  3. Check Device Manager to see if COM3 is available")
-                    print("  4. Try a different USB port")
-                    print("\nRetrying in 2 seconds...\n")
+                    line = arduino.readline().decode(errors='ignore').strip()
+                except serial.SerialException:
+                    print(f"Connection to {self.device_id} lost. Attempting to reconnect...")
+                    try:
+                        arduino.close()
+                    except Exception:
+                        pass
                     arduino = None
-                    time.sleep(2)
+                    self.metrics.inc('device_reconnects')
+                    self._stop_event.wait(1)  # Quick reconnect
                     continue
-            else:
-                print("Arduino not found. Retrying in 2 seconds...")
-                time.sleep(2)
-                continue
 
-        try:
-            line = arduino.readline().decode(errors='ignore').strip()
-        except serial.SerialException:
-            print("Connection lost. Attempting to reconnect...")
+                # Only parse lines that contain sensor data
+                # Silently skip debug messages and other non-data lines
+                parsed = parse_arduino_data(line) if line else None
+                if parsed:
+                    print(f"📊 [{self.device_id}] pH: {parsed['ph_value']} | Temperature: {parsed['temperature']} °C | "
+                          f"Status: {parsed['status']}")
+                    parsed['device_id'] = self.device_id
+                    parsed['timestamp'] = reading_timestamp()
+                    self.metrics.inc('readings_read')
+                    self.enqueue(self.aggregator.process(parsed))
+        finally:
             if arduino:
-                try:
-                    arduino.close()
-                except:
-                    pass
-            arduino = None
-            time.sleep(1)  # Quick reconnect
-            continue
-
-        if line:
-            # Only parse lines that contain sensor data
-            parsed = parse_arduino_data(line)
-            if parsed:
-                ph = parsed['ph_value']
-                temp = parsed['temperature']
-                status = parsed['status']  # Get status from Arduino data
-
-                # Create a unique key for this data combination
-                data_key = f"{ph}_{temp}_{status}"
-                
-                # Send data in real-time (always send, let server handle duplicates)
-                print(f"\n📊 Sensor Data Received:")
-                print(f"   pH: {ph} | Temperature: {temp} °C | Status: {status}")
-                
-                try:
-                    # Send as JSON to Next.js API (real-time updates)
-                    # Send all three values: ph_value, temperature, and status
-                    payload = {
-                        'ph_value': ph,
-                        'temperature': temp,
-                        'status': status
-                    }
-                    response = session.post(url, json=payload, timeout=REQUEST_TIMEOUT)
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get('status') == 'success':
-                            print(f"✅ Data uploaded to Supabase successfully!")
-                            print(f"   Database ID: {result.get('data', {}).get('id', 'N/A')}")
-                            print(f"   Timestamp: {result.get('data', {}).get('timestamp', 'N/A')}")
-                        else:
-                            print(f"⚠️  Server response: {result.get('message', 'Unknown response')}")
-                        last_data_sent = data_key
-                    else:
-                        print(f"⚠️  Server returned status code {response.status_code}")
-                        try:
-                            error_data = response.json()
-                            print(f"   Error: {error_data.get('message', response.text)}")
-                        except:
-                            print(f"   Response: {response.text}")
-                except requests.exceptions.ConnectionError as e:
-                    print(f"❌ Connection Error: Cannot reach server at {url}")
-                    print(f"   Make sure Next.js server is running and accessible")
-                    print(f"   Error details: {e}")
-                except requests.exceptions.Timeout:
-                    print(f"❌ Timeout: Server took too long to respond (10s timeout)")
-                    print(f"   Check your network connection or server status")
-                except requests.exceptions.RequestException as e:
-                    print(f"❌ Network Error: {e}")
-                except Exception as e:
-                    print(f"❌ Unexpected error: {e}")
-            # Silently skip debug messages and other non-data lines
+                arduino.close()
 
-    
+def make_aggregator():
+    return EdgeAggregator(PH_DEADBAND, TEMPERATURE_DEADBAND, HEARTBEAT_INTERVAL, WINDOW_SECONDS, EWMA_ALPHA,
+                          status_fn=interpret_ph_status)
+
+def read_devices(readings_queue, metrics, aggregators, readers):
+    """
+    Keep a DeviceReader running for every discovered Arduino until interrupted.
+    aggregators (by device ID) outlive the readers, so a replugged device keeps its deadband and window.
+    """
+    last_status = time.monotonic()
+    while True:
+        if STATUS_INTERVAL and time.monotonic() - last_status >= STATUS_INTERVAL:
+            print(f"📈 {metrics.summary()}")
+            last_status = time.monotonic()
+
+        for port, reader in list(readers.items()):
+            if not reader.is_alive():
+                del readers[port]
+
+        # Single-device mode only looks for a device while it has none (find_arduino lists every port)
+        if PORT_SELECTION is not None or not readers:
+            for port_info in discover_arduinos():
+                if port_info.device in readers:
+                    continue
+                device_id = device_id_for(port_info)
+                if device_id not in aggregators:
+                    aggregators[device_id] = make_aggregator()
+                reader = DeviceReader(port_info.device, device_id, readings_queue, metrics, aggregators[device_id])
+                readers[port_info.device] = reader
+                print(f"🔌 Reading {device_id} on {port_info.device}")
+                reader.start()
+        metrics.set_devices(sum(reader.is_alive() for reader in readers.values()))
+
+        if not readers:
+            print("Arduino not found. Retrying in 2 seconds...")
+            time.sleep(2)
+        else:
+            time.sleep(DEVICE_SCAN_INTERVAL)
+
+def main():
+    print(f"📡 IoT Server configured to send data to: {url}")
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0',
+        'Content-Type': 'application/json'
+    })
+
+    spool = None
+    if SPOOL_PATH:
+        spool = ReadingSpool(SPOOL_PATH, SPOOL_MAX_MB, SPOOL_COMPACT_INTERVAL)
+        print(f"💾 Spooling readings to {SPOOL_PATH} ({len(spool)} unsent from the last run)")
+
+    if PORT_SELECTION is not None:
+        print(f"🔌 Reading {'every Arduino' if PORT_SELECTION == 'all' else ', '.join(PORT_SELECTION)} "
+              f"(looking for new devices every {DEVICE_SCAN_INTERVAL:g}s)")
+    if WINDOW_SECONDS:
+        print(f"🧮 Sending one summary per {WINDOW_SECONDS:g}s window")
+    if PH_DEADBAND > 0 or TEMPERATURE_DEADBAND > 0:
+        print(f"🧮 Holding back readings within ±{PH_DEADBAND:g} pH / ±{TEMPERATURE_DEADBAND:g} °C "
+              f"(heartbeat every {HEARTBEAT_INTERVAL:g}s)")
+
+    readings_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    aggregators = {}  # device ID -> EdgeAggregator
+    readers = {}  # port -> DeviceReader
+    metrics = UploaderMetrics(readings_queue, spool, aggregators)
+    sender = BatchSender(session, url, readings_queue, metrics, BATCH_SIZE, BATCH_INTERVAL, REQUEST_TIMEOUT,
+                         spool=spool, replay_batch_size=REPLAY_BATCH_SIZE, replay_rate=REPLAY_RATE)
+    sender.start()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, metrics)
+        print(f"📈 Metrics on http://0.0.0.0:{METRICS_PORT}/metrics")
+
+    print("Starting Smart Fish Care Sensor Uploader... (Press Ctrl+C to stop)")
+    try:
+        read_devices(readings_queue, metrics, aggregators, readers)
+    except KeyboardInterrupt:
+        for reader in readers.values():
+            reader.stop()
+        for reader in readers.values():
+            reader.join(timeout=2)
+        for aggregator in list(aggregators.values()):
+            for reading in aggregator.flush():
+                enqueue_reading(readings_queue, reading, metrics)
+        print("\nSending queued readings...")
+        sender.stop(timeout=REQUEST_TIMEOUT + 5)
+        print(f"📈 {metrics.summary()}")
+        if spool is not None and not sender.is_alive():
+            spool.close()
+        print("Exiting Smart Fish Care live sender. Goodbye!")
 
-except KeyboardInterrupt:
-    print("\nExiting Smart Fish Care live sender. Goodbye!")
-    if arduino:
-        arduino.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Durable on-disk spool for sensor readings.
+
+Every parsed reading is written to a small SQLite database before it is sent
+and only deleted once the server has acknowledged it, so readings survive
+network outages and restarts of the script: after a restart sending resumes
+with the oldest unacknowledged reading.
+
+The spool is capped at max_mb; when it is full the oldest readings are
+evicted (and counted) to make room. Deleted rows are given back to the file
+system by incremental vacuuming, and the write-ahead log is truncated, so the
+database stays small on an SD card over weeks of running.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Share of the readings evicted at once when the spool is over its size cap
+EVICT_FRACTION = 0.1
+
+# Check the spool size every this many appended readings
+SIZE_CHECK_EVERY = 100
+
+
+class ReadingSpool:
+    """
+    SQLite-backed FIFO of readings waiting for acknowledgement.
+
+    Args:
+        path: Database file (created if missing)
+        max_mb: Size cap in megabytes; the oldest readings are evicted beyond it (0 = no cap)
+        compact_interval: Seconds between compactions (incremental vacuum + WAL truncate)
+    """
+
+    def __init__(self, path, max_mb=50, compact_interval=600):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Must be set before the first table exists for incremental vacuuming to work
+        self._db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self._db.execute('PRAGMA journal_mode = WAL')
+        # FULL: a reading that was appended survives a power cut, not just a crash of the script
+        self._db.execute('PRAGMA synchronous = FULL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS readings ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, payload TEXT NOT NULL)'
+        )
+        self._count = self._db.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+        self._appended_since_check = 0
+        self._last_compact = time.monotonic()
+        self.evicted = 0
+
+    def __len__(self):
+        return self._count
+
+    def append_many(self, readings):
+        """Store readings in one transaction; returns how many old readings were evicted to make room"""
+        if not readings:
+            return 0
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany('INSERT INTO readings (created, payload) VALUES (?, ?)',
+                                 [(now, json.dumps(reading, separators=(',', ':'))) for reading in readings])
+            self._db.execute('COMMIT')
+            self._count += len(readings)
+            self._appended_since_check += len(readings)
+            if self._appended_since_check < SIZE_CHECK_EVERY:
+                return 0
+            self._appended_since_check = 0
+            return self._enforce_cap()
+
+    def _used_bytes(self):
+        page_size = self._db.execute('PRAGMA page_size').fetchone()[0]
+        pages = self._db.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self._db.execute('PRAGMA freelist_count').fetchone()[0]
+        return (pages - free_pages) * page_size
+
+    def _enforce_cap(self):
+        """Evict the oldest readings while the spool is over its size cap (caller holds the lock)"""
+        if not self.max_bytes:
+            return 0
+        evicted = 0
+        while self._count and self._used_bytes() > self.max_bytes:
+            count = max(1, int(self._count * EVICT_FRACTION))
+            self._db.execute('DELETE FROM readings WHERE id IN (SELECT id FROM readings ORDER BY id LIMIT ?)',
+                             (count,))
+            self._count -= count
+            evicted += count
+        if evicted:
+            self.evicted += evicted
+            print(f"⚠️  Spool full ({self.max_bytes / 1024 / 1024:.0f} MB): dropped the {evicted} oldest reading(s)")
+            self._compact()
+        return evicted
+
+    def peek(self, limit):
+        """The oldest readings as [(id, reading)], oldest first"""
+        with self._lock:
+            rows = self._db.execute('SELECT id, payload FROM readings ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def oldest_age(self):
+        """Seconds since the oldest reading was spooled (None when empty)"""
+        with self._lock:
+            row = self._db.execute('SELECT created FROM readings ORDER BY id LIMIT 1').fetchone()
+        return time.time() - row[0] if row else None
+
+    def ack(self, last_id):
+        """Delete every reading up to and including last_id (the server has them)"""
+        with self._lock:
+            deleted = self._db.execute('DELETE FROM readings WHERE id <= ?', (last_id,)).rowcount
+            self._count = max(0, self._count - deleted)
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                self._compact()
+        return deleted
+
+    def _compact(self):
+        """Return free pages to the file system and truncate the WAL (caller holds the lock)"""
+        self._db.execute('PRAGMA incremental_vacuum')
+        self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._last_compact = time.monotonic()
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def file_bytes(self):
+        """Database plus write-ahead log size on disk"""
+        total = 0
+        for path in (self.path, f'{self.path}-wal'):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def close(self):
+        with self._lock:
+            self._compact()
+            self._db.close()
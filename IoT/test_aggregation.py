@@ -0,0 +1,96 @@
+from aggregation import EdgeAggregator
+
+
+def reading(ph, temperature, status='SAFE'):
+    return {'ph_value': ph, 'temperature': temperature, 'status': status}
+
+
+def test_deadband_holds_back_small_changes():
+    aggregator = EdgeAggregator(ph_deadband=0.05, temperature_deadband=0.1, heartbeat=0)
+    assert aggregator.process(reading(7.0, 25.0), now=0) == [reading(7.0, 25.0)]
+    # Within both deadbands (an exact 0.05 step doesn't exceed it)
+    assert aggregator.process(reading(7.05, 25.1), now=1) == []
+    assert aggregator.process(reading(6.98, 24.95), now=2) == []
+    # pH moved by more than 0.05 from the last reading *sent*
+    assert aggregator.process(reading(7.06, 25.0), now=3) == [reading(7.06, 25.0)]
+    # Temperature alone is enough too
+    assert aggregator.process(reading(7.06, 25.2), now=4) == [reading(7.06, 25.2)]
+    assert aggregator.stats()['readings_suppressed'] == 2
+
+
+def test_status_change_is_always_sent():
+    aggregator = EdgeAggregator(ph_deadband=1.0, temperature_deadband=1.0, heartbeat=0)
+    aggregator.process(reading(6.5, 25.0, 'SAFE'), now=0)
+    assert aggregator.process(reading(6.49, 25.0, 'ACIDIC'), now=1) == [reading(6.49, 25.0, 'ACIDIC')]
+
+
+def test_zero_deadband_sends_every_reading():
+    aggregator = EdgeAggregator(ph_deadband=0, temperature_deadband=0)
+    sent = [aggregator.process(reading(7.0, 25.0), now=t) for t in range(3)]
+    assert sent == [[reading(7.0, 25.0)]] * 3
+
+
+def test_heartbeat_sends_latest_held_reading():
+    aggregator = EdgeAggregator(ph_deadband=0.05, temperature_deadband=0.1, heartbeat=10)
+    aggregator.process(reading(7.0, 25.0), now=0)
+    assert aggregator.process(reading(7.01, 25.0), now=5) == []
+    assert aggregator.process(reading(7.02, 25.0), now=8) == []
+    assert aggregator.tick(now=9) == []
+    assert aggregator.tick(now=10) == [reading(7.02, 25.0)]
+    assert aggregator.stats()['heartbeats_sent'] == 1
+    # Nothing held back since: no heartbeat repeats old data
+    assert aggregator.tick(now=25) == []
+
+
+def test_window_summary_min_max_mean_count():
+    aggregator = EdgeAggregator(ph_deadband=0, temperature_deadband=0, window=10, ewma_alpha=0.5)
+    # Window [100, 110) - aligned to the clock, not to the first reading
+    for now, ph, temperature in ((103, 7.0, 25.0), (105, 7.2, 26.0), (109, 7.4, 24.0)):
+        assert aggregator.process(reading(ph, temperature), now=now) == []
+
+    summaries = aggregator.tick(now=110)
+    assert len(summaries) == 1
+    summary = summaries[0]
+    window = summary['window']
+    assert window['count'] == 3
+    assert window['start'] == '1970-01-01T00:01:40.000Z'
+    assert window['end'] == summary['timestamp'] == '1970-01-01T00:01:50.000Z'
+    assert (window['ph_value']['min'], window['ph_value']['max']) == (7.0, 7.4)
+    assert window['ph_value']['mean'] == 7.2 and summary['ph_value'] == 7.2
+    assert (window['temperature']['min'], window['temperature']['max']) == (24.0, 26.0)
+    assert window['temperature']['mean'] == 25.0
+    # EWMA with alpha 0.5: 7.0 -> 7.1 -> 7.25
+    assert window['ph_value']['ewma'] == 7.25
+    assert summary['status'] == 'SAFE'
+    assert aggregator.stats()['windows_closed'] == 1
+
+
+def test_window_summaries_keep_device_id():
+    aggregators = {device_id: EdgeAggregator(window=10) for device_id in ('tank-1', 'tank-2')}
+    for device_id, ph in (('tank-1', 7.0), ('tank-2', 6.0)):
+        for now in (101, 104):
+            aggregators[device_id].process(dict(reading(ph, 25.0), device_id=device_id), now=now)
+
+    summaries = [summary for aggregator in aggregators.values() for summary in aggregator.tick(now=110)]
+    assert [(summary['device_id'], summary['ph_value']) for summary in summaries] == [('tank-1', 7.0), ('tank-2', 6.0)]
+    # A reading without a device_id gives a summary without one
+    aggregator = EdgeAggregator(window=10)
+    aggregator.process(reading(7.0, 25.0), now=101)
+    assert 'device_id' not in aggregator.tick(now=110)[0]
+
+
+def test_flush_sends_open_window_and_held_reading():
+    aggregator = EdgeAggregator(window=10)
+    aggregator.process(reading(7.0, 25.0), now=101)
+    aggregator.process(reading(7.2, 25.0), now=104)
+    flushed = aggregator.flush(now=105)
+    assert len(flushed) == 1
+    assert flushed[0]['window']['count'] == 2
+    assert flushed[0]['window']['end'] == '1970-01-01T00:01:45.000Z'
+    assert aggregator.flush(now=106) == []
+
+    aggregator = EdgeAggregator(heartbeat=0)
+    aggregator.process(reading(7.0, 25.0), now=0)
+    aggregator.process(reading(7.01, 25.0), now=1)
+    assert aggregator.flush(now=2) == [reading(7.01, 25.0)]
+
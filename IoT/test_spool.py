@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+from spool import ReadingSpool
+
+
+def reading(index):
+    return {'ph_value': 7.0, 'temperature': 25.0, 'status': 'SAFE', 'timestamp': f'reading-{index:05d}'}
+
+
+def test_ack_deletes_up_to_id():
+    with tempfile.TemporaryDirectory() as directory:
+        spool = ReadingSpool(os.path.join(directory, 'spool.db'))
+        spool.append_many([reading(i) for i in range(5)])
+        rows = spool.peek(3)
+        assert [row[1] for row in rows] == [reading(i) for i in range(3)]
+
+        assert spool.ack(rows[-1][0]) == 3
+        assert len(spool) == 2
+        assert [row[1] for row in spool.peek(10)] == [reading(3), reading(4)]
+        spool.close()
+
+
+def test_resume_after_reopen():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'spool.db')
+        spool = ReadingSpool(path)
+        spool.append_many([reading(i) for i in range(10)])
+        spool.ack(spool.peek(4)[-1][0])
+        spool.close()
+
+        # A restart picks up with the oldest unacknowledged reading
+        spool = ReadingSpool(path)
+        assert len(spool) == 6
+        assert [row[1] for row in spool.peek(10)] == [reading(i) for i in range(4, 10)]
+        assert spool.oldest_age() is not None
+        spool.close()
+
+
+def test_evicts_oldest_beyond_cap():
+    with tempfile.TemporaryDirectory() as directory:
+        max_mb = 0.05
+        spool = ReadingSpool(os.path.join(directory, 'spool.db'), max_mb=max_mb)
+        evicted = 0
+        for start in range(0, 2000, 100):
+            evicted += spool.append_many([reading(i) for i in range(start, start + 100)])
+
+        assert evicted > 0
+        assert spool.evicted == evicted
+        assert len(spool) == 2000 - evicted
+        assert spool._used_bytes() <= max_mb * 1024 * 1024
+        # The newest readings are the ones kept
+        rows = spool.peek(2000)
+        assert rows[-1][1] == reading(1999)
+        assert rows[0][1] == reading(evicted)
+        spool.close()
+
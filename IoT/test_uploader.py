@@ -0,0 +1,123 @@
+import json
+import math
+import os
+import queue
+import tempfile
+import time
+
+from spool import ReadingSpool
+from uploader import BatchSender, UploaderMetrics, enqueue_reading
+
+
+def reading(index, device_id='tank-1'):
+    return {'ph_value': 7.0, 'temperature': 25.0, 'status': 'SAFE', 'device_id': device_id,
+            'timestamp': f'2024-01-01T00:00:{index:02d}.000Z'}
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Records every posted body; answers with the given status codes, then 200"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.bodies = []
+
+    def post(self, url, data, headers, timeout):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            self.bodies.append(json.loads(data))
+            return FakeResponse(200, {'status': 'success', 'data': {}})
+        return FakeResponse(status, {'status': 'error', 'message': 'Not Found'})
+
+
+def make_sender(session, spool=None, **kwargs):
+    readings_queue = queue.Queue(100)
+    metrics = UploaderMetrics(readings_queue, spool)
+    return BatchSender(session, 'http://api/iot-data', readings_queue, metrics, batch_interval=0.05, timeout=1,
+                       retry_delay=0.01, spool=spool, **kwargs)
+
+
+def run_until_sent(sender, spool, timeout=5.0):
+    sender.start()
+    deadline = time.monotonic() + timeout
+    while len(spool) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sender.stop(timeout)
+
+
+def test_batch_payload_and_single_reading_payload():
+    assert make_sender(FakeSession()).payload([reading(0), reading(1)]) == {'readings': [reading(0), reading(1)]}
+    # One reading per request still tells devices and replayed readings apart
+    assert make_sender(FakeSession(), batch_size=1).payload([reading(0)]) == reading(0)
+    plain = {'ph_value': 7.0, 'temperature': 25.0, 'status': 'SAFE'}
+    assert make_sender(FakeSession(), batch_size=1).payload([plain]) == plain
+
+
+def test_non_finite_readings_are_dropped():
+    sender = make_sender(FakeSession())
+    body, count = sender.encode([reading(0), dict(reading(1), ph_value=math.nan), reading(2)])
+    assert count == 2
+    assert json.loads(body) == {'readings': [reading(0), reading(2)]}
+    assert sender.encode([dict(reading(0), temperature=math.inf)]) == (None, 0)
+    assert sender.metrics.snapshot()['readings_dropped'] == 2
+
+
+def test_full_queue_drops_oldest():
+    readings_queue = queue.Queue(2)
+    metrics = UploaderMetrics(readings_queue)
+    for index in range(3):
+        enqueue_reading(readings_queue, reading(index), metrics)
+    assert [readings_queue.get_nowait() for _ in range(2)] == [reading(1), reading(2)]
+    assert metrics.snapshot()['readings_dropped'] == 1
+
+
+def test_replay_keeps_readings_until_accepted():
+    with tempfile.TemporaryDirectory() as directory:
+        spool = ReadingSpool(os.path.join(directory, 'spool.db'))
+        spool.append_many([reading(i) for i in range(50)])
+        # A 404 (wrong URL, a proxy) is retried, never treated as rejected data
+        session = FakeSession([404, 404])
+        sender = make_sender(session, spool, batch_size=5, replay_batch_size=20, replay_rate=0)
+        run_until_sent(sender, spool)
+
+        assert [r for body in session.bodies for r in body['readings']] == [reading(i) for i in range(50)]
+        assert len(spool) == 0
+        snapshot = sender.metrics.snapshot()
+        assert snapshot['readings_dropped'] == 0
+        assert snapshot['send_errors'] == 2
+        spool.close()
+
+
+def test_replay_with_batch_size_one_keeps_device_and_timestamp():
+    with tempfile.TemporaryDirectory() as directory:
+        spool = ReadingSpool(os.path.join(directory, 'spool.db'))
+        backlog = [reading(i, device_id=f'tank-{i % 2}') for i in range(6)]
+        spool.append_many(backlog)
+        session = FakeSession()
+        sender = make_sender(session, spool, batch_size=1, replay_rate=0)
+        run_until_sent(sender, spool)
+
+        assert session.bodies == backlog
+        spool.close()
+
+
+def test_rejected_data_is_dropped():
+    with tempfile.TemporaryDirectory() as directory:
+        spool = ReadingSpool(os.path.join(directory, 'spool.db'))
+        spool.append_many([reading(i) for i in range(3)])
+        session = FakeSession([422])
+        sender = make_sender(session, spool, batch_size=5)
+        run_until_sent(sender, spool)
+
+        assert session.bodies == []
+        assert sender.metrics.snapshot()['readings_dropped'] == 3
+        spool.close()
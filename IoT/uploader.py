@@ -0,0 +1,419 @@
+"""
+Batched network sender for sensor readings.
+
+The serial readers only ever put readings on a bounded queue; this module's
+sender thread takes them off, groups them into batches (up to a size, or
+whatever arrived within a time window) and posts each batch in one request:
+
+    {"readings": [{"ph_value": 7.1, "temperature": 27.5, "status": "SAFE", "device_id": ..., "timestamp": ...}, ...]}
+
+A slow or unreachable server therefore only delays the sender - the readers
+keep draining the serial ports. If the queue fills up, the oldest queued
+reading is dropped to make room, and the drop is counted.
+
+With a spool (see spool.py) the sender first moves queued readings to disk
+and sends from there, deleting readings only once the server has accepted
+them. A backlog left by an outage or a restart is replayed in larger batches
+at a limited rate, so the server isn't hit with everything at once.
+"""
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Responses that reject the readings themselves: the batch is dropped instead of retried
+DATA_REJECTED_STATUSES = (400, 422)
+
+# Keys of the single-reading payload (batch_size 1)
+SINGLE_READING_KEYS = ('ph_value', 'temperature', 'status', 'device_id', 'timestamp', 'window')
+
+
+def reading_timestamp(epoch=None):
+    """UTC ISO-8601 timestamp for a reading (when it was read, not when it was sent); now by default"""
+    moment = datetime.now(timezone.utc) if epoch is None else datetime.fromtimestamp(epoch, timezone.utc)
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+class UploaderMetrics:
+    """Thread-safe counters for the readers and sender, plus the queue depth"""
+
+    def __init__(self, readings_queue, spool=None, aggregators=None):
+        self.readings_queue = readings_queue
+        self.spool = spool
+        self.aggregators = aggregators  # device ID -> EdgeAggregator, filled in as devices appear
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {
+            'readings_read': 0,
+            'readings_dropped': 0,
+            'readings_sent': 0,
+            'readings_replayed': 0,
+            'batches_sent': 0,
+            'send_errors': 0,
+            'device_reconnects': 0,
+        }
+        self.devices_connected = 0
+        self.last_send_seconds = None
+        self.last_success = None
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_send(self, seconds, count):
+        with self._lock:
+            self.counters['batches_sent'] += 1
+            self.counters['readings_sent'] += count
+            self.last_send_seconds = seconds
+            self.last_success = time.time()
+
+    def set_devices(self, count):
+        with self._lock:
+            self.devices_connected = count
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.counters)
+            data['last_send_seconds'] = self.last_send_seconds
+            data['last_success'] = self.last_success
+            data['devices_connected'] = self.devices_connected
+        if self.aggregators is not None:
+            data.update(dict.fromkeys(('readings_suppressed', 'heartbeats_sent', 'windows_closed'), 0))
+            for aggregator in list(self.aggregators.values()):
+                for name, value in aggregator.stats().items():
+                    data[name] += value
+        data['queue_depth'] = self.readings_queue.qsize()
+        data['queue_size'] = self.readings_queue.maxsize
+        if self.spool is not None:
+            data['spool_backlog'] = len(self.spool)
+            data['spool_bytes'] = self.spool.file_bytes()
+        data['uptime_seconds'] = round(time.time() - self.started, 1)
+        return data
+
+    def render(self):
+        """Prometheus text format"""
+        data = self.snapshot()
+        lines = []
+        for name in ('readings_read', 'readings_dropped', 'readings_sent', 'readings_replayed', 'batches_sent',
+                     'send_errors', 'device_reconnects'):
+            lines.append(f'# TYPE iot_{name}_total counter')
+            lines.append(f'iot_{name}_total {data[name]}')
+        if self.aggregators is not None:
+            for name in ('readings_suppressed', 'heartbeats_sent', 'windows_closed'):
+                lines.append(f'# TYPE iot_{name}_total counter')
+                lines.append(f'iot_{name}_total {data[name]}')
+        lines.append('# TYPE iot_devices_connected gauge')
+        lines.append(f'iot_devices_connected {data["devices_connected"]}')
+        lines.append('# TYPE iot_queue_depth gauge')
+        lines.append(f'iot_queue_depth {data["queue_depth"]}')
+        if self.spool is not None:
+            lines.append('# TYPE iot_spool_backlog gauge')
+            lines.append(f'iot_spool_backlog {data["spool_backlog"]}')
+            lines.append('# TYPE iot_spool_bytes gauge')
+            lines.append(f'iot_spool_bytes {data["spool_bytes"]}')
+        if data['last_send_seconds'] is not None:
+            lines.append('# TYPE iot_last_send_seconds gauge')
+            lines.append(f'iot_last_send_seconds {data["last_send_seconds"]:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """One-line status for the console"""
+        data = self.snapshot()
+        line = (f"devices {data['devices_connected']} | read {data['readings_read']} | sent {data['readings_sent']} in {data['batches_sent']} batches | "
+                f"queued {data['queue_depth']}/{data['queue_size']} | dropped {data['readings_dropped']} | "
+                f"send errors {data['send_errors']}")
+        if self.aggregators is not None:
+            line += f" | held back {data['readings_suppressed']}"
+        if self.spool is not None:
+            line += f" | spooled {data['spool_backlog']} ({data['spool_bytes'] / 1024:.0f} KB)"
+        return line
+
+
+def enqueue_reading(readings_queue, reading, metrics):
+    """
+    Put a reading on the queue without ever blocking; when the queue is full the
+    oldest reading is dropped (newer readings are worth more).
+    """
+    while True:
+        try:
+            readings_queue.put_nowait(reading)
+            return
+        except queue.Full:
+            try:
+                readings_queue.get_nowait()
+                metrics.inc('readings_dropped')
+            except queue.Empty:
+                pass
+
+
+class BatchSender(threading.Thread):
+    """
+    Sends queued readings to the API in batches.
+
+    Args:
+        session: requests.Session used for all posts
+        url: API endpoint (/api/iot-data)
+        readings_queue: Queue the serial reader fills
+        metrics: UploaderMetrics
+        batch_size: Most readings per request (1 sends the single-reading payload)
+        batch_interval: Seconds to wait for more readings after the first one of a batch
+        timeout: HTTP request timeout in seconds
+        retry_delay: First wait before retrying a failed batch (doubles up to max_retry_delay)
+        max_retry_delay: Longest wait between retries
+        spool: Optional ReadingSpool; readings are sent from it and deleted once acknowledged
+        replay_batch_size: Readings per request while replaying a spooled backlog
+        replay_rate: Most replay requests per second
+    """
+
+    def __init__(self, session, url, readings_queue, metrics, batch_size=20, batch_interval=2.0,
+                 timeout=10, retry_delay=1.0, max_retry_delay=30.0, spool=None, replay_batch_size=200,
+                 replay_rate=1.0):
+        super().__init__(name='batch-sender', daemon=True)
+        self.session = session
+        self.url = url
+        self.readings_queue = readings_queue
+        self.metrics = metrics
+        self.batch_size = max(1, int(batch_size))
+        self.batch_interval = float(batch_interval)
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.spool = spool
+        # An API that only takes single readings gets them one at a time during replay too
+        self.replay_batch_size = max(self.batch_size, int(replay_batch_size)) if self.batch_size > 1 else 1
+        self.replay_interval = 1.0 / replay_rate if replay_rate > 0 else 0.0
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout=None):
+        """Send what is still queued (one attempt) and stop; with a spool, unsent readings stay on disk"""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def collect_batch(self):
+        """Wait for a first reading, then gather more until the batch is full or the interval ends"""
+        try:
+            batch = [self.readings_queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            try:
+                if self._stop_event.is_set():
+                    # Shutting down: take what is already queued without waiting for more
+                    batch.append(self.readings_queue.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                batch.append(self.readings_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def payload(self, batch):
+        if self.batch_size == 1:
+            # Single-reading format understood by every version of the API; older versions ignore
+            # the optional keys, newer ones need them to tell devices and replayed readings apart
+            reading = batch[0]
+            return {key: reading[key] for key in SINGLE_READING_KEYS if key in reading}
+        return {'readings': batch}
+
+    def encode(self, batch):
+        """
+        JSON body for a batch and the readings in it. Readings that can't be sent as JSON
+        (NaN or infinite values) are left out and counted as dropped; (None, 0) if none is left.
+        """
+        try:
+            return json.dumps(self.payload(batch), allow_nan=False), len(batch)
+        except ValueError:
+            pass
+        valid = []
+        for reading in batch:
+            try:
+                json.dumps(reading, allow_nan=False)
+                valid.append(reading)
+            except ValueError:
+                pass
+        print(f"⚠️  Dropping {len(batch) - len(valid)} reading(s) with NaN/infinite values")
+        self.metrics.inc('readings_dropped', len(batch) - len(valid))
+        if not valid:
+            return None, 0
+        return json.dumps(self.payload(valid), allow_nan=False), len(valid)
+
+    def post(self, batch):
+        """Post one batch; returns True when it is done with (accepted, or rejected as invalid data with 400/422)"""
+        body, count = self.encode(batch)
+        if body is None:
+            return True
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.url, data=body, headers={'Content-Type': 'application/json'},
+                                         timeout=self.timeout)
+        except requests.exceptions.ConnectionError:
+            print(f"❌ Connection Error: Cannot reach server at {self.url}")
+            self.metrics.inc('send_errors')
+            return False
+        except requests.exceptions.Timeout:
+            print(f"❌ Timeout: Server took too long to respond ({self.timeout}s timeout)")
+            self.metrics.inc('send_errors')
+            return False
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Network Error: {e}")
+            self.metrics.inc('send_errors')
+            return False
+
+        if response.status_code == 200:
+            try:
+                result = response.json()
+            except ValueError:
+                result = {}
+            # The API skips invalid readings and accepts the rest of the batch
+            data = result.get('data') if isinstance(result.get('data'), dict) else {}
+            rejected = min(int(data.get('rejected') or 0), count)
+            self.metrics.record_send(time.monotonic() - start, count - rejected)
+            if rejected:
+                print(f"⚠️  Server skipped {rejected} invalid reading(s)")
+                self.metrics.inc('readings_dropped', rejected)
+            if result.get('status') == 'success':
+                print(f"✅ Uploaded {count - rejected} reading(s) in {time.monotonic() - start:.2f}s")
+            else:
+                print(f"⚠️  Server response: {result.get('message', 'Unknown response')}")
+            return True
+
+        print(f"⚠️  Server returned status code {response.status_code}")
+        try:
+            print(f"   Error: {response.json().get('message', response.text)}")
+        except ValueError:
+            print(f"   Response: {response.text}")
+        self.metrics.inc('send_errors')
+        # Only an explicit rejection of the data is final; anything else (a wrong URL, auth or
+        # proxy errors, a batch too large) is retried so spooled readings are never deleted for it
+        if response.status_code in DATA_REJECTED_STATUSES:
+            self.metrics.inc('readings_dropped', count)
+            return True
+        return False
+
+    def spool_queued(self, timeout):
+        """Move queued readings to the spool, waiting up to timeout seconds for the first one"""
+        try:
+            readings = [self.readings_queue.get(timeout=timeout) if timeout > 0 else self.readings_queue.get_nowait()]
+        except queue.Empty:
+            return 0
+        while True:
+            try:
+                readings.append(self.readings_queue.get_nowait())
+            except queue.Empty:
+                break
+        evicted = self.spool.append_many(readings)
+        if evicted:
+            self.metrics.inc('readings_dropped', evicted)
+        return len(readings)
+
+    def run(self):
+        if self.spool is not None:
+            self.run_spooled()
+        else:
+            self.run_queued()
+
+    def run_spooled(self):
+        delay = self.retry_delay
+        next_replay = 0.0
+        replaying = False
+        while True:
+            stopping = self._stop_event.is_set()
+            # Only block waiting for readings when there is nothing to send
+            self.spool_queued(0.5 if not (stopping or len(self.spool)) else 0)
+            backlog = len(self.spool)
+            if not backlog:
+                if stopping:
+                    return
+                continue
+
+            if backlog > self.batch_size:
+                # Backlog from an outage or an earlier run: bulk batches, rate limited
+                if not replaying:
+                    print(f"🔁 Replaying {backlog} spooled reading(s)...")
+                    replaying = True
+                limit = self.replay_batch_size
+                wait = next_replay - time.monotonic()
+                if wait > 0 and not stopping:
+                    self.spool_queued(wait)
+                    continue
+            else:
+                if replaying:
+                    print("🔁 Backlog replayed")
+                    replaying = False
+                limit = self.batch_size
+                # Wait for a full batch, or until the oldest reading has waited batch_interval
+                age = self.spool.oldest_age() or 0.0
+                if backlog < self.batch_size and age < self.batch_interval and not stopping:
+                    self.spool_queued(self.batch_interval - age)
+                    continue
+
+            rows = self.spool.peek(limit)
+            if self.post([reading for _, reading in rows]):
+                self.spool.ack(rows[-1][0])
+                delay = self.retry_delay
+                if replaying:
+                    self.metrics.inc('readings_replayed', len(rows))
+                    next_replay = time.monotonic() + self.replay_interval
+            elif not stopping:
+                # Everything stays spooled; keep moving new readings to disk while waiting
+                deadline = time.monotonic() + delay
+                while not self._stop_event.is_set() and time.monotonic() < deadline:
+                    self.spool_queued(deadline - time.monotonic())
+                delay = min(delay * 2, self.max_retry_delay)
+            if stopping:
+                self.spool_queued(0)
+                if len(self.spool):
+                    print(f"💾 {len(self.spool)} unsent reading(s) kept in the spool for the next start")
+                return
+
+    def run_queued(self):
+        delay = self.retry_delay
+        batch = []
+        while True:
+            if not batch:
+                if self._stop_event.is_set() and self.readings_queue.empty():
+                    return
+                batch = self.collect_batch()
+                if not batch:
+                    continue
+            if self.post(batch):
+                batch = []
+                delay = self.retry_delay
+            elif self._stop_event.is_set():
+                print(f"⚠️  Exiting with {len(batch) + self.readings_queue.qsize()} unsent reading(s)")
+                return
+            else:
+                # Keep the batch and retry; new readings keep queueing meanwhile
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+
+def start_metrics_server(port, metrics):
+    """Serve metrics.render() on http://0.0.0.0:<port>/metrics from a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep the console for sensor output
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
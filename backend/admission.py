@@ -0,0 +1,125 @@
+"""
+Admission control for inference requests
+
+Under a spike, every extra request the server accepts only makes the wait
+longer for all of them, and clients (like the Next.js route with its 10s
+timeout) give up and fall back long before the backlog clears. This module
+bounds how many requests may be pending at once - beyond that they are
+turned away immediately with a Retry-After estimate - and carries client
+deadlines so work for requests nobody is waiting for anymore is dropped
+before it reaches sess.run.
+"""
+
+import math
+import threading
+import time
+
+# Request headers carrying the client's deadline
+TIMEOUT_HEADER = 'X-Request-Timeout-Ms'  # Relative budget in milliseconds, counted from arrival
+DEADLINE_HEADER = 'X-Request-Deadline'  # Absolute Unix time in milliseconds
+
+# Bounds for the Retry-After estimate (seconds)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+
+class QueueFullError(RuntimeError):
+    """The inference queue is at capacity"""
+
+
+class DeadlineExceededError(RuntimeError):
+    """The client's deadline passed before the request could be served"""
+
+
+def parse_deadline(headers, default_timeout_ms=0, now=None):
+    """
+    Monotonic deadline for a request from its headers, or None if it has none.
+    The relative timeout header wins over the absolute one (no clock skew involved).
+    """
+    now = time.monotonic() if now is None else now
+    timeout_ms = headers.get(TIMEOUT_HEADER)
+    if timeout_ms:
+        try:
+            return now + max(0.0, float(timeout_ms)) / 1000.0
+        except ValueError:
+            pass
+    deadline_ms = headers.get(DEADLINE_HEADER)
+    if deadline_ms:
+        try:
+            return now + (float(deadline_ms) / 1000.0 - time.time())
+        except ValueError:
+            pass
+    if default_timeout_ms > 0:
+        return now + default_timeout_ms / 1000.0
+    return None
+
+
+def deadline_expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class AdmissionController:
+    """
+    Thread-safe cap on requests pending inference.
+
+    Args:
+        max_pending: Requests allowed in the server at once (being decoded, queued or run)
+    """
+
+    def __init__(self, max_pending=64):
+        self.max_pending = max(1, int(max_pending))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._service_time = None  # EWMA of admitted request latency in seconds
+        self._admitted = 0
+        self._rejected = 0
+        self._dropped = 0
+
+    def try_acquire(self):
+        """Admit a request if there is room; returns False if it must be rejected"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                return False
+            self._pending += 1
+            self._admitted += 1
+            return True
+
+    def release(self, service_seconds=None):
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+            if service_seconds is not None:
+                if self._service_time is None:
+                    self._service_time = service_seconds
+                else:
+                    self._service_time = 0.8 * self._service_time + 0.2 * service_seconds
+
+    def record_dropped(self):
+        """Count a request dropped because its deadline passed"""
+        with self._lock:
+            self._dropped += 1
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def retry_after(self):
+        """
+        Seconds before a retry is likely to be admitted: requests pending now
+        should have finished within about one (recent, loaded) request latency.
+        """
+        with self._lock:
+            service_time = self._service_time or 1.0
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(service_time))))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'admitted': self._admitted,
+                'rejected_queue_full': self._rejected,
+                'dropped_deadline': self._dropped,
+                'average_service_ms': round(self._service_time * 1000, 2) if self._service_time else None
+            }
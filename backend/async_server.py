@@ -0,0 +1,239 @@
+"""
+Async serving mode (SERVER_MODE=async)
+
+Runs the Flask app on an asyncio HTTP server (uvicorn) instead of the
+thread-per-connection development server. Connections, keep-alive and
+request bodies are handled on the event loop, so idle or slow clients cost
+a socket and a coroutine rather than an OS thread. Only a request whose
+body has fully arrived is handed to a fixed-size thread pool, where the
+Flask handler does the CPU-bound decode and inference (or waits on the
+batch scheduler / worker processes).
+
+Endpoints that consume their body incrementally (tar batches, chunked frame
+streams) get a body stream that is fed from the event loop while the
+handler runs instead of a buffered one.
+
+On SIGINT/SIGTERM the server stops accepting connections, lets in-flight
+requests finish (up to the grace period) and then runs the shutdown hook.
+"""
+
+import asyncio
+import io
+import logging
+import signal
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Buffered request bodies larger than this spill to a temporary file
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+class _Disconnected(Exception):
+    """The client disconnected while its request body was being read"""
+
+
+class _StreamingInput(io.RawIOBase):
+    """Request body read from the event loop on demand (used from a worker thread)"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                break
+            self._buffer = message.get('body', b'')
+            self._more = message.get('more_body', False)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class WSGIAdapter:
+    """
+    ASGI application wrapping a WSGI app.
+
+    Args:
+        wsgi_app: The WSGI application (Flask app)
+        executor: Pool the WSGI app runs in
+        max_body_size: Largest buffered request body in bytes (larger gets 413; 0 = unlimited)
+        stream_body: Optional callable (method, path) -> bool for requests whose body
+            is streamed to the handler instead of buffered
+    """
+
+    def __init__(self, wsgi_app, executor, max_body_size=0, stream_body=None):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+        self.max_body_size = max_body_size
+        self.stream_body = stream_body
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        loop = asyncio.get_running_loop()
+
+        if self.stream_body is not None and self.stream_body(scope['method'], scope['path']):
+            body = io.BufferedReader(_StreamingInput(receive, loop))
+        else:
+            try:
+                body = await self._read_body(receive)
+            except _Disconnected:
+                return  # Client went away before sending its body - nothing to run
+            if body is None:
+                await self._send_error(send, 413, b'Request body too large')
+                return
+
+        environ = self._environ(scope, body)
+        try:
+            await loop.run_in_executor(self.executor, self._run_wsgi, environ, send, loop)
+        finally:
+            body.close()
+
+    async def _read_body(self, receive):
+        """Read the whole body on the event loop; None if it exceeds max_body_size"""
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise _Disconnected()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if self.max_body_size and size > self.max_body_size:
+                body.close()
+                return None
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    @staticmethod
+    async def _send_error(send, status, message):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(message)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': message})
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] if server[1] is not None else 80),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,  # The body stream ends at the end of the request
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = name
+            else:
+                key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run_wsgi(self, environ, send, loop):
+        """Run the WSGI app in a worker thread, sending the response through the event loop"""
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None  # Legacy write() callable, unused by Flask
+
+        def start():
+            if not response.get('started'):
+                response['started'] = True
+                send_message({'type': 'http.response.start', 'status': response['status'],
+                              'headers': response['headers']})
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        start()
+                        send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            start()
+            send_message({'type': 'http.response.body', 'body': b''})
+        except Exception:
+            logger.exception('Unhandled error in request handler')
+            if not response.get('started'):
+                response.update(status=500, headers=[(b'content-type', b'text/plain')])
+                start()
+                send_message({'type': 'http.response.body', 'body': b'Internal Server Error'})
+
+
+def serve(wsgi_app, host, port, worker_threads=32, max_connections=2048, keep_alive=75,
+          graceful_timeout=30, max_body_size=0, stream_body=None, on_shutdown=None):
+    """
+    Serve a WSGI app on uvicorn until SIGINT/SIGTERM, then drain in-flight requests
+    (up to graceful_timeout seconds) and call on_shutdown.
+    Connections beyond max_connections are answered with 503.
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError('SERVER_MODE=async requires uvicorn (pip install uvicorn)')
+
+    executor = ThreadPoolExecutor(max(1, worker_threads), thread_name_prefix='http-worker')
+    config = uvicorn.Config(
+        WSGIAdapter(wsgi_app, executor, max_body_size, stream_body),
+        host=host,
+        port=port,
+        lifespan='off',
+        limit_concurrency=max_connections or None,
+        timeout_keep_alive=keep_alive,
+        timeout_graceful_shutdown=graceful_timeout or None,
+        access_log=False,
+        log_config=None
+    )
+    # uvicorn re-raises the signal that stopped it once it has drained; turn SIGTERM
+    # into SystemExit (like SIGINT's KeyboardInterrupt) so the shutdown below still runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        uvicorn.Server(config).run()
+    finally:
+        logger.info('Server stopped, waiting for request handlers to finish...')
+        executor.shutdown(wait=True)
+        if on_shutdown is not None:
+            on_shutdown()
@@ -0,0 +1,241 @@
+"""
+Dynamic micro-batching for the fish detection server
+
+Collects /detect requests that arrive within a short window (or until a
+maximum batch size is reached) and runs them through the model as a single
+[N, H, W, 3] feed. Each caller gets back its own slice of the outputs with
+the same [1, ...] shapes a single-image sess.run would produce.
+
+Images can only be stacked when they share the same height and width (and
+are meant for the same model), so each collected batch is grouped by key
+and shape before it is fed to the model.
+
+The queue can be bounded, and requests carry an optional deadline: a request
+whose deadline has passed by the time its batch is formed is failed instead
+of being run.
+"""
+
+import threading
+import queue
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from admission import QueueFullError, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Background scheduler that groups single-image inference requests into batches.
+
+    Args:
+        infer_fn: Callable taking a list of N same-shape [H, W, 3] uint8 images and the key they
+                  were submitted with, returning (boxes, scores, classes, num_detections) with a leading N axis
+        max_batch_size: Maximum number of images per sess.run
+        max_latency_ms: How long to wait for more requests after the first one arrives
+        max_concurrent_batches: Batches allowed to run at once (e.g. one per inference worker)
+        max_queue_size: Requests allowed to wait for a batch (0 = unbounded)
+    """
+
+    def __init__(self, infer_fn, max_batch_size=8, max_latency_ms=10, max_concurrent_batches=1,
+                 max_queue_size=0):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        self.max_queue_size = max(0, int(max_queue_size))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # While every slot is busy, new requests keep queueing up and form larger batches
+        self._slots = threading.Semaphore(self.max_concurrent_batches)
+        self._executor = None
+
+        # Batch size statistics (reported on /model/info)
+        self._batch_size_counts = {}
+        self._batches_run = 0
+        self._images_run = 0
+        self._rejected = 0
+        self._expired = 0
+
+    def start(self):
+        """Start the scheduler thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.max_concurrent_batches > 1 and self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_concurrent_batches, thread_name_prefix='batch-runner')
+            self._thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+            self._thread.start()
+            logger.info(f'Batch scheduler started (max batch: {self.max_batch_size}, '
+                        f'window: {self.max_latency * 1000:.1f}ms)')
+
+    def stop(self):
+        """Stop the scheduler thread after the current batch finishes"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def submit(self, image_np, timeout=None, deadline=None, key=None):
+        """
+        Queue a single [H, W, 3] image and block until its batch has run.
+        Only images with the same key (e.g. the model they are routed to) share a batch.
+        Returns (boxes, scores, classes, num_detections), each with a leading axis of 1.
+
+        Raises QueueFullError if the queue is at capacity, and DeadlineExceededError
+        if the monotonic deadline passes before the image's batch is formed.
+        """
+        self.start()
+        if self.max_queue_size and self._queue.qsize() >= self.max_queue_size:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError('Inference queue is full')
+        future = Future()
+        self._queue.put((image_np, future, deadline, key))
+        return future.result(timeout=timeout)
+
+    def submit_many(self, images, timeout=None, deadline=None, key=None):
+        """
+        Queue several same-shape [H, W, 3] images at once (e.g. the tiles of one image) and block
+        until all of them have run. They may share batches with each other and with other requests.
+        Returns (boxes, scores, classes, num_detections), each with a leading axis of len(images).
+
+        Raises like submit: QueueFullError if the queue is at capacity (checked once, for all
+        the images), DeadlineExceededError if the deadline passes before they have all run.
+        """
+        self.start()
+        if self.max_queue_size and self._queue.qsize() >= self.max_queue_size:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError('Inference queue is full')
+        futures = []
+        for image_np in images:
+            future = Future()
+            self._queue.put((image_np, future, deadline, key))
+            futures.append(future)
+        outputs = [future.result(timeout=timeout) for future in futures]
+        return tuple(np.concatenate(parts) for parts in zip(*outputs))
+
+    def queue_depth(self):
+        """Number of requests waiting to be picked up by the scheduler"""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Achieved batch sizes since startup"""
+        with self._lock:
+            batches = self._batches_run
+            images = self._images_run
+            counts = dict(sorted(self._batch_size_counts.items()))
+            rejected = self._rejected
+            expired = self._expired
+        return {
+            'enabled': True,
+            'max_batch_size': self.max_batch_size,
+            'max_latency_ms': round(self.max_latency * 1000, 2),
+            'max_concurrent_batches': self.max_concurrent_batches,
+            'batches_run': batches,
+            'images_run': images,
+            'average_batch_size': round(images / batches, 2) if batches else 0.0,
+            'batch_size_counts': {str(size): count for size, count in counts.items()},
+            'queue_depth': self.queue_depth(),
+            'max_queue_size': self.max_queue_size,
+            'rejected_queue_full': rejected,
+            'dropped_deadline': expired
+        }
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes or the batch is full"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown requested - finish this batch first
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            # Wait for a free slot before collecting, so batches grow while all slots are busy
+            self._slots.acquire()
+            batch = self._collect()
+            if batch is None:
+                self._slots.release()
+                return
+
+            # Only images with identical shapes can be stacked into one tensor
+            # Requests whose client has already given up never reach the model
+            groups = {}
+            now = time.monotonic()
+            for image_np, future, deadline, key in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and now >= deadline:
+                    with self._lock:
+                        self._expired += 1
+                    future.set_exception(DeadlineExceededError('Request deadline passed while queued'))
+                    continue
+                groups.setdefault((key, image_np.shape), []).append((image_np, future))
+
+            if not groups:
+                self._slots.release()
+                continue
+
+            for i, ((key, _), items) in enumerate(groups.items()):
+                if i > 0:
+                    self._slots.acquire()
+                if self._executor is not None:
+                    self._executor.submit(self._run_group, items, key)
+                else:
+                    self._run_group(items, key)
+
+    def _run_group(self, items, key):
+        try:
+            self._run_stacked(items, key)
+        finally:
+            self._slots.release()
+
+    def _run_stacked(self, items, key):
+        try:
+            # Stacking is left to infer_fn, which can reuse its own input buffers
+            boxes, scores, classes, num_detections = self.infer_fn([image_np for image_np, _ in items], key)
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            size = len(items)
+            self._batches_run += 1
+            self._images_run += size
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+
+        for i, (_, future) in enumerate(items):
+            future.set_result((
+                boxes[i:i + 1],
+                scores[i:i + 1],
+                classes[i:i + 1],
+                num_detections[i:i + 1]
+            ))
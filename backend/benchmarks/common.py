@@ -0,0 +1,129 @@
+"""
+Shared helpers for the detection server benchmarks
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_STUB_MODEL = os.path.join(BENCHMARK_DIR, 'stub_model', 'frozen_inference_graph.pb')
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+# Make start_server and its sibling modules importable when run as a script
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values, pct):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize_ms(samples_ms):
+    """Latency summary (milliseconds) for a list of samples"""
+    values = sorted(samples_ms)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'min_ms': round(values[0], 3),
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3)
+    }
+
+
+def environment_info():
+    """Versions and host details recorded with every result file"""
+    info = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+    try:
+        import numpy
+        info['numpy'] = numpy.__version__
+    except ImportError:
+        pass
+    try:
+        import PIL
+        info['pillow'] = PIL.__version__
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        info['tensorflow'] = tf.__version__
+    except ImportError:
+        pass
+    try:
+        info['git_commit'] = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def write_results(path, results):
+    """Write results as stable, diff-friendly JSON"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'Results written to {path}')
+
+
+def ensure_stub_model(path=DEFAULT_STUB_MODEL):
+    """Generate the stub model if it doesn't exist yet; returns its path"""
+    if not os.path.exists(path):
+        from make_stub_model import build_stub_model
+        build_stub_model(path)
+    return path
+
+
+def make_test_jpeg(width, height, seed=0, quality=90, fish=3):
+    """
+    Synthetic photo-like JPEG (smooth gradients, a few dark fish-shaped ellipses
+    and noise) for repeatable benchmarks. The seed places the fish, so different
+    seeds are different scenes rather than the same frame with other noise.
+    """
+    import io
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    base = np.stack([np.broadcast_to(y, (height, width)),
+                     np.broadcast_to(x, (height, width)),
+                     np.broadcast_to((x + y) / 2, (height, width))], axis=-1)
+
+    rows = np.arange(height, dtype=np.float32)[:, None]
+    cols = np.arange(width, dtype=np.float32)[None, :]
+    for _ in range(fish):
+        half_length = rng.uniform(0.05, 0.15) * min(width, height)
+        cy = rng.uniform(half_length, height - half_length)
+        cx = rng.uniform(half_length, width - half_length)
+        inside = ((cols - cx) / half_length) ** 2 + ((rows - cy) / (half_length * 0.4)) ** 2 <= 1.0
+        base[inside] = rng.uniform(10, 60, size=3).astype(np.float32)
+
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,178 @@
+"""
+End-to-end load generator for /detect
+
+Sends requests at a fixed concurrency and (optionally) a target request rate,
+then reports p50/p95/p99 latency and throughput. Without --url it starts the
+server in-process on a free port with the stub model, so it runs offline.
+
+Usage:
+    python benchmarks/loadtest.py --concurrency 8 --duration 30
+    python benchmarks/loadtest.py --url http://localhost:5000 --rate 20 --mode json
+"""
+
+import argparse
+import base64
+import json
+import os
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from common import (DEFAULT_RESULTS_DIR, ensure_stub_model, environment_info, make_test_jpeg,
+                    summarize_ms, write_results)
+
+
+def build_request(image_bytes, mode, nonce=None):
+    """
+    Request body and headers for the chosen upload mode
+    A nonce appended after the JPEG end marker makes every upload unique (decoders
+    ignore trailing bytes), so the server's result cache can't answer the request.
+    """
+    if nonce is not None:
+        image_bytes = image_bytes + struct.pack('>Q', nonce)
+    if mode == 'json':
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(image_bytes).decode()
+        return json.dumps({'imageData': data_url}).encode(), {'Content-Type': 'application/json'}
+    return image_bytes, {'Content-Type': 'image/jpeg'}
+
+
+def start_local_server(model_path):
+    """Start start_server.app in a background thread; returns (base_url, server)"""
+    from werkzeug.serving import make_server
+
+    os.environ['MODEL_PATH'] = model_path
+    os.environ.setdefault('ENABLE_RESULT_CACHE', 'false')
+    import start_server
+
+    if not start_server.load_model():
+        raise SystemExit(f'Could not load model: {model_path}')
+    server = make_server('127.0.0.1', 0, start_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def run_load(url, image_bytes, mode, concurrency, duration, rate, timeout, unique=True):
+    """
+    Closed-loop load with `concurrency` workers; with rate > 0 sends are paced to
+    a fixed schedule (open-loop arrivals, latency measured from the scheduled time).
+    """
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    errors = []
+    next_index = [0]
+    start = time.perf_counter()
+    stop_at = start + duration
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            scheduled = start + index / rate if rate > 0 else time.perf_counter()
+            if scheduled >= stop_at:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            body, headers = build_request(image_bytes, mode, index if unique else None)
+            request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+            sent = scheduled if rate > 0 else time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception as e:
+                status = 'error'
+                with lock:
+                    errors.append(str(e))
+            elapsed_ms = (time.perf_counter() - sent) * 1000
+            with lock:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 200:
+                    latencies.append(elapsed_ms)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    wall_time = time.perf_counter() - start
+    completed = sum(statuses.values())
+    return {
+        'requests': completed,
+        'succeeded': len(latencies),
+        'status_codes': dict(sorted(statuses.items())),
+        'errors': errors[:10],
+        'wall_time_s': round(wall_time, 3),
+        'throughput_rps': round(len(latencies) / wall_time, 3) if wall_time > 0 else 0.0,
+        'latency': summarize_ms(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the fish detection server')
+    parser.add_argument('--url', default=None, help='Server base URL (default: start one in-process with the stub model)')
+    parser.add_argument('--model', default=None, help='Model for the in-process server (default: stub model)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client workers')
+    parser.add_argument('--rate', type=float, default=0.0, help='Target requests per second (0 = as fast as possible)')
+    parser.add_argument('--duration', type=float, default=20.0, help='Test duration in seconds')
+    parser.add_argument('--mode', choices=('raw', 'json'), default='raw', help='Upload as raw JPEG body or base64 JSON')
+    parser.add_argument('--image', default=None, help='JPEG to upload (default: synthetic 1280x960 image)')
+    parser.add_argument('--allow-cache', action='store_true',
+                        help='Send identical uploads so the server result cache can answer them')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--output', default=os.path.join(DEFAULT_RESULTS_DIR, 'loadtest.json'))
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        base_url, server = start_local_server(args.model or ensure_stub_model())
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = make_test_jpeg(1280, 960, seed=3)
+
+    print(f'Load testing {base_url}/detect: concurrency {args.concurrency}, '
+          f'rate {args.rate or "unlimited"}, {args.duration}s, {args.mode} uploads')
+
+    try:
+        load = run_load(base_url + '/detect', image_bytes, args.mode, args.concurrency, args.duration,
+                        args.rate, args.timeout, unique=not args.allow_cache)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    latency = load['latency']
+    print(f'Requests: {load["requests"]} ({load["succeeded"]} ok), throughput {load["throughput_rps"]} req/s')
+    if latency['count']:
+        print(f'Latency p50 {latency["p50_ms"]}ms  p95 {latency["p95_ms"]}ms  p99 {latency["p99_ms"]}ms')
+
+    write_results(args.output, {
+        'benchmark': 'loadtest',
+        'environment': environment_info(),
+        'config': {
+            'target': 'in-process stub server' if server is not None else base_url,
+            'concurrency': args.concurrency,
+            'rate': args.rate,
+            'duration_s': args.duration,
+            'mode': args.mode,
+            'unique_uploads': not args.allow_cache,
+            'image_bytes': len(image_bytes)
+        },
+        'results': load
+    })
+
+
+if __name__ == '__main__':
+    main()
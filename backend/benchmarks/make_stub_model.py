@@ -0,0 +1,65 @@
+"""
+Generate a tiny frozen inference graph for offline benchmarking
+
+The graph has the same interface as the real Faster R-CNN Inception V2 export
+(image_tensor -> detection_boxes / detection_scores / detection_classes /
+num_detections), so start_server.py can load it via MODEL_PATH. A small
+strided convolution gives it real per-pixel work, and its 100 output boxes
+are clustered so NMS has overlaps to resolve.
+
+Usage: python benchmarks/make_stub_model.py [--output PATH]
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from common import DEFAULT_STUB_MODEL
+
+MAX_DETECTIONS = 100
+
+
+def build_stub_model(output_path=DEFAULT_STUB_MODEL, seed=0):
+    """Build the stub graph and write it as a frozen GraphDef"""
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+
+    # Clustered boxes: 20 fish with 5 overlapping candidates each
+    centers = rng.uniform(0.15, 0.85, size=(MAX_DETECTIONS // 5, 2)).repeat(5, axis=0)
+    centers += rng.normal(0, 0.01, size=centers.shape)
+    sizes = rng.uniform(0.08, 0.25, size=(MAX_DETECTIONS // 5, 2)).repeat(5, axis=0)
+    boxes = np.clip(np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1), 0, 1).astype(np.float32)
+    logits = np.sort(rng.normal(0.0, 2.0, size=MAX_DETECTIONS))[::-1].astype(np.float32)
+    kernel = rng.normal(0, 0.1, size=(3, 3, 3, 16)).astype(np.float32)
+
+    graph = tf.compat.v1.Graph()
+    with graph.as_default():
+        image_tensor = tf.compat.v1.placeholder(tf.uint8, [None, None, None, 3], name='image_tensor')
+        batch = tf.shape(image_tensor)[0]
+
+        # A little real compute, proportional to the input size
+        features = tf.nn.conv2d(tf.cast(image_tensor, tf.float32) / 255.0, tf.constant(kernel),
+                                strides=[1, 2, 2, 1], padding='SAME')
+        activation = tf.reduce_mean(tf.nn.relu(features), axis=[1, 2, 3])  # [N]
+
+        # Scores shift slightly with image content so different inputs give different outputs
+        scores = tf.sigmoid(tf.constant(logits)[None, :] + activation[:, None])
+        tf.identity(tf.tile(tf.constant(boxes)[None], [batch, 1, 1]), name='detection_boxes')
+        tf.identity(scores, name='detection_scores')
+        tf.identity(tf.ones_like(scores), name='detection_classes')
+        tf.identity(tf.fill([batch], float(MAX_DETECTIONS)), name='num_detections')
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'wb') as f:
+        f.write(graph.as_graph_def().SerializeToString())
+    print(f'Stub model written to {output_path}')
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a stub detection model for benchmarks')
+    parser.add_argument('--output', default=DEFAULT_STUB_MODEL, help='Where to write the frozen graph')
+    args = parser.parse_args()
+    build_stub_model(args.output)
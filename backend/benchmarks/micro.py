@@ -0,0 +1,133 @@
+"""
+Micro-benchmarks for the detection pipeline stages
+
+Times preprocess_image, post-processing/apply_nms and run_inference in
+isolation. Runs offline against the stub model unless --model is given.
+
+Usage: python benchmarks/micro.py [--model PATH] [--iterations N] [--output PATH]
+"""
+
+import argparse
+import io
+import os
+import time
+
+from common import (DEFAULT_RESULTS_DIR, ensure_stub_model, environment_info, make_test_jpeg,
+                    summarize_ms, write_results)
+
+
+def time_calls(fn, iterations, warmup=3):
+    """Call fn repeatedly and return a latency summary in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize_ms(samples)
+
+
+def bench_preprocess(server, iterations):
+    from PIL import Image
+
+    png = io.BytesIO()
+    Image.open(io.BytesIO(make_test_jpeg(1280, 960, seed=2))).convert('RGBA').save(png, 'PNG')
+    inputs = {
+        'jpeg_4032x3024': make_test_jpeg(4032, 3024, seed=1),
+        'jpeg_1280x960': make_test_jpeg(1280, 960, seed=2),
+        'png_rgba_1280x960': png.getvalue()
+    }
+    return {
+        name: time_calls(lambda data=data: server.preprocess_image(data), iterations)
+        for name, data in inputs.items()
+    }
+
+
+def bench_postprocess(server, iterations):
+    import numpy as np
+    from postprocess import apply_nms
+
+    results = {}
+    rng = np.random.default_rng(0)
+    for count in (100, 300, 1000):
+        centers = rng.uniform(0.1, 0.9, size=(count, 2))
+        sizes = rng.uniform(0.05, 0.2, size=(count, 2))
+        boxes = np.clip(np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1), 0, 1).astype(np.float32)
+        scores = rng.uniform(0.0, 1.0, size=count).astype(np.float32)
+        classes = np.ones(count, dtype=np.float32)
+        detections = [
+            {'bbox': [float(v) for v in boxes[i]], 'score': float(scores[i]), 'class': 1}
+            for i in range(count)
+        ]
+
+        results[f'apply_nms_{count}'] = time_calls(
+            lambda d=detections: apply_nms(d, server.NMS_THRESHOLD), iterations)
+        results[f'postprocess_{count}'] = time_calls(
+            lambda b=boxes[None], s=scores[None], c=classes[None], n=np.array([count], np.float32):
+                server.postprocess_detections(b, s, c, n, 640, 480, server.CONFIDENCE_THRESHOLD,
+                                              server.NMS_THRESHOLD),
+            iterations)
+    return results
+
+
+def bench_inference(server, iterations):
+    import numpy as np
+
+    results = {}
+    for width, height in ((640, 480), (1280, 960)):
+        image_np = np.zeros((height, width, 3), dtype=np.uint8)
+        results[f'run_inference_{width}x{height}'] = time_calls(
+            lambda image=image_np: server.run_inference(image), iterations)
+
+    batch = np.zeros((4, 480, 640, 3), dtype=np.uint8)
+    results['run_inference_batch_4x640x480'] = time_calls(
+        lambda: server.run_inference_batch(batch), iterations)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the fish detection server')
+    parser.add_argument('--model', default=None, help='Frozen graph to benchmark (default: generated stub model)')
+    parser.add_argument('--iterations', type=int, default=30, help='Timed iterations per benchmark')
+    parser.add_argument('--output', default=os.path.join(DEFAULT_RESULTS_DIR, 'micro.json'))
+    args = parser.parse_args()
+
+    model_path = args.model or ensure_stub_model()
+
+    # Configure the server before importing it; measure single calls without batching or caching
+    os.environ['MODEL_PATH'] = model_path
+    os.environ['ENABLE_BATCHING'] = 'false'
+    os.environ['ENABLE_RESULT_CACHE'] = 'false'
+    os.environ.setdefault('INFERENCE_WORKERS', '0')
+    import start_server as server
+
+    if not server.load_model():
+        raise SystemExit(f'Could not load model: {model_path}')
+
+    results = {
+        'benchmark': 'micro',
+        'environment': environment_info(),
+        'config': {
+            'model': os.path.basename(model_path),
+            'stub_model': args.model is None,
+            'iterations': args.iterations,
+            'processing_resolution': server.TARGET_IMAGE_SIZE,
+            'resize_filter': server.RESIZE_FILTER_NAME,
+            'threads': server.THREADS_PER_WORKER
+        },
+        'preprocess_image': bench_preprocess(server, args.iterations),
+        'postprocess': bench_postprocess(server, args.iterations),
+        'inference': bench_inference(server, args.iterations)
+    }
+
+    for section in ('preprocess_image', 'postprocess', 'inference'):
+        print(f'\n{section}:')
+        for name, stats in results[section].items():
+            print(f'  {name:32s} p50 {stats["p50_ms"]:9.3f}ms   p95 {stats["p95_ms"]:9.3f}ms')
+
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+Accuracy and speed regression harness for reduced-precision model variants
+
+Runs the fp32 baseline and each fp16/int8 weight variant (see quantize.py)
+over the same fixture images and reports, per variant:
+
+- accuracy: AP@IoU and recall/precision at the serving confidence threshold,
+  against ground-truth boxes (--annotations) or, without them, against the
+  baseline's own detections, plus the difference to the baseline
+- speed: per-image inference latency and the speedup over the baseline
+- memory: model file size and the resident memory the loaded model adds
+
+Every model is loaded and timed in a fresh process, so one model's memory
+and warm caches don't leak into the next one's numbers. Images go through
+the server's preprocessing and post-processing (same thresholds and NMS).
+
+Fixture images come from --images (a directory) or are synthesized; with no
+--model the stub model is used. Annotations are JSON mapping image file name
+to normalized [y1, x1, y2, x2] boxes (or {"bbox": [...]} objects).
+
+Usage: python benchmarks/quant_eval.py [--model PATH] [--precision fp16 int8] [--images DIR]
+                                       [--annotations PATH] [--iterations N] [--output PATH]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from common import (BACKEND_DIR, DEFAULT_RESULTS_DIR, ensure_stub_model, environment_info, make_test_jpeg,
+                    summarize_ms, write_results)
+
+# Detections are kept down to this score so AP sees the whole precision/recall curve
+EVAL_MIN_SCORE = 0.05
+
+
+def load_fixture_images(server, image_dir, count):
+    """[(name, preprocessed image, original height, original width)] from a directory or synthesized"""
+    if image_dir:
+        names = sorted(name for name in os.listdir(image_dir)
+                       if name.lower().endswith(server.BATCH_IMAGE_EXTENSIONS))
+        if not names:
+            raise SystemExit(f'No images in {image_dir}')
+        sources = []
+        for name in names:
+            with open(os.path.join(image_dir, name), 'rb') as f:
+                sources.append((name, f.read()))
+    else:
+        sources = [(f'synthetic-{i:03d}.jpg', make_test_jpeg(1280, 960, seed=i)) for i in range(count)]
+    return [(name, *server.preprocess_image(data)) for name, data in sources]
+
+
+def load_annotations(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        name: np.array([box['bbox'] if isinstance(box, dict) else box for box in boxes],
+                       dtype=np.float64).reshape(-1, 4)
+        for name, boxes in data.items()
+    }
+
+
+def evaluate_model(graph_path, images, threads, iterations, postprocess_options):
+    """
+    Load one model, run every image once for detections and `iterations` more times
+    for latency. Runs in a fresh process; returns plain data.
+    """
+    from metrics import process_rss_bytes
+    from model_loader import InferenceEngine
+    from postprocess import postprocess_detections
+
+    rss_before = process_rss_bytes()
+    start = time.perf_counter()
+    engine = InferenceEngine(graph_path, threads)
+    engine.warmup()
+    load_seconds = time.perf_counter() - start
+    rss_loaded = process_rss_bytes()
+
+    detections = {}
+    for name, image_np, _, _ in images:
+        outputs = engine.run(image_np[None])
+        height, width = image_np.shape[:2]
+        detections[name] = postprocess_detections(*outputs, width, height, EVAL_MIN_SCORE, **postprocess_options)
+
+    samples = []
+    for _ in range(iterations):
+        for _, image_np, _, _ in images:
+            batch = image_np[None]
+            run_start = time.perf_counter()
+            engine.run(batch)
+            samples.append((time.perf_counter() - run_start) * 1000)
+    engine.close()
+
+    return {
+        'detections': detections,
+        'latency': summarize_ms(samples),
+        'load_seconds': round(load_seconds, 3),
+        'model_rss_mb': round((rss_loaded - rss_before) / 1e6, 1) if rss_before and rss_loaded else None
+    }
+
+
+def match_detections(detections, references, iou_threshold):
+    """
+    Greedy single-class matching, highest score first (each reference box matches once).
+    detections: {image: [detection dicts]}; references: {image: [N, 4] boxes}
+    Returns (scores, hit flags), both in descending score order.
+    """
+    from postprocess import box_iou
+
+    ranked = sorted(((det['score'], name, det['bbox']) for name, dets in detections.items() for det in dets),
+                    key=lambda item: -item[0])
+    matched = {name: np.zeros(len(boxes), dtype=bool) for name, boxes in references.items()}
+    hits = np.zeros(len(ranked), dtype=bool)
+    for i, (_, name, bbox) in enumerate(ranked):
+        boxes = references.get(name)
+        if boxes is None or len(boxes) == 0:
+            continue
+        ious = box_iou(np.asarray(bbox, dtype=np.float64), boxes)
+        ious[matched[name]] = 0.0
+        best = int(ious.argmax())
+        if ious[best] >= iou_threshold:
+            matched[name][best] = True
+            hits[i] = True
+    return np.array([score for score, _, _ in ranked], dtype=np.float64), hits
+
+
+def accuracy(detections, references, score_threshold, iou_threshold):
+    """
+    AP (all-point interpolation) over every detection, and recall/precision of the
+    detections the server would return (score >= score_threshold)
+    """
+    scores, hits = match_detections(detections, references, iou_threshold)
+    total = sum(len(boxes) for boxes in references.values())
+    served = int(np.count_nonzero(scores >= score_threshold))
+    found = int(np.count_nonzero(hits[:served]))
+
+    ap = None
+    if total:
+        true_positives = np.cumsum(hits)
+        recall = true_positives / total
+        precision = true_positives / np.arange(1, len(hits) + 1)
+        # Precision envelope, then area under the recall steps
+        envelope = np.maximum.accumulate(precision[::-1])[::-1]
+        ap = float(np.sum(np.diff(np.concatenate([[0.0], recall])) * envelope))
+    return {
+        'ap': round(ap, 4) if ap is not None else None,
+        'recall': round(found / total, 4) if total else None,
+        'precision': round(found / served, 4) if served else None,
+        'detections': served,
+        'references': total
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy/speed comparison of reduced-precision model variants')
+    parser.add_argument('--model', default=None, help='Frozen graph to evaluate (default: generated stub model)')
+    parser.add_argument('--precision', nargs='+', choices=('fp16', 'int8'), default=['fp16', 'int8'],
+                        help='Variants compared with the fp32 baseline')
+    parser.add_argument('--images', default=None, help='Directory of fixture images (default: synthetic images)')
+    parser.add_argument('--count', type=int, default=16, help='Synthetic images when --images is not given')
+    parser.add_argument('--annotations', default=None,
+                        help='Ground-truth boxes per image (JSON); default: compare with baseline detections')
+    parser.add_argument('--iou', type=float, default=0.5, help='IoU for a detection to count as a match')
+    parser.add_argument('--iterations', type=int, default=5, help='Timed passes over the images per model')
+    parser.add_argument('--min-elements', type=int, default=None,
+                        help='Smallest float constant that is quantized (default: as the server)')
+    parser.add_argument('--cache-dir', default=None, help='Where variants are written (default: the server cache)')
+    parser.add_argument('--no-optimize', action='store_true', help='Skip graph optimization (OPTIMIZE_GRAPH=false)')
+    parser.add_argument('--output', default=os.path.join(DEFAULT_RESULTS_DIR, 'quant_eval.json'))
+    args = parser.parse_args()
+
+    model_path = args.model or ensure_stub_model()
+
+    # Configure the server before importing it; only its pre/post-processing and settings are used
+    os.environ['MODEL_PATH'] = model_path
+    os.environ['ENABLE_BATCHING'] = 'false'
+    os.environ['ENABLE_RESULT_CACHE'] = 'false'
+    import start_server as server
+    from graph_optimizer import prepare_optimized_model
+    from quantize import DEFAULT_MIN_ELEMENTS, prepare_quantized_model
+
+    cache_dir = args.cache_dir or server.MODEL_CACHE_DIR
+    # The stub model has no convolution weights, so with it the variants only exercise the harness
+    min_elements = args.min_elements or DEFAULT_MIN_ELEMENTS
+
+    # The same graph the server would load: optimized first, then quantized
+    baseline_path = model_path
+    if not args.no_optimize:
+        baseline_path = prepare_optimized_model(model_path, cache_dir)['path']
+    variants = {'fp32': {'precision': 'fp32', 'path': baseline_path}}
+    for precision in args.precision:
+        variants[precision] = prepare_quantized_model(baseline_path, precision, cache_dir, min_elements)
+
+    images = load_fixture_images(server, args.images, args.count)
+    postprocess_options = {
+        'iou_threshold': server.NMS_THRESHOLD,
+        'min_box_size': server.MIN_BOX_SIZE,
+        'class_aware': server.NMS_CLASS_AWARE,
+        'method': server.NMS_METHOD,
+        'sigma': server.SOFT_NMS_SIGMA
+    }
+
+    runs = {}
+    for precision, info in variants.items():
+        print(f'Evaluating {precision} ({os.path.basename(info["path"])})...')
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            runs[precision] = executor.submit(evaluate_model, info['path'], images, server.THREADS_PER_WORKER,
+                                              args.iterations, postprocess_options).result()
+
+    if args.annotations:
+        references = load_annotations(args.annotations)
+        reference_source = os.path.basename(args.annotations)
+    else:
+        references = {
+            name: np.array([det['bbox'] for det in dets if det['score'] >= server.CONFIDENCE_THRESHOLD],
+                           dtype=np.float64).reshape(-1, 4)
+            for name, dets in runs['fp32']['detections'].items()
+        }
+        reference_source = 'fp32 baseline detections'
+
+    baseline = None
+    report = {}
+    for precision, info in variants.items():
+        run = runs[precision]
+        entry = {
+            'accuracy': accuracy(run['detections'], references, server.CONFIDENCE_THRESHOLD, args.iou),
+            'latency': run['latency'],
+            'load_seconds': run['load_seconds'],
+            'model_rss_mb': run['model_rss_mb'],
+            'file_mb': round(os.path.getsize(info['path']) / 1e6, 2),
+            'quantized_tensors': info.get('tensors', 0),
+            # Large float constants kept in float32 because they aren't layer weights (anchors, box priors)
+            'float32_non_weight_tensors': info.get('skipped_non_weight', 0)
+        }
+        if baseline is None:
+            baseline = entry
+        else:
+            entry['vs_baseline'] = {
+                'ap_diff': (round(entry['accuracy']['ap'] - baseline['accuracy']['ap'], 4)
+                            if entry['accuracy']['ap'] is not None and baseline['accuracy']['ap'] is not None else None),
+                'recall_diff': (round(entry['accuracy']['recall'] - baseline['accuracy']['recall'], 4)
+                                if entry['accuracy']['recall'] is not None and baseline['accuracy']['recall'] is not None
+                                else None),
+                'speedup_p50': round(baseline['latency']['p50_ms'] / entry['latency']['p50_ms'], 3),
+                'file_mb_saved': round(baseline['file_mb'] - entry['file_mb'], 2),
+                'rss_mb_saved': (round(baseline['model_rss_mb'] - entry['model_rss_mb'], 1)
+                                 if entry['model_rss_mb'] is not None and baseline['model_rss_mb'] is not None else None)
+            }
+        report[precision] = entry
+
+    results = {
+        'benchmark': 'quant_eval',
+        'environment': environment_info(),
+        'config': {
+            'model': os.path.basename(model_path),
+            'stub_model': args.model is None,
+            'optimized_graph': not args.no_optimize,
+            'images': len(images),
+            'image_source': os.path.abspath(args.images) if args.images else 'synthetic',
+            'references': reference_source,
+            'iou': args.iou,
+            'confidence_threshold': server.CONFIDENCE_THRESHOLD,
+            'min_elements': min_elements,
+            'iterations': args.iterations,
+            'processing_resolution': server.TARGET_IMAGE_SIZE,
+            'threads': server.THREADS_PER_WORKER
+        },
+        'variants': report
+    }
+
+    print(f'\nReferences: {reference_source} ({len(images)} images)')
+    print(f'  {"variant":8s} {"AP":>7s} {"recall":>7s} {"p50 ms":>9s} {"speedup":>8s} {"file MB":>8s} {"RSS MB":>8s}')
+    for precision, entry in report.items():
+        acc = entry['accuracy']
+        speedup = entry.get('vs_baseline', {}).get('speedup_p50', 1.0)
+        print(f'  {precision:8s} {acc["ap"] if acc["ap"] is not None else "-":>7} '
+              f'{acc["recall"] if acc["recall"] is not None else "-":>7} {entry["latency"]["p50_ms"]:9.3f} '
+              f'{speedup:7.3f}x {entry["file_mb"]:8.2f} '
+              f'{entry["model_rss_mb"] if entry["model_rss_mb"] is not None else "-":>8}')
+
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
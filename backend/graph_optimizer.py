@@ -0,0 +1,276 @@
+"""
+Load-time graph optimization with an on-disk cache
+
+The exported frozen_inference_graph.pb still carries training-only nodes
+(Identity/CheckNumerics), subgraphs nothing fetches, unfolded constants and
+separate batch-norm ops. This module rewrites it once - strip training and
+unused nodes, fold batch norms into the preceding convolutions, then let
+Grappler fold constants, simplify arithmetic and fuse ops - and caches the
+result next to a small JSON record, keyed by the SHA-256 of the source model
+plus the TensorFlow version. Later starts load the cached graph directly.
+
+The optimized graph is only used if it produces the same outputs as the
+original on a fixed test image; otherwise the original graph is kept and the
+rejection is cached too, so the check isn't repeated on every start.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from model_loader import INPUT_TENSOR_NAME, OUTPUT_TENSOR_NAMES, create_session
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pass pipeline or its verification changes so stale cached graphs are rebuilt
+OPTIMIZER_VERSION = 2
+
+# Grappler rewrites applied to the frozen graph ('layout' only matters on GPU)
+GRAPPLER_OPTIMIZERS = [
+    'debug_stripper',
+    'pruning',
+    'constfold',
+    'arithmetic',
+    'dependency',
+    'loop',
+    'remap',
+]
+
+# Test image used to compare the original and optimized graphs
+VERIFY_IMAGE_SIZE = 320
+VERIFY_SCORE_TOLERANCE = 1e-3
+VERIFY_BOX_TOLERANCE = 1e-3  # Normalized box coordinates
+
+
+def _node_name(tensor_name):
+    return tensor_name.split(':')[0]
+
+
+def hash_model_file(model_path, chunk_size=1024 * 1024):
+    """SHA-256 of the model file contents"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_graph_def(path):
+    graph_def = tf.compat.v1.GraphDef()
+    with open(path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+def _import(graph_def):
+    graph = tf.compat.v1.Graph()
+    with graph.as_default():
+        tf.compat.v1.import_graph_def(graph_def, name='')
+    return graph
+
+
+def _grappler_optimize(graph_def, output_names):
+    """Run the Grappler meta-optimizer over a frozen GraphDef"""
+    from tensorflow.python.grappler import tf_optimizer
+
+    graph = _import(graph_def)
+    # Grappler keeps everything the train_op collection depends on and may prune the rest
+    fetch = graph.get_collection_ref(tf.compat.v1.GraphKeys.TRAIN_OP)
+    for name in output_names:
+        fetch.append(graph.get_operation_by_name(name))
+    meta_graph = tf.compat.v1.train.export_meta_graph(graph_def=graph.as_graph_def(add_shapes=True), graph=graph)
+
+    config = tf.compat.v1.ConfigProto()
+    rewrite_options = config.graph_options.rewrite_options
+    rewrite_options.optimizers.extend(GRAPPLER_OPTIMIZERS)
+    return tf_optimizer.OptimizeGraph(config, meta_graph)
+
+
+def optimize_graph_def(graph_def):
+    """
+    Apply the optimization passes to a frozen detection GraphDef.
+    Returns (optimized_graph_def, names of the passes that were applied).
+    A pass that raises is skipped; the others still run.
+    """
+    input_names = [_node_name(INPUT_TENSOR_NAME)]
+    output_names = [_node_name(name) for name in OUTPUT_TENSOR_NAMES]
+    graph_util = tf.compat.v1.graph_util
+    applied = []
+
+    def apply(name, fn):
+        nonlocal graph_def
+        try:
+            graph_def = fn(graph_def)
+            applied.append(name)
+        except Exception as e:
+            logger.warning(f'Graph optimization pass "{name}" skipped: {e}')
+
+    apply('strip_training_nodes',
+          lambda gd: graph_util.remove_training_nodes(gd, protected_nodes=input_names + output_names))
+    apply('strip_unused_nodes', lambda gd: graph_util.extract_sub_graph(gd, output_names))
+
+    def fold_batch_norms(gd):
+        from tensorflow.python.tools import optimize_for_inference_lib
+        return optimize_for_inference_lib.fold_batch_norms(gd)
+
+    apply('fold_batch_norms', fold_batch_norms)
+    apply('grappler', lambda gd: _grappler_optimize(gd, output_names))
+    return graph_def, applied
+
+
+def _run_graph(graph_def, image_np):
+    graph = _import(graph_def)
+    image_tensor = graph.get_tensor_by_name(INPUT_TENSOR_NAME)
+    output_tensors = [graph.get_tensor_by_name(name) for name in OUTPUT_TENSOR_NAMES]
+    with create_session(graph) as sess:
+        return sess.run(output_tensors, feed_dict={image_tensor: image_np})
+
+
+def _detections_match(expected, actual):
+    """
+    Match one image's detections in score order: every expected detection needs an unused
+    actual detection with the same class and a score and box within tolerance.
+    Searching among all of them lets near-ties that swap order still match.
+    """
+    (expected_boxes, expected_scores, expected_classes), (actual_boxes, actual_scores, actual_classes) = expected, actual
+    unused = list(np.argsort(-actual_scores, kind='stable'))
+    for i in np.argsort(-expected_scores, kind='stable'):
+        for position, j in enumerate(unused):
+            if (abs(expected_scores[i] - actual_scores[j]) <= VERIFY_SCORE_TOLERANCE
+                    and expected_classes[i] == actual_classes[j]
+                    and np.allclose(expected_boxes[i], actual_boxes[j], atol=VERIFY_BOX_TOLERANCE)):
+                del unused[position]
+                break
+        else:
+            return False
+    return True
+
+
+def outputs_match(original_def, optimized_def):
+    """
+    Check that both graphs give the same detections (count, scores, classes and boxes)
+    on a fixed test image, matching detections by score order.
+    """
+    rng = np.random.default_rng(0)
+    image_np = rng.integers(0, 256, size=(1, VERIFY_IMAGE_SIZE, VERIFY_IMAGE_SIZE, 3), dtype=np.uint8)
+    expected = _run_graph(original_def, image_np)
+    actual = _run_graph(optimized_def, image_np)
+
+    expected_boxes, expected_scores, expected_classes, expected_num = expected
+    actual_boxes, actual_scores, actual_classes, actual_num = actual
+    if not np.array_equal(expected_num, actual_num) or expected_scores.shape != actual_scores.shape:
+        return False
+    for image in range(expected_scores.shape[0]):
+        count = int(expected_num[image])
+        if not _detections_match(
+                (expected_boxes[image][:count], expected_scores[image][:count], expected_classes[image][:count]),
+                (actual_boxes[image][:count], actual_scores[image][:count], actual_classes[image][:count])):
+            return False
+    return True
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def prepare_optimized_model(model_path, cache_dir):
+    """
+    Return info about the graph to load for model_path, optimizing it first if no cached result exists.
+
+    The returned dict's 'path' is the file to load: the cached optimized graph,
+    or model_path itself if optimization failed or changed the model's outputs.
+    """
+    source_sha256 = hash_model_file(model_path)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    key = f'{stem}-{source_sha256[:16]}-tf{tf.__version__}-v{OPTIMIZER_VERSION}'
+    optimized_path = os.path.join(cache_dir, f'{key}.pb')
+    record_path = os.path.join(cache_dir, f'{key}.json')
+
+    info = {
+        'graph': 'original',
+        'path': model_path,
+        'source_path': model_path,
+        'source_sha256': source_sha256,
+        'tf_version': tf.__version__,
+        'cache_hit': False,
+    }
+
+    # Cached result from an earlier start
+    if os.path.exists(record_path):
+        try:
+            with open(record_path) as f:
+                record = json.load(f)
+            if record.get('graph') == 'optimized' and os.path.exists(optimized_path):
+                info.update(record, path=optimized_path, cache_hit=True)
+                logger.info(f'Using cached optimized graph: {optimized_path}')
+                return info
+            if record.get('graph') == 'original':
+                info.update(record, path=model_path, cache_hit=True)
+                logger.info('Cached result says optimization does not apply to this model - using original graph')
+                return info
+        except (OSError, ValueError) as e:
+            logger.warning(f'Ignoring unreadable optimized-graph record {record_path}: {e}')
+
+    logger.info('Optimizing model graph (runs once per model and TensorFlow version)...')
+    start = time.perf_counter()
+    original_def = read_graph_def(model_path)
+    record = {
+        'source_sha256': source_sha256,
+        'tf_version': tf.__version__,
+        'optimizer_version': OPTIMIZER_VERSION,
+        'nodes_before': len(original_def.node),
+    }
+    failed = False
+    try:
+        optimized_def, passes = optimize_graph_def(original_def)
+        record['passes'] = passes
+        record['nodes_after'] = len(optimized_def.node)
+        if outputs_match(original_def, optimized_def):
+            record['graph'] = 'optimized'
+        else:
+            record['graph'] = 'original'
+            record['reason'] = 'optimized graph outputs differ from the original'
+    except Exception as e:
+        record['graph'] = 'original'
+        record['reason'] = f'optimization failed: {e}'
+        optimized_def = None
+        failed = True
+    record['optimize_seconds'] = round(time.perf_counter() - start, 3)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if record['graph'] == 'optimized':
+            _write_atomic(optimized_path, optimized_def.SerializeToString())
+        # A failure may be transient (memory, a busy device), so only a verified outcome is cached
+        if not failed:
+            _write_atomic(record_path, json.dumps(record, indent=2).encode())
+    except OSError as e:
+        # Sessions (and worker processes) load the graph from disk, so fall back to the original file
+        logger.warning(f'Could not write optimized graph cache to {cache_dir}: {e}')
+        if record['graph'] == 'optimized':
+            record['graph'] = 'original'
+            record['reason'] = f'cache not writable: {e}'
+
+    info.update(record)
+    if record['graph'] == 'optimized':
+        info['path'] = optimized_path
+        logger.info(f'Optimized graph: {record["nodes_before"]} -> {record["nodes_after"]} nodes '
+                    f'in {record["optimize_seconds"]}s ({", ".join(record["passes"])})')
+    else:
+        logger.warning(f'Using original graph: {record["reason"]}')
+    return info
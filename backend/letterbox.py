@@ -0,0 +1,98 @@
+"""
+Input shape bucketing with letterboxing
+
+Every distinct H x W that reaches sess.run makes TensorFlow plan and allocate
+for a new shape. With bucketing, each preprocessed image is padded (and only
+downscaled if it doesn't fit) into the closest of a few fixed canvas sizes,
+so the model only ever sees those shapes. They are warmed up at startup, and
+images that share a bucket can be stacked into one batch.
+
+The image is placed in the top-left corner of the canvas. Boxes come back
+normalized to the canvas and are rescaled to the image content.
+
+Buckets are (width, height); boxes are [y1, x1, y2, x2] (normalized 0-1).
+"""
+
+import numpy as np
+from PIL import Image
+
+# Canvas padding value
+LETTERBOX_FILL = 0
+
+
+def parse_buckets(spec, default_size=640):
+    """
+    Parse a bucket list like "640x480,480x640,640x640" into [(width, height), ...].
+    "auto" gives a square, a 4:3 landscape and a 3:4 portrait bucket of default_size.
+    """
+    spec = spec.strip().lower()
+    if spec == 'auto':
+        short = max(32, int(round(default_size * 3 / 4 / 32)) * 32)
+        return [(default_size, default_size), (default_size, short), (short, default_size)]
+
+    buckets = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            width, height = (int(v) for v in item.split('x'))
+        except ValueError:
+            raise ValueError(f'Invalid shape bucket "{item}" (expected WIDTHxHEIGHT)')
+        if width <= 0 or height <= 0:
+            raise ValueError(f'Invalid shape bucket "{item}" (sizes must be positive)')
+        if (width, height) not in buckets:
+            buckets.append((width, height))
+    return buckets
+
+
+def fit_scale(width, height, bucket):
+    """Scale that fits a width x height image into the bucket (never upscales)"""
+    bucket_width, bucket_height = bucket
+    return min(1.0, bucket_width / width, bucket_height / height)
+
+
+def choose_bucket(width, height, buckets):
+    """
+    Pick the bucket for an image: the one that keeps the most resolution,
+    then the one with the least padding.
+    """
+    def rank(bucket):
+        scale = fit_scale(width, height, bucket)
+        fill = (width * scale) * (height * scale) / (bucket[0] * bucket[1])
+        return scale, fill
+
+    return max(buckets, key=rank)
+
+
+def letterbox(image_np, bucket, resample=Image.Resampling.BILINEAR):
+    """
+    Place an [H, W, 3] image into a bucket-sized canvas.
+    Returns (canvas, content_width, content_height).
+    """
+    height, width = image_np.shape[:2]
+    bucket_width, bucket_height = bucket
+
+    scale = fit_scale(width, height, bucket)
+    if scale < 1.0:
+        content_width = max(1, min(bucket_width, int(round(width * scale))))
+        content_height = max(1, min(bucket_height, int(round(height * scale))))
+        image_np = np.asarray(Image.fromarray(image_np).resize((content_width, content_height), resample))
+    else:
+        content_width, content_height = width, height
+
+    if (content_width, content_height) == (bucket_width, bucket_height):
+        return image_np, content_width, content_height
+
+    canvas = np.full((bucket_height, bucket_width) + image_np.shape[2:], LETTERBOX_FILL, dtype=image_np.dtype)
+    canvas[:content_height, :content_width] = image_np
+    return canvas, content_width, content_height
+
+
+def unletterbox_boxes(boxes, content_width, content_height, bucket):
+    """Map boxes normalized to the canvas back to the image content (clipped to 0-1)"""
+    bucket_width, bucket_height = bucket
+    boxes = np.array(boxes, dtype=np.float32, copy=True)
+    boxes[..., 0::2] *= bucket_height / content_height
+    boxes[..., 1::2] *= bucket_width / content_width
+    return np.clip(boxes, 0.0, 1.0, out=boxes)
@@ -0,0 +1,250 @@
+"""
+TensorFlow model loading helpers
+
+Shared by the Flask server and the inference worker processes so every
+session is built from the frozen graph the same way. Also holds the worker
+processes' entry point: this module has no import-time side effects beyond
+loading TensorFlow, so it is all a spawned worker needs to import.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+# Input buffers kept for reuse: per batch shape, and number of distinct shapes
+MAX_BUFFERS_PER_SHAPE = 4
+MAX_BUFFER_SHAPES = 16
+
+# Tensor names exported by the TensorFlow Object Detection API
+INPUT_TENSOR_NAME = 'image_tensor:0'
+OUTPUT_TENSOR_NAMES = [
+    'detection_boxes:0',
+    'detection_scores:0',
+    'detection_classes:0',
+    'num_detections:0',
+]
+
+
+def read_frozen_graph(model_path):
+    """Read a frozen inference graph (.pb) into a new tf.Graph"""
+    # Use compat.v1 APIs for TensorFlow 2.x compatibility
+    # These APIs work with both TensorFlow 1.x and 2.x
+    detection_graph = tf.compat.v1.Graph()
+    with detection_graph.as_default():
+        od_graph_def = tf.compat.v1.GraphDef()
+
+        # Read model file using TensorFlow file API
+        # tf.io.gfile.GFile works in TensorFlow 2.x
+        # For compatibility, we can also use tf.compat.v1.gfile.GFile
+        try:
+            # Use tf.io.gfile for TensorFlow 2.x (preferred)
+            with tf.io.gfile.GFile(model_path, 'rb') as fid:
+                serialized_graph = fid.read()
+        except (AttributeError, TypeError):
+            # Fallback: use compat.v1.gfile (works in both TF 1.x and 2.x)
+            try:
+                with tf.compat.v1.gfile.GFile(model_path, 'rb') as fid:
+                    serialized_graph = fid.read()
+            except (AttributeError, TypeError):
+                # Last resort: standard Python file I/O
+                logger.warning('Using standard file I/O instead of TensorFlow file API')
+                with open(model_path, 'rb') as fid:
+                    serialized_graph = fid.read()
+
+        od_graph_def.ParseFromString(serialized_graph)
+        tf.compat.v1.import_graph_def(od_graph_def, name='')
+
+    return detection_graph
+
+
+def create_session(detection_graph, threads=2):
+    """Create a session for the graph with optimizations for web performance"""
+    # Use compat.v1 APIs which work with both TensorFlow 1.x and 2.x
+    config = tf.compat.v1.ConfigProto()
+
+    # GPU optimizations (if available)
+    try:
+        gpu_options = tf.compat.v1.GPUOptions(allow_growth=True)
+        config.gpu_options.CopyFrom(gpu_options)
+    except (AttributeError, TypeError):
+        # GPU options not available or not supported
+        pass
+
+    # CPU optimizations for web performance
+    config.allow_soft_placement = True
+    config.log_device_placement = False  # Disable logging for performance
+    config.inter_op_parallelism_threads = threads  # Optimize for web requests
+    config.intra_op_parallelism_threads = threads  # Optimize for web requests
+
+    return tf.compat.v1.Session(graph=detection_graph, config=config)
+
+
+def get_detection_tensors(detection_graph):
+    """Return (image_tensor, [boxes, scores, classes, num_detections]) tensor handles"""
+    image_tensor = detection_graph.get_tensor_by_name(INPUT_TENSOR_NAME)
+    output_tensors = [detection_graph.get_tensor_by_name(name) for name in OUTPUT_TENSOR_NAMES]
+    return image_tensor, output_tensors
+
+
+def warmup_session(detection_graph, sess, size=640, shapes=None):
+    """
+    Run a dummy inference so the first real request doesn't pay for graph setup.
+    shapes: optional list of (batch, height, width) to warm up instead of one size x size image.
+    Returns True on success - failures are logged but non-critical.
+    """
+    try:
+        image_tensor, output_tensors = get_detection_tensors(detection_graph)
+
+        for batch, height, width in shapes or [(1, size, size)]:
+            # Create dummy image for warmup
+            dummy_images = np.zeros((batch, height, width, 3), dtype=np.uint8)
+
+            # Run warmup inference
+            sess.run(output_tensors, feed_dict={image_tensor: dummy_images})
+        return True
+    except Exception as e:
+        logger.warning(f'Model warmup failed (non-critical): {str(e)}')
+        import traceback
+        logger.debug(traceback.format_exc())
+        return False
+
+
+class InferenceEngine:
+    """
+    A loaded detection model ready to run.
+
+    Tensors are resolved once and sess.run is precompiled with Session.make_callable,
+    so a call does no graph lookups or fetch/feed validation. Batches of images are
+    stacked into reusable input buffers instead of a fresh array per call.
+    Safe to call from many threads at once: TensorFlow sessions are thread-safe and
+    each call takes its own buffer from the pool.
+
+    Args:
+        model_path: Frozen inference graph (.pb) to load
+        threads: TensorFlow inter/intra-op threads for the session
+    """
+
+    def __init__(self, model_path, threads=2):
+        self.model_path = model_path
+        self.graph = read_frozen_graph(model_path)
+        self.sess = create_session(self.graph, threads)
+        self.image_tensor, self.output_tensors = get_detection_tensors(self.graph)
+        self._runner = self.sess.make_callable(self.output_tensors, feed_list=[self.image_tensor])
+        self._traced_runner = None  # Built on first profiled run (accepts RunOptions/RunMetadata)
+
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()  # batch shape -> free buffers, least recently used shape first
+        self._runs = 0
+        self._buffer_reuses = 0
+
+    def warmup(self, size=640, shapes=None):
+        """Run dummy inferences (optionally one per (batch, height, width) shape) before serving"""
+        return warmup_session(self.graph, self.sess, size, shapes)
+
+    def run(self, batch_np):
+        """Run a [N, H, W, 3] uint8 batch; returns (boxes, scores, classes, num_detections)"""
+        boxes, scores, classes, num_detections = self._runner(batch_np)
+        with self._lock:
+            self._runs += 1
+        return boxes, scores, classes, num_detections
+
+    def run_traced(self, batch_np):
+        """Like run, with a full TensorFlow trace; returns (outputs, Chrome trace JSON string)"""
+        from tensorflow.python.client import timeline
+
+        with self._lock:
+            if self._traced_runner is None:
+                self._traced_runner = self.sess.make_callable(
+                    self.output_tensors, feed_list=[self.image_tensor], accept_options=True
+                )
+            runner = self._traced_runner
+        options = tf.compat.v1.RunOptions(trace_level=tf.compat.v1.RunOptions.FULL_TRACE)
+        run_metadata = tf.compat.v1.RunMetadata()
+        outputs = runner(batch_np, options=options, run_metadata=run_metadata)
+        with self._lock:
+            self._runs += 1
+        return tuple(outputs), timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format()
+
+    def run_images(self, images, traced=False):
+        """
+        Run a [N, H, W, 3] array or a sequence of same-shape [H, W, 3] images.
+        Sequences are stacked into a pooled input buffer (a single image is just a view).
+        With traced=True returns (outputs, Chrome trace) like run_traced.
+        """
+        run = self.run_traced if traced else self.run
+        if isinstance(images, np.ndarray) and images.ndim == 4:
+            return run(images)
+        if len(images) == 1:
+            return run(np.expand_dims(images[0], axis=0))
+
+        buffer = self._acquire_buffer((len(images),) + images[0].shape, images[0].dtype)
+        try:
+            np.stack(images, axis=0, out=buffer)
+            return run(buffer)
+        finally:
+            self._release_buffer(buffer)
+
+    def _acquire_buffer(self, shape, dtype):
+        with self._lock:
+            free = self._buffers.get(shape)
+            if free:
+                self._buffer_reuses += 1
+                return free.pop()
+        return np.empty(shape, dtype=dtype)
+
+    def _release_buffer(self, buffer):
+        with self._lock:
+            free = self._buffers.setdefault(buffer.shape, [])
+            self._buffers.move_to_end(buffer.shape)
+            if len(free) < MAX_BUFFERS_PER_SHAPE:
+                free.append(buffer)
+            while len(self._buffers) > MAX_BUFFER_SHAPES:
+                self._buffers.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'runs': self._runs,
+                'buffer_reuses': self._buffer_reuses,
+                'pooled_buffers': sum(len(free) for free in self._buffers.values()),
+                'pooled_buffer_bytes': sum(b.nbytes for free in self._buffers.values() for b in free)
+            }
+
+    def close(self):
+        self.sess.close()
+
+
+def worker_main(index, model_path, threads, warmup_shapes, task_queue, result_queue):
+    """
+    Inference worker process entry point (see worker_pool): load the model, then serve
+    (task_id, batch, traced) tasks from task_queue until a None task arrives.
+    Reports ('ready' | 'failed' | 'result' | 'error', index, task_id, payload) on result_queue.
+    """
+    try:
+        engine = InferenceEngine(model_path, threads)
+        engine.warmup(shapes=warmup_shapes)
+    except Exception as e:
+        result_queue.put(('failed', index, None, str(e)))
+        return
+
+    result_queue.put(('ready', index, None, os.getpid()))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, batch_np, traced = task
+        try:
+            # Traced tasks return (outputs, Chrome trace)
+            outputs = engine.run_traced(batch_np) if traced else tuple(engine.run(batch_np))
+            result_queue.put(('result', index, task_id, outputs))
+        except Exception as e:
+            result_queue.put(('error', index, task_id, str(e)))
+
+    engine.close()
@@ -0,0 +1,431 @@
+"""
+Model registry: several loaded models, background loading and atomic swaps
+
+Each entry is a named, versioned model with its own inference backend (an
+InferenceEngine or a WorkerPool). A new version is loaded and warmed up in
+a background thread while the current one keeps serving, then swapped in
+under a lock. Requests choose their model once, through route(): the
+primary model, or a candidate for a percentage of traffic. A shadow
+candidate gets copies of primary traffic off the request path, so its
+latency and agreement can be checked before it serves anything.
+
+A replaced version is retired rather than closed: it finishes the runs it
+has in flight and is closed when idle. A run that reaches a version that
+has already been closed is sent to the current primary instead, so
+rollouts don't fail requests.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per model for percentiles
+LATENCY_WINDOW = 1024
+
+# A retired model is closed once idle, but not before this many seconds (queued requests may still pick it)
+RETIRE_DELAY = 10.0
+RETIRE_POLL_INTERVAL = 0.5
+
+
+class ModelClosedError(RuntimeError):
+    """The model was retired and closed before this run reached it"""
+
+
+class LatencyStats:
+    """Run count, errors and latency percentiles over a sliding window"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self._runs = 0
+        self._images = 0
+        self._errors = 0
+        self._total_seconds = 0.0
+
+    def observe(self, seconds, images=1):
+        with self._lock:
+            self._samples.append(seconds)
+            self._runs += 1
+            self._images += images
+            self._total_seconds += seconds
+
+    def error(self):
+        with self._lock:
+            self._errors += 1
+
+    def stats(self):
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64)
+            runs, images, errors, total = self._runs, self._images, self._errors, self._total_seconds
+        result = {
+            'runs': runs,
+            'images': images,
+            'errors': errors,
+            'mean_ms': round(total / runs * 1000, 2) if runs else None
+        }
+        for name, q in (('p50_ms', 50), ('p95_ms', 95), ('p99_ms', 99)):
+            result[name] = round(float(np.percentile(samples, q)) * 1000, 2) if len(samples) else None
+        return result
+
+
+class LoadedModel:
+    """
+    One loaded model version.
+
+    Args:
+        name: Registry name (e.g. "default", "candidate")
+        version: Version number, increasing per load in the registry
+        path: Model file it was loaded from
+        backend: InferenceEngine or WorkerPool
+        model_id: Identity of the model file and graph (part of the result cache key)
+        graph_info: Which graph (original or optimized) the backend runs
+    """
+
+    def __init__(self, name, version, path, backend, model_id, graph_info=None, load_seconds=None):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.backend = backend
+        self.model_id = model_id
+        self.graph_info = graph_info
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.latency = LatencyStats()
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._retired = False
+        self._closed = False
+
+    @property
+    def label(self):
+        return f'{self.name}@{self.version}'
+
+    def run(self, images, traced=False):
+        """
+        Run a [N, H, W, 3] array or a list of same-shape images.
+        Returns the outputs, or (outputs, Chrome trace) with traced=True.
+        Raises ModelClosedError if this version has been closed.
+        """
+        with self._lock:
+            if self._closed:
+                raise ModelClosedError(f'Model {self.label} is closed')
+            self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            if hasattr(self.backend, 'run_images'):
+                result = self.backend.run_images(images, traced=traced)
+            else:
+                batch_np = images if isinstance(images, np.ndarray) else np.stack(images, axis=0)
+                result = self.backend.run_traced(batch_np) if traced else self.backend.run(batch_np)
+        except Exception:
+            self.latency.error()
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        self.latency.observe(time.perf_counter() - start, len(images))
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def retire(self):
+        """Close once idle (after RETIRE_DELAY), in a background thread"""
+        with self._lock:
+            if self._retired:
+                return
+            self._retired = True
+        threading.Thread(target=self._close_when_idle, name=f'retire-{self.label}', daemon=True).start()
+
+    def _close_when_idle(self):
+        time.sleep(RETIRE_DELAY)
+        while True:
+            with self._lock:
+                if self._in_flight == 0:
+                    self._closed = True
+                    break
+            time.sleep(RETIRE_POLL_INTERVAL)
+        self._close_backend()
+        logger.info(f'Model {self.label} retired and closed')
+
+    def close(self):
+        """Close immediately (shutdown)"""
+        with self._lock:
+            self._closed = True
+        self._close_backend()
+
+    def _close_backend(self):
+        try:
+            if hasattr(self.backend, 'stop'):
+                self.backend.stop()
+            else:
+                self.backend.close()
+        except Exception as e:
+            logger.warning(f'Error closing model {self.label}: {str(e)}')
+
+    def stats(self):
+        with self._lock:
+            state = 'closed' if self._closed else ('retired' if self._retired else 'loaded')
+            in_flight = self._in_flight
+        return {
+            'name': self.name,
+            'version': self.version,
+            'path': self.path,
+            'model_id': self.model_id,
+            'graph': self.graph_info['graph'] if self.graph_info else None,
+            'precision': self.graph_info.get('precision', 'fp32') if self.graph_info else None,
+            'state': state,
+            'loaded_at': self.loaded_at,
+            'load_seconds': round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            'in_flight': in_flight,
+            'latency': self.latency.stats(),
+            'backend': self.backend.stats() if hasattr(self.backend, 'stats') else None
+        }
+
+
+class ModelRegistry:
+    """
+    Named models with a primary, an optional candidate and background loading.
+
+    Args:
+        load_fn: Callable (name, path, version, **options) -> LoadedModel that loads and warms up
+            a model (blocking); options are the ones passed to load()
+        shadow_workers: Threads running shadow copies of requests
+        shadow_queue_size: Shadow runs allowed to wait; beyond that copies are dropped
+    """
+
+    def __init__(self, load_fn, shadow_workers=1, shadow_queue_size=8):
+        self.load_fn = load_fn
+        self._lock = threading.Lock()
+        self._models = {}  # name -> LoadedModel
+        self._loading = {}  # name -> load status
+        self._versions = 0
+        self._primary = None  # name
+        self._candidate = None  # name
+        self._candidate_percent = 0.0
+        self._shadow = False
+        self._routed = {}  # model label -> requests routed
+
+        self._shadow_executor = ThreadPoolExecutor(max(1, shadow_workers), thread_name_prefix='shadow')
+        self._shadow_slots = threading.BoundedSemaphore(max(1, shadow_queue_size))
+        self._shadow_stats = {'runs': 0, 'dropped': 0, 'errors': 0, 'count_diff_total': 0}
+
+    def load(self, name, path, activate=False, wait=False, on_loaded=None, options=None):
+        """
+        Load (or reload) a model under name in a background thread. The new version replaces
+        the entry of the same name only once it is loaded and warmed up; with activate it also
+        becomes the primary, and on_loaded(model) is called after that.
+        options (dict) are passed on to load_fn as keyword arguments.
+        With wait, blocks and returns True on success; otherwise returns the load status.
+        """
+        with self._lock:
+            if name in self._loading and self._loading[name]['state'] == 'loading':
+                raise RuntimeError(f'Model {name} is already loading')
+            self._versions += 1
+            version = self._versions
+            status = {'state': 'loading', 'path': path, 'version': version, 'options': dict(options or {}),
+                      'started': time.time(), 'error': None}
+            self._loading[name] = status
+
+        def run():
+            try:
+                start = time.monotonic()
+                model = self.load_fn(name, path, version, **(options or {}))
+                model.load_seconds = time.monotonic() - start
+                self._install(model, activate)
+                status['state'] = 'loaded'
+                if on_loaded is not None:
+                    on_loaded(model)
+            except Exception as e:
+                logger.error(f'Loading model {name} from {path} failed: {str(e)}')
+                status['state'] = 'failed'
+                status['error'] = str(e)
+            finally:
+                status['finished'] = time.time()
+
+        if wait:
+            run()
+            return status['state'] == 'loaded'
+        threading.Thread(target=run, name=f'load-model-{name}', daemon=True).start()
+        return status
+
+    def _install(self, model, activate):
+        """Atomically put a loaded model in place; the version it replaces is retired"""
+        with self._lock:
+            previous = self._models.get(model.name)
+            self._models[model.name] = model
+            if activate or self._primary is None:
+                self._primary = model.name
+            if self._candidate == self._primary:
+                self._clear_candidate()
+        logger.info(f'Model {model.label} loaded from {model.path}'
+                    f'{" and activated" if self._primary == model.name else ""}')
+        if previous is not None:
+            previous.retire()
+
+    def activate(self, name):
+        """Make a loaded model the primary (the previous primary stays loaded for rollback)"""
+        with self._lock:
+            if name not in self._models:
+                raise KeyError(name)
+            self._primary = name
+            if self._candidate == name:
+                self._clear_candidate()
+        logger.info(f'Model {name} is now the primary model')
+
+    def set_candidate(self, name, percent=0.0, shadow=False):
+        """Route percent% of requests to a candidate model, or mirror traffic to it with shadow"""
+        with self._lock:
+            if name not in self._models:
+                raise KeyError(name)
+            if name == self._primary:
+                raise ValueError('The candidate must not be the primary model')
+            self._candidate = name
+            self._candidate_percent = 0.0 if shadow else min(100.0, max(0.0, float(percent)))
+            self._shadow = bool(shadow)
+
+    def clear_candidate(self):
+        with self._lock:
+            self._clear_candidate()
+
+    def _clear_candidate(self):
+        self._candidate = None
+        self._candidate_percent = 0.0
+        self._shadow = False
+
+    def unload(self, name):
+        """Remove a model that is not the primary (closed once its in-flight runs finish)"""
+        with self._lock:
+            if name == self._primary:
+                raise ValueError('Cannot unload the primary model')
+            model = self._models.pop(name, None)
+            if model is None:
+                raise KeyError(name)
+            if self._candidate == name:
+                self._clear_candidate()
+        model.retire()
+
+    def primary(self):
+        with self._lock:
+            return self._models.get(self._primary) if self._primary is not None else None
+
+    def route(self):
+        """
+        Model for a new request: the candidate for its share of traffic, else the primary.
+        Returns (model, shadow model or None); model is None when nothing is loaded.
+        """
+        with self._lock:
+            primary = self._models.get(self._primary) if self._primary is not None else None
+            candidate = self._models.get(self._candidate) if self._candidate is not None else None
+            if candidate is not None and self._shadow:
+                chosen, shadow = primary, candidate
+            elif candidate is not None and random.random() * 100 < self._candidate_percent:
+                chosen, shadow = candidate, None
+            else:
+                chosen, shadow = primary, None
+            if chosen is not None:
+                self._routed[chosen.label] = self._routed.get(chosen.label, 0) + 1
+            return chosen, shadow
+
+    def run(self, model, images, traced=False):
+        """Run on model, or on the current primary if model was closed in the meantime"""
+        try:
+            return model.run(images, traced)
+        except ModelClosedError:
+            primary = self.primary()
+            if primary is None or primary is model:
+                raise
+            return primary.run(images, traced)
+
+    def shadow(self, model, images, primary_outputs, score_threshold):
+        """
+        Run a copy of a request on the shadow model off the request path and compare the
+        number of detections above score_threshold. Dropped if the shadow queue is full.
+        """
+        if not self._shadow_slots.acquire(blocking=False):
+            with self._lock:
+                self._shadow_stats['dropped'] += 1
+            return
+        primary_counts = (np.asarray(primary_outputs[1]) >= score_threshold).sum(axis=1)
+
+        def run():
+            try:
+                _, scores, _, _ = model.run(images)
+                diff = int(np.abs((np.asarray(scores) >= score_threshold).sum(axis=1) - primary_counts).sum())
+                with self._lock:
+                    self._shadow_stats['runs'] += 1
+                    self._shadow_stats['count_diff_total'] += diff
+            except Exception as e:
+                logger.warning(f'Shadow run on {model.label} failed: {str(e)}')
+                with self._lock:
+                    self._shadow_stats['errors'] += 1
+            finally:
+                self._shadow_slots.release()
+
+        self._shadow_executor.submit(run)
+
+    def stats(self):
+        with self._lock:
+            models = list(self._models.values())
+            loading = {name: dict(status) for name, status in self._loading.items()}
+            routing = {
+                'primary': self._primary,
+                'candidate': self._candidate,
+                'candidate_percent': self._candidate_percent,
+                'shadow': self._shadow,
+                'routed': dict(self._routed)
+            }
+            shadow = dict(self._shadow_stats)
+        if shadow['runs']:
+            shadow['mean_count_diff'] = round(shadow['count_diff_total'] / shadow['runs'], 3)
+        return {
+            'routing': routing,
+            'models': {model.name: model.stats() for model in models},
+            'loads': loading,
+            'shadow': shadow
+        }
+
+    def summary(self):
+        """Public view of the loaded models: no paths or backend details, just what each one serves"""
+        with self._lock:
+            models = list(self._models.values())
+            roles = {self._primary: 'primary'}
+            if self._candidate is not None:
+                roles[self._candidate] = 'shadow' if self._shadow else 'candidate'
+            candidate_percent = self._candidate_percent
+            routed = dict(self._routed)
+        result = []
+        for model in models:
+            latency = model.latency.stats()
+            result.append({
+                'name': model.name,
+                'version': model.version,
+                'role': roles.get(model.name, 'standby'),
+                'traffic_percent': candidate_percent if roles.get(model.name) == 'candidate' else None,
+                'requests': routed.get(model.label, 0),
+                'runs': latency['runs'],
+                'p50_ms': latency['p50_ms'],
+                'p95_ms': latency['p95_ms'],
+                'p99_ms': latency['p99_ms']
+            })
+        return sorted(result, key=lambda model: model['version'])
+
+    def close(self):
+        """Close every model (shutdown)"""
+        self._shadow_executor.shutdown(wait=True)
+        with self._lock:
+            models = list(self._models.values())
+            self._models.clear()
+            self._primary = None
+            self._clear_candidate()
+        for model in models:
+            model.close()
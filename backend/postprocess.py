@@ -0,0 +1,188 @@
+"""
+Vectorized post-processing for fish detection results
+
+Works directly on the boxes/scores/classes arrays returned by sess.run
+instead of building a list of dicts first:
+- Confidence thresholding and minimum box size filtering with boolean masks
+- Greedy NMS where each step computes IoU against all remaining boxes at once
+- Optional class-aware NMS and soft-NMS (linear or gaussian score decay)
+
+Boxes are in format [y1, x1, y2, x2] (normalized 0-1).
+"""
+
+import numpy as np
+
+NMS_METHODS = ('hard', 'soft_linear', 'soft_gaussian')
+
+
+def filter_detections(boxes, scores, classes, num_detections, processed_width, processed_height,
+                      score_threshold, min_box_size=20):
+    """
+    Apply confidence threshold and minimum box size filters to raw model output.
+    Accepts either batched ([1, N, ...]) or unbatched ([N, ...]) arrays.
+
+    Returns (boxes, scores, classes) for the detections that pass both filters.
+    """
+    boxes = np.asarray(boxes)
+    scores = np.asarray(scores)
+    classes = np.asarray(classes)
+    if boxes.ndim == 3:
+        boxes, scores, classes = boxes[0], scores[0], classes[0]
+
+    num_det = int(np.asarray(num_detections).reshape(-1)[0])
+    boxes = boxes[:num_det]
+    scores = scores[:num_det]
+    classes = classes[:num_det]
+
+    # Filter out very small detections (likely false positives)
+    box_width = (boxes[:, 3] - boxes[:, 1]) * processed_width
+    box_height = (boxes[:, 2] - boxes[:, 0]) * processed_height
+    mask = (scores >= score_threshold) & (box_width >= min_box_size) & (box_height >= min_box_size)
+
+    return boxes[mask], scores[mask], classes[mask]
+
+
+def box_iou(box, boxes):
+    """IoU of a single [4] box against an [N, 4] matrix of boxes"""
+    y1 = np.maximum(box[0], boxes[:, 0])
+    x1 = np.maximum(box[1], boxes[:, 1])
+    y2 = np.minimum(box[2], boxes[:, 2])
+    x2 = np.minimum(box[3], boxes[:, 3])
+
+    intersection = np.clip(x2 - x1, 0.0, None) * np.clip(y2 - y1, 0.0, None)
+    area = (box[3] - box[1]) * (box[2] - box[0])
+    areas = (boxes[:, 3] - boxes[:, 1]) * (boxes[:, 2] - boxes[:, 0])
+    union = area + areas - intersection
+
+    iou = np.zeros_like(intersection)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def nms(boxes, scores, iou_threshold, classes=None, method='hard', sigma=0.5, score_threshold=0.0):
+    """
+    Non-Maximum Suppression over arrays of boxes and scores.
+
+    Args:
+        boxes: [N, 4] boxes
+        scores: [N] confidence scores
+        iou_threshold: Overlap at or above which a box is suppressed (hard and linear NMS)
+        classes: Optional [N] class ids; when given, boxes only suppress boxes of the same class
+        method: 'hard', 'soft_linear' or 'soft_gaussian'
+        sigma: Gaussian soft-NMS spread
+        score_threshold: Soft-NMS drops boxes whose decayed score falls below this
+
+    Returns (keep, scores): indices of kept boxes in selection order, and their
+    (possibly decayed) scores.
+    """
+    if method not in NMS_METHODS:
+        raise ValueError(f'Unknown NMS method: {method}')
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+    if classes is not None:
+        classes = np.asarray(classes)
+        keep_all = []
+        for cls in np.unique(classes):
+            idx = np.flatnonzero(classes == cls)
+            keep, kept_scores = nms(boxes[idx], scores[idx], iou_threshold, None, method, sigma, score_threshold)
+            keep_all.append((idx[keep], kept_scores))
+        keep = np.concatenate([k for k, _ in keep_all])
+        kept_scores = np.concatenate([s for _, s in keep_all])
+        # Merge per-class results back into global score order
+        order = np.argsort(-kept_scores, kind='stable')
+        return keep[order], kept_scores[order]
+
+    if method == 'hard':
+        # Highest confidence first; stable sort keeps ties in original order
+        order = np.argsort(-scores, kind='stable')
+        keep = []
+        while len(order) > 0:
+            best = order[0]
+            keep.append(best)
+            rest = order[1:]
+            iou = box_iou(boxes[best], boxes[rest])
+            order = rest[iou < iou_threshold]
+        keep = np.asarray(keep, dtype=np.int64)
+        return keep, scores[keep]
+
+    # Soft-NMS: decay overlapping scores instead of discarding boxes outright
+    scores = scores.copy()
+    remaining = np.arange(len(scores))
+    keep = []
+    kept_scores = []
+    while len(remaining) > 0:
+        pos = int(np.argmax(scores[remaining]))
+        best = remaining[pos]
+        keep.append(best)
+        kept_scores.append(scores[best])
+        remaining = np.delete(remaining, pos)
+        if len(remaining) == 0:
+            break
+        iou = box_iou(boxes[best], boxes[remaining])
+        if method == 'soft_linear':
+            decay = np.where(iou >= iou_threshold, 1.0 - iou, 1.0)
+        else:
+            decay = np.exp(-(iou * iou) / sigma)
+        scores[remaining] *= decay
+        remaining = remaining[scores[remaining] >= score_threshold]
+    return np.asarray(keep, dtype=np.int64), np.asarray(kept_scores, dtype=np.float64)
+
+
+def to_detections(boxes, scores, classes):
+    """Convert arrays to the JSON detection format returned by /detect"""
+    boxes = np.asarray(boxes, dtype=np.float64).tolist()
+    scores = np.asarray(scores, dtype=np.float64).tolist()
+    classes = np.asarray(classes).astype(np.int64).tolist()
+    return [
+        {'bbox': box, 'score': score, 'class': cls}
+        for box, score, cls in zip(boxes, scores, classes)
+    ]
+
+
+def postprocess_detections(boxes, scores, classes, num_detections, processed_width, processed_height,
+                           score_threshold, iou_threshold, min_box_size=20, class_aware=False,
+                           method='hard', sigma=0.5):
+    """
+    Full post-processing stage: threshold filter, box size filter and NMS.
+    Returns the list of detection dicts sorted by score (highest first).
+    """
+    boxes, scores, classes = filter_detections(
+        boxes, scores, classes, num_detections, processed_width, processed_height,
+        score_threshold, min_box_size
+    )
+    return nms_detections(boxes, scores, classes, iou_threshold, score_threshold, class_aware, method, sigma)
+
+
+def nms_detections(boxes, scores, classes, iou_threshold, score_threshold=0.0, class_aware=False,
+                   method='hard', sigma=0.5):
+    """NMS over already filtered arrays; returns detection dicts sorted by score (highest first)"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    classes = np.asarray(classes)
+    keep, kept_scores = nms(
+        boxes, scores, iou_threshold,
+        classes=classes if class_aware else None,
+        method=method, sigma=sigma, score_threshold=score_threshold
+    )
+    if method == 'hard':
+        # Hard NMS never changes scores - report the model's original values
+        kept_scores = scores[keep]
+    return to_detections(boxes[keep], kept_scores, classes[keep])
+
+
+def apply_nms(detections, iou_threshold):
+    """
+    Apply Non-Maximum Suppression to a list of detection dicts.
+    Keeps detections with highest confidence scores and removes overlapping ones.
+    """
+    if len(detections) == 0:
+        return []
+
+    boxes = np.array([det['bbox'] for det in detections], dtype=np.float64)
+    scores = np.array([det['score'] for det in detections], dtype=np.float64)
+    keep, _ = nms(boxes, scores, iou_threshold)
+    return [detections[i] for i in keep]
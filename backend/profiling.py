@@ -0,0 +1,207 @@
+"""
+Per-request TensorFlow profiling
+
+A profiled request (opt-in flag or random sample) runs sess.run with
+FULL_TRACE RunOptions, bypassing the batch scheduler so the trace covers
+only its own image(s). The TensorFlow step stats are turned into a Chrome
+trace (chrome://tracing, Perfetto) and the request's pipeline stages
+(decode, resize, letterbox, postprocess, ...) are added as a separate
+"Request stages" track on the same wall clock.
+
+Traces are kept in a bounded on-disk ring: once max_traces files exist,
+the oldest is deleted.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Chrome trace process id for the request stage track (TensorFlow uses small ids per device)
+STAGE_TRACK_PID = 1000
+
+_TRACE_FILE = re.compile(r'^(\d+)-([0-9a-f]{32})\.json$')
+
+# Trace of the request being handled in this context (None when not profiled)
+_active_trace = contextvars.ContextVar('active_trace', default=None)
+
+
+class RequestTrace:
+    """Stage spans and TensorFlow run traces collected for one request"""
+
+    def __init__(self, endpoint=None):
+        self.trace_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.created = time.time()
+        self._lock = threading.Lock()
+        self._stages = []  # (stage, start (epoch seconds), seconds, thread name)
+        self._events = []  # Chrome trace events from TensorFlow runs
+        self._runs = 0
+
+    def add_stage(self, stage, seconds, end=None):
+        end = time.time() if end is None else end
+        with self._lock:
+            self._stages.append((stage, end - seconds, seconds, threading.current_thread().name))
+
+    def add_run(self, chrome_trace):
+        """Add the Chrome trace (JSON string) of one traced sess.run"""
+        events = json.loads(chrome_trace).get('traceEvents', [])
+        with self._lock:
+            self._events.extend(events)
+            self._runs += 1
+
+    def stage_timings(self):
+        """Total milliseconds per stage"""
+        with self._lock:
+            totals = {}
+            for stage, _, seconds, _ in self._stages:
+                totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+        return {stage: round(ms, 3) for stage, ms in totals.items()}
+
+    def to_chrome_trace(self, metadata=None):
+        with self._lock:
+            threads = sorted({thread for _, _, _, thread in self._stages})
+            events = list(self._events)
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': STAGE_TRACK_PID,
+                           'args': {'name': 'Request stages'}})
+            for tid, thread in enumerate(threads):
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': STAGE_TRACK_PID, 'tid': tid,
+                               'args': {'name': thread}})
+            for stage, start, seconds, thread in self._stages:
+                events.append({
+                    'name': stage, 'cat': 'stage', 'ph': 'X', 'pid': STAGE_TRACK_PID,
+                    'tid': threads.index(thread), 'ts': int(start * 1e6), 'dur': max(1, int(seconds * 1e6))
+                })
+            runs = self._runs
+        other = {
+            'trace_id': self.trace_id,
+            'endpoint': self.endpoint,
+            'created': self.created,
+            'runs': runs,
+            'stage_ms': self.stage_timings()
+        }
+        other.update(metadata or {})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': other}
+
+
+def current_trace():
+    return _active_trace.get()
+
+
+@contextmanager
+def activate(trace):
+    """Make trace the active trace for this context (threads started via copy_context inherit it)"""
+    token = _active_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _active_trace.reset(token)
+
+
+def record_stage(stage, seconds):
+    """Add a stage duration to the active trace, if any"""
+    trace = _active_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+class TraceStore:
+    """
+    Bounded on-disk ring of Chrome trace files.
+
+    Args:
+        directory: Where traces are written (created if missing)
+        max_traces: Traces kept; the oldest is deleted when a new one is saved
+    """
+
+    def __init__(self, directory, max_traces=50):
+        self.directory = directory
+        self.max_traces = max(1, int(max_traces))
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # trace_id -> summary, oldest first
+        self._saved = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the index from trace files left by a previous run"""
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            match = _TRACE_FILE.match(name)
+            if match is None:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    other = json.load(f).get('otherData', {})
+            except (OSError, ValueError) as e:
+                logger.warning(f'Skipping unreadable trace {path}: {e}')
+                continue
+            entries.append((int(match.group(1)), match.group(2), self._summary(name, path, other)))
+        for _, trace_id, summary in sorted(entries):
+            self._index[trace_id] = summary
+        self._evict()
+
+    @staticmethod
+    def _summary(name, path, other):
+        summary = dict(other)
+        summary['file'] = name
+        summary['size_bytes'] = os.path.getsize(path)
+        return summary
+
+    def save(self, trace, metadata=None):
+        """Write a RequestTrace; returns its summary"""
+        name = f'{int(trace.created * 1000)}-{trace.trace_id}.json'
+        path = os.path.join(self.directory, name)
+        data = trace.to_chrome_trace(metadata)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+        summary = self._summary(name, path, data['otherData'])
+        with self._lock:
+            self._index[trace.trace_id] = summary
+            self._saved += 1
+            self._evict()
+        return summary
+
+    def _evict(self):
+        while len(self._index) > self.max_traces:
+            _, summary = self._index.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.directory, summary['file']))
+            except OSError:
+                pass
+
+    def list(self):
+        """Summaries of stored traces, newest first"""
+        with self._lock:
+            return list(reversed(self._index.values()))
+
+    def path(self, trace_id):
+        """File of a stored trace, or None"""
+        with self._lock:
+            summary = self._index.get(trace_id)
+        if summary is None:
+            return None
+        return os.path.join(self.directory, summary['file'])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'max_traces': self.max_traces,
+                'stored': len(self._index),
+                'saved': self._saved
+            }
@@ -0,0 +1,235 @@
+"""
+Reduced-precision model variants (weight-only float16 / int8)
+
+Rewrites the large float32 weight constants of a frozen detection graph -
+constants consumed as convolution or matmul weights, directly or through
+Identity nodes:
+
+- fp16: weights are stored as float16 and cast back to float32 in the graph
+- int8: weights are stored as int8 with a symmetric per-output-channel
+  (last axis) float32 scale and dequantized with Cast + Mul
+
+The replacement node keeps the original constant's name, so nothing that
+consumes the weight changes. Every other constant stays float32: biases and
+scalars, and anchors/box priors however large they are, since box decoding
+needs them exact. Convolutions and matmuls still run in float32 - TensorFlow's CPU
+kernels have no faster float16 path - so what a variant buys is a smaller
+model file and graph to parse, plus whatever the host gains from it; the
+accuracy cost and the actual speedup are measured with
+benchmarks/quant_eval.py before a variant is served.
+
+Variants are cached like optimized graphs, keyed by the SHA-256 of the
+source graph, the precision and QUANTIZE_VERSION.
+
+Usage: python quantize.py MODEL_PATH --precision int8 [--output PATH]
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from graph_optimizer import _write_atomic, hash_model_file, read_graph_def
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ('fp32', 'fp16', 'int8')
+
+# Bump when the rewrite changes so stale cached variants are rebuilt
+QUANTIZE_VERSION = 2
+
+# Float constants with fewer elements than this are left in float32
+DEFAULT_MIN_ELEMENTS = 1024
+
+INT8_MAX = 127
+
+# Ops whose constant inputs are layer weights; anything else (box decoding, anchors) is left alone
+WEIGHT_OPS = frozenset({'Conv2D', 'DepthwiseConv2dNative', 'Conv2DBackpropInput', 'Conv3D', 'MatMul',
+                        'BatchMatMul', 'BatchMatMulV2'})
+
+
+def _const_node(name, values, device=''):
+    node = tf.compat.v1.NodeDef(name=name, op='Const', device=device)
+    tensor = tf.make_tensor_proto(values)
+    node.attr['dtype'].type = tensor.dtype
+    node.attr['value'].tensor.CopyFrom(tensor)
+    return node
+
+
+def _cast_node(name, input_name, src_dtype, device=''):
+    node = tf.compat.v1.NodeDef(name=name, op='Cast', input=[input_name], device=device)
+    node.attr['SrcT'].type = src_dtype.as_datatype_enum
+    node.attr['DstT'].type = tf.float32.as_datatype_enum
+    node.attr['Truncate'].b = False
+    return node
+
+
+def _input_node_name(input_name):
+    return input_name.lstrip('^').split(':')[0]
+
+
+def weight_constants(graph_def):
+    """Names of the nodes consumed by a WEIGHT_OPS op, directly or through Identity nodes"""
+    consumers = {}
+    for node in graph_def.node:
+        for input_name in node.input:
+            if not input_name.startswith('^'):
+                consumers.setdefault(_input_node_name(input_name), []).append(node)
+
+    weights = set()
+    for node in graph_def.node:
+        pending = [node.name]
+        while pending:
+            for consumer in consumers.get(pending.pop(), ()):
+                if consumer.op in WEIGHT_OPS:
+                    weights.add(node.name)
+                    pending = []
+                    break
+                if consumer.op == 'Identity':
+                    pending.append(consumer.name)
+    return weights
+
+
+def quantize_weights_int8(weights):
+    """
+    Symmetric int8 weights with one scale per output channel (last axis; one scale
+    for tensors of rank < 2). Returns (int8 values, float32 scales).
+    """
+    if weights.ndim >= 2:
+        max_abs = np.abs(weights).max(axis=tuple(range(weights.ndim - 1)))
+    else:
+        max_abs = np.abs(weights).max()
+    scale = np.where(max_abs > 0, max_abs / INT8_MAX, 1.0).astype(np.float32)
+    values = np.clip(np.rint(weights / scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return values, scale
+
+
+def quantize_graph_def(graph_def, precision, min_elements=DEFAULT_MIN_ELEMENTS):
+    """
+    Weight-only quantization of a frozen GraphDef.
+    Returns (quantized_graph_def, report) - report counts the rewritten tensors and their bytes,
+    and the large float constants left in float32 because they aren't layer weights.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision {precision!r} (expected one of {", ".join(PRECISIONS)})')
+    report = {'precision': precision, 'tensors': 0, 'weight_bytes_before': 0, 'weight_bytes_after': 0,
+              'skipped_non_weight': 0}
+    if precision == 'fp32':
+        return graph_def, report
+
+    names = {node.name for node in graph_def.node}
+    weight_names = weight_constants(graph_def)
+    output = tf.compat.v1.GraphDef()
+    output.versions.CopyFrom(graph_def.versions)
+    output.library.CopyFrom(graph_def.library)
+
+    for node in graph_def.node:
+        if node.op != 'Const' or node.attr['dtype'].type != tf.float32.as_datatype_enum:
+            output.node.append(node)
+            continue
+        weights = tf.make_ndarray(node.attr['value'].tensor)
+        if weights.size < min_elements or any(f'{node.name}/{suffix}' in names
+                                              for suffix in ('quantized', 'scale', 'dequantized')):
+            output.node.append(node)
+            continue
+        if node.name not in weight_names:
+            report['skipped_non_weight'] += 1
+            output.node.append(node)
+            continue
+
+        if precision == 'fp16':
+            stored = _const_node(f'{node.name}/quantized', weights.astype(np.float16), node.device)
+            output.node.extend([stored, _cast_node(node.name, stored.name, tf.float16, node.device)])
+            stored_bytes = weights.size * 2
+        else:
+            values, scale = quantize_weights_int8(weights)
+            stored = _const_node(f'{node.name}/quantized', values, node.device)
+            scale_node = _const_node(f'{node.name}/scale', scale, node.device)
+            cast = _cast_node(f'{node.name}/dequantized', stored.name, tf.int8, node.device)
+            mul = tf.compat.v1.NodeDef(name=node.name, op='Mul', input=[cast.name, scale_node.name],
+                                       device=node.device)
+            mul.attr['T'].type = tf.float32.as_datatype_enum
+            output.node.extend([stored, scale_node, cast, mul])
+            stored_bytes = values.nbytes + scale.nbytes
+
+        report['tensors'] += 1
+        report['weight_bytes_before'] += weights.nbytes
+        report['weight_bytes_after'] += stored_bytes
+    return output, report
+
+
+def prepare_quantized_model(model_path, precision, cache_dir, min_elements=DEFAULT_MIN_ELEMENTS):
+    """
+    Return info about the reduced-precision variant of model_path, building and caching it
+    if needed. 'path' is the file to load (model_path itself for fp32).
+    """
+    info = {'precision': precision, 'path': model_path, 'source_path': model_path, 'cache_hit': False}
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision {precision!r} (expected one of {", ".join(PRECISIONS)})')
+    if precision == 'fp32':
+        return info
+
+    source_sha256 = hash_model_file(model_path)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    key = f'{stem}-{source_sha256[:16]}-{precision}-m{min_elements}-q{QUANTIZE_VERSION}'
+    quantized_path = os.path.join(cache_dir, f'{key}.pb')
+    record_path = os.path.join(cache_dir, f'{key}.json')
+
+    if os.path.exists(record_path) and os.path.exists(quantized_path):
+        try:
+            with open(record_path) as f:
+                info.update(json.load(f), path=quantized_path, cache_hit=True)
+            logger.info(f'Using cached {precision} model: {quantized_path}')
+            return info
+        except (OSError, ValueError) as e:
+            logger.warning(f'Ignoring unreadable quantized-model record {record_path}: {e}')
+
+    logger.info(f'Building {precision} weight variant of {model_path}...')
+    start = time.perf_counter()
+    quantized_def, record = quantize_graph_def(read_graph_def(model_path), precision, min_elements)
+    data = quantized_def.SerializeToString()
+    record.update({
+        'source_sha256': source_sha256,
+        'quantize_version': QUANTIZE_VERSION,
+        'min_elements': min_elements,
+        'size_before': os.path.getsize(model_path),
+        'size_after': len(data),
+        'quantize_seconds': round(time.perf_counter() - start, 3)
+    })
+
+    # Sessions (and worker processes) load the graph from disk, so an unwritable cache is an error here
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_atomic(quantized_path, data)
+    _write_atomic(record_path, json.dumps(record, indent=2).encode())
+
+    info.update(record, path=quantized_path)
+    logger.info(f'{precision} model: {record["tensors"]} weight tensors, '
+                f'{record["size_before"] / 1e6:.1f}MB -> {record["size_after"] / 1e6:.1f}MB '
+                f'in {record["quantize_seconds"]}s')
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a weight-only float16/int8 variant of a frozen graph')
+    parser.add_argument('model', help='Frozen inference graph (.pb)')
+    parser.add_argument('--precision', choices=PRECISIONS[1:], default='int8')
+    parser.add_argument('--output', default=None,
+                        help='Output path (default: <model>-<precision>.pb next to the model)')
+    parser.add_argument('--min-elements', type=int, default=DEFAULT_MIN_ELEMENTS,
+                        help='Smallest float constant that is quantized')
+    args = parser.parse_args()
+
+    output = args.output or f'{os.path.splitext(args.model)[0]}-{args.precision}.pb'
+    quantized_def, report = quantize_graph_def(read_graph_def(args.model), args.precision, args.min_elements)
+    data = quantized_def.SerializeToString()
+    _write_atomic(output, data)
+    print(f'{report["tensors"]} weight tensors quantized to {args.precision}: '
+          f'{os.path.getsize(args.model) / 1e6:.2f}MB -> {len(data) / 1e6:.2f}MB ({output})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Content-addressed detection result cache
+
+Clients often re-submit the same photo (retries, UI refreshes). Results are
+cached under a hash of the uploaded image bytes plus everything that affects
+the output (thresholds, NMS settings, model identity), so a repeat upload
+skips decode, preprocessing and sess.run entirely.
+
+Entries are evicted least-recently-used first once the memory budget is
+exceeded, and expire after a fixed TTL.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Read multipart upload streams in chunks when hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_image_source(image_source):
+    """
+    Hash raw image bytes or a seekable file-like object.
+    File-like sources are rewound afterwards so they can still be decoded.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        digest.update(image_source)
+    else:
+        start = image_source.tell()
+        for chunk in iter(lambda: image_source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        image_source.seek(start)
+    return digest.hexdigest()
+
+
+def make_cache_key(image_hash, *settings):
+    """Combine the image hash with the settings that affect detection output"""
+    return image_hash + '|' + '|'.join(str(s) for s in settings)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a memory budget and TTL.
+
+    Args:
+        max_bytes: Approximate memory budget for cached results
+        ttl_seconds: How long a cached result stays valid
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl_seconds=300):
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl_seconds)
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value or None (expired entries count as misses)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._size -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a JSON-serializable value, evicting LRU entries to stay within budget"""
+        size = len(key) + len(json.dumps(value, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': True,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
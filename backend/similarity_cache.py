@@ -0,0 +1,206 @@
+"""
+Near-duplicate frame cache keyed by perceptual hash
+
+Tank cameras send frames that are almost identical but never byte-identical,
+so the content-addressed result cache never hits for them. Each frame gets a
+64-bit difference hash (dHash) of a 9x8 grayscale thumbnail - cheap, since
+JPEGs decode at 1/8 scale for it - and is looked up among the last few frames
+of the same camera/session. A frame within max_distance bits (Hamming
+distance) of a recent one reuses that frame's detections.
+
+The hash only records which of two neighbouring thumbnail pixels is brighter,
+so in a scene dominated by a lighting gradient it barely changes when a fish
+swims in (every bit is set by the gradient either way). Frames therefore also
+carry a 16x16 grayscale thumbnail, and a match additionally needs every cell
+of it to be within max_thumbnail_difference of the recent frame's, after
+evening out a global brightness change.
+
+An entry is reused at most refresh_every times before the frame is detected
+again, so slow changes (a fish drifting into view) are still picked up, and
+entries expire after a TTL. Cameras are evicted least-recently-used first.
+"""
+
+import io
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+from PIL import Image
+
+# dHash compares horizontally adjacent pixels of a (HASH_SIZE + 1) x HASH_SIZE thumbnail
+HASH_SIZE = 8
+
+# Side length of the grayscale thumbnail compared alongside the hash
+THUMBNAIL_SIZE = 16
+
+
+def _gray_thumbnails(image_source, sizes):
+    """
+    Grayscale [height, width] int16 thumbnails of an image, one per (width, height) in sizes,
+    from a single draft decode. File-like sources are rewound afterwards.
+    """
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(image_source)
+        start = None
+    else:
+        stream = image_source
+        start = stream.tell()
+
+    try:
+        image = Image.open(stream)
+        image.draft('L', (max(width for width, _ in sizes), max(height for _, height in sizes)))
+        image = image.convert('L')
+        return [np.asarray(image.resize(size, Image.Resampling.BILINEAR), dtype=np.int16) for size in sizes]
+    finally:
+        if start is not None:
+            stream.seek(start)
+
+
+def _dhash(pixels):
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def perceptual_hash(image_source, hash_size=HASH_SIZE):
+    """
+    Difference hash of an image as an int of hash_size * hash_size bits.
+    File-like sources are rewound so the image can still be fully decoded afterwards.
+    """
+    (pixels,) = _gray_thumbnails(image_source, [(hash_size + 1, hash_size)])
+    return _dhash(pixels)
+
+
+def frame_signature(image_source, hash_size=HASH_SIZE, thumbnail_size=THUMBNAIL_SIZE):
+    """(difference hash, grayscale thumbnail) of a frame, for SimilarityCache.get/put"""
+    pixels, thumbnail = _gray_thumbnails(image_source, [(hash_size + 1, hash_size),
+                                                        (thumbnail_size, thumbnail_size)])
+    return _dhash(pixels), thumbnail
+
+
+def thumbnail_difference(thumbnail_a, thumbnail_b):
+    """
+    Largest per-pixel difference (0-255) between two thumbnails once their mean difference
+    is subtracted, so a uniform brightness change doesn't count but a new local object does
+    """
+    difference = thumbnail_a.astype(np.float32) - thumbnail_b
+    return float(np.max(np.abs(difference - difference.mean())))
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count('1')  # int.bit_count() needs Python 3.10
+
+
+class _Entry:
+    __slots__ = ('phash', 'thumbnail', 'settings', 'value', 'expires_at', 'reuses')
+
+    def __init__(self, phash, thumbnail, settings, value, expires_at):
+        self.phash = phash
+        self.thumbnail = thumbnail
+        self.settings = settings
+        self.value = value
+        self.expires_at = expires_at
+        self.reuses = 0
+
+
+class SimilarityCache:
+    """
+    Thread-safe per-camera index of recent frame hashes and their detections.
+
+    Args:
+        max_distance: Largest Hamming distance (of 64 bits) at which a frame counts as a duplicate
+        refresh_every: Reuses of one entry before the frame is detected again (0 = no limit)
+        ttl_seconds: How long an entry can be reused
+        entries_per_camera: Recent frames kept per camera/session
+        max_cameras: Cameras/sessions tracked; the least recently seen is dropped beyond this
+        max_thumbnail_difference: Largest thumbnail pixel difference (0-255) at which a frame counts
+            as a duplicate, when thumbnails are given (0 = only compare hashes)
+    """
+
+    def __init__(self, max_distance=4, refresh_every=10, ttl_seconds=30, entries_per_camera=8, max_cameras=256,
+                 max_thumbnail_difference=12.0):
+        self.max_distance = int(max_distance)
+        self.max_thumbnail_difference = float(max_thumbnail_difference)
+        self.refresh_every = int(refresh_every)
+        self.ttl = float(ttl_seconds)
+        self.entries_per_camera = max(1, int(entries_per_camera))
+        self.max_cameras = max(1, int(max_cameras))
+        self._cameras = OrderedDict()  # camera key -> deque of _Entry, newest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _similar(self, entry, phash, thumbnail):
+        """Hamming distance to entry if the frames count as duplicates, else None"""
+        distance = hamming_distance(phash, entry.phash)
+        if distance > self.max_distance:
+            return None
+        if (self.max_thumbnail_difference > 0 and thumbnail is not None and entry.thumbnail is not None
+                and thumbnail_difference(thumbnail, entry.thumbnail) > self.max_thumbnail_difference):
+            return None
+        return distance
+
+    def get(self, camera, phash, settings, thumbnail=None):
+        """
+        Detections of the closest recent frame within max_distance (and max_thumbnail_difference),
+        as (value, distance), or None if there is none or it has been reused refresh_every times already
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = self._cameras.get(camera)
+            best, best_distance = None, None
+            if entries is not None:
+                self._cameras.move_to_end(camera)
+                for entry in entries:
+                    if entry.expires_at <= now or entry.settings != settings:
+                        continue
+                    distance = self._similar(entry, phash, thumbnail)
+                    if distance is not None and (best is None or distance < best_distance):
+                        best, best_distance = entry, distance
+            if best is None:
+                self.misses += 1
+                return None
+            if self.refresh_every and best.reuses >= self.refresh_every:
+                self.refreshes += 1
+                return None
+            best.reuses += 1
+            self.hits += 1
+            return best.value, best_distance
+
+    def put(self, camera, phash, settings, value, thumbnail=None):
+        """Index a freshly detected frame; it replaces older entries it is a near-duplicate of"""
+        now = time.monotonic()
+        with self._lock:
+            entries = self._cameras.pop(camera, None) or deque()
+            entries = deque(
+                (entry for entry in entries
+                 if entry.expires_at > now and not (entry.settings == settings and
+                                                    self._similar(entry, phash, thumbnail) is not None)),
+                maxlen=self.entries_per_camera
+            )
+            entries.appendleft(_Entry(phash, thumbnail, settings, value, now + self.ttl))
+            self._cameras[camera] = entries
+            while len(self._cameras) > self.max_cameras:
+                self._cameras.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cameras.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.refreshes
+            return {
+                'enabled': True,
+                'cameras': len(self._cameras),
+                'entries': sum(len(entries) for entries in self._cameras.values()),
+                'max_distance': self.max_distance,
+                'max_thumbnail_difference': self.max_thumbnail_difference,
+                'refresh_every': self.refresh_every,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
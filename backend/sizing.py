@@ -0,0 +1,253 @@
+"""
+Fish length/width measurement and size classification
+
+Turns normalized detection boxes into centimetres with a pixels-per-cm
+calibration (given per request, looked up per camera, or derived from a
+reference object of known length) and classifies every fish against the
+FishSizeRange table in one vectorized pass. The ranges are kept as a
+sorted index that can be reloaded from a JSON or SQL export of the table.
+
+Classification follows the client (FishDetectionModal.classifyFishSize):
+the first range that contains both length and width wins; otherwise a range
+within a 20% margin, then the closest range centre - but the largest range
+is only ever assigned on an exact fit.
+
+Boxes are in format [y1, x1, y2, x2] (normalized 0-1).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Defaults from database/complete_migration.sql
+DEFAULT_SIZE_RANGES = [
+    {'category': 'Small', 'min_length': 0.0, 'max_length': 5.0, 'min_width': 0.0, 'max_width': 2.0},
+    {'category': 'Medium', 'min_length': 5.1, 'max_length': 10.0, 'min_width': 2.1, 'max_width': 4.0},
+    {'category': 'Large', 'min_length': 10.1, 'max_length': 999.99, 'min_width': 4.1, 'max_width': 999.99},
+]
+
+# Fallback margin around a range, as a fraction of its span
+RANGE_MARGIN = 0.2
+
+_FIELDS = ('min_length', 'max_length', 'min_width', 'max_width')
+_CAMEL_FIELDS = {'minLength': 'min_length', 'maxLength': 'max_length', 'minWidth': 'min_width', 'maxWidth': 'max_width'}
+
+
+class SizeRangeIndex:
+    """Immutable, sorted (by min_length) set of size ranges with vectorized classification"""
+
+    def __init__(self, ranges):
+        rows = []
+        for item in ranges:
+            row = {_CAMEL_FIELDS.get(key, key): value for key, value in item.items()}
+            if not row.get('category'):
+                raise ValueError(f'Size range without a category: {item}')
+            rows.append({
+                'category': str(row['category']),
+                # Open-ended upper bounds (null in the API) accept anything
+                **{field: float(row[field]) if row.get(field) is not None
+                   else (np.inf if field.startswith('max') else 0.0) for field in _FIELDS}
+            })
+        if not rows:
+            raise ValueError('No size ranges')
+
+        rows.sort(key=lambda r: (r['min_length'], r['min_width']))
+        self.categories = [r['category'] for r in rows]
+        self.min_length, self.max_length, self.min_width, self.max_width = (
+            np.array([r[field] for r in rows], dtype=np.float64) for field in _FIELDS
+        )
+
+    def to_list(self):
+        return [
+            {
+                'category': category,
+                **{field: (None if np.isinf(v) else float(v)) for field, v in
+                   zip(_FIELDS, (self.min_length[i], self.max_length[i], self.min_width[i], self.max_width[i]))}
+            }
+            for i, category in enumerate(self.categories)
+        ]
+
+    def classify(self, lengths, widths):
+        """[N] lengths and widths in cm -> [N] indices into self.categories"""
+        lengths = np.asarray(lengths, dtype=np.float64)[:, None]
+        widths = np.asarray(widths, dtype=np.float64)[:, None]
+        if lengths.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        inside = ((lengths >= self.min_length) & (lengths <= self.max_length) &
+                  (widths >= self.min_width) & (widths <= self.max_width))
+        result = np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+        # The largest range is only assigned on an exact fit
+        candidates = max(1, len(self.categories) - 1)
+        min_l, max_l = self.min_length[:candidates], self.max_length[:candidates]
+        min_w, max_w = self.min_width[:candidates], self.max_width[:candidates]
+
+        unmatched = result < 0
+        if unmatched.any():
+            margin_l = (max_l - min_l) * RANGE_MARGIN
+            margin_w = (max_w - min_w) * RANGE_MARGIN
+            near = ((lengths >= min_l - margin_l) & (lengths <= max_l + margin_l) &
+                    (widths >= min_w - margin_w) & (widths <= max_w + margin_w))
+            result = np.where(unmatched & near.any(axis=1), near.argmax(axis=1), result)
+
+        unmatched = result < 0
+        if unmatched.any():
+            distance = np.hypot(lengths - (min_l + max_l) / 2, widths - (min_w + max_w) / 2)
+            result = np.where(unmatched, distance.argmin(axis=1), result)
+        return result
+
+    def histogram(self, indices):
+        """Fish count per category (every category present, in index order)"""
+        counts = np.bincount(np.asarray(indices, dtype=np.int64), minlength=len(self.categories))
+        return {category: int(count) for category, count in zip(self.categories, counts)}
+
+
+def parse_sql_ranges(sql):
+    """Size ranges from the INSERT statements for fish_size_ranges in a SQL dump"""
+    ranges = []
+    pattern = re.compile(r'INSERT\s+(?:IGNORE\s+)?INTO\s+`?fish_size_ranges`?\s*\(([^)]*)\)\s*VALUES\s*(.*?);',
+                         re.IGNORECASE | re.DOTALL)
+    for columns, values in pattern.findall(sql):
+        names = [name.strip().strip('`') for name in columns.split(',')]
+        for row in re.findall(r'\(([^)]*)\)', values):
+            fields = [field.strip().strip("'\"") for field in re.findall(r"'[^']*'|[^,]+", row)]
+            item = dict(zip(names, fields))
+            ranges.append({key: (None if value.upper() == 'NULL' else value) for key, value in item.items()
+                           if key == 'category' or key in _FIELDS})
+    return ranges
+
+
+def load_size_ranges(path):
+    """
+    Read size ranges from a JSON export (a list, or the {"data": [...]} returned by
+    /api/records?action=get_fish_ranges) or from a SQL dump with INSERTs into fish_size_ranges
+    """
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    if path.lower().endswith('.sql'):
+        return SizeRangeIndex(parse_sql_ranges(content))
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = data.get('data', data.get('ranges', []))
+    return SizeRangeIndex(data)
+
+
+class SizeRangeStore:
+    """
+    Holds the current SizeRangeIndex. When backed by a file, it is reloaded
+    when the file changes (checked at most every check_interval seconds) or on demand.
+    """
+
+    def __init__(self, path=None, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = SizeRangeIndex(DEFAULT_SIZE_RANGES)
+        self._source = 'default'
+        self._mtime = None
+        self._last_check = 0.0
+        self._loaded_at = time.time()
+        if path:
+            self.reload()
+
+    def reload(self):
+        """Re-read the ranges file; keeps the current index if it can't be loaded. Returns True on success"""
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+            index = load_size_ranges(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Could not load size ranges from {self.path}: {e}')
+            return False
+        with self._lock:
+            self._index = index
+            self._source = self.path
+            self._mtime = mtime
+            self._loaded_at = time.time()
+        logger.info(f'Loaded {len(index.categories)} size ranges from {self.path}')
+        return True
+
+    def get(self):
+        if self.path:
+            now = time.monotonic()
+            if now - self._last_check >= self.check_interval:
+                self._last_check = now
+                try:
+                    changed = os.path.getmtime(self.path) != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self.reload()
+        with self._lock:
+            return self._index
+
+    def stats(self):
+        with self._lock:
+            return {
+                'source': self._source,
+                'loaded_at': self._loaded_at,
+                'ranges': self._index.to_list()
+            }
+
+
+def reference_pixels_per_cm(reference, image_width, image_height):
+    """
+    Calibration from a reference object in the image: {"bbox": [y1, x1, y2, x2] normalized,
+    "length_cm": real length of its longer side}
+    """
+    y1, x1, y2, x2 = (float(v) for v in reference['bbox'])
+    length_px = max((x2 - x1) * image_width, (y2 - y1) * image_height)
+    length_cm = float(reference['length_cm'])
+    if length_px <= 0 or length_cm <= 0:
+        raise ValueError('Reference object needs a non-empty bbox and a positive length_cm')
+    return length_px / length_cm
+
+
+def load_camera_calibration(path):
+    """
+    Per-camera calibration from a JSON file: {"<camera_id>": <pixels per cm>} or
+    {"<camera_id>": {"pixels_per_cm": ...}}, optionally wrapped in {"cameras": {...}}
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get('cameras'), dict):
+        data = data['cameras']
+    calibration = {}
+    for camera_id, entry in data.items():
+        value = entry.get('pixels_per_cm') if isinstance(entry, dict) else entry
+        pixels_per_cm = float(value)
+        if pixels_per_cm <= 0:
+            raise ValueError(f'Camera {camera_id}: pixels_per_cm must be positive')
+        calibration[str(camera_id)] = pixels_per_cm
+    return calibration
+
+
+def measure_detections(detections, image_width, image_height, pixels_per_cm, index):
+    """
+    Add length_cm, width_cm and size_category to detections (new dicts - cached results stay untouched).
+    Length is the box's longer side, width the shorter one, both in original image pixels.
+    Returns (measured detections, size histogram).
+    """
+    if not detections:
+        return [], index.histogram([])
+    boxes = np.array([det['bbox'] for det in detections], dtype=np.float64)
+    sides = np.stack([(boxes[:, 3] - boxes[:, 1]) * image_width, (boxes[:, 2] - boxes[:, 0]) * image_height], axis=1)
+    lengths = sides.max(axis=1) / pixels_per_cm
+    widths = sides.min(axis=1) / pixels_per_cm
+    categories = index.classify(lengths, widths)
+
+    measured = [
+        dict(det, length_cm=round(float(length), 2), width_cm=round(float(width), 2),
+             size_category=index.categories[category])
+        for det, length, width, category in zip(detections, lengths, widths, categories)
+    ]
+    return measured, index.histogram(categories)
@@ -36,7 +36,39 @@ from PIL import Image
 import io
 import base64
 import time
-from functools import lru_cache
+import threading
+import json
+import struct
+import tarfile
+import zipfile
+import tempfile
+import random
+import hmac
+import functools
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from flask import Response, stream_with_context, g, send_file
+from werkzeug.exceptions import HTTPException
+
+from batching import BatchScheduler
+from admission import (AdmissionController, QueueFullError, DeadlineExceededError, parse_deadline,
+                       deadline_expired)
+from postprocess import postprocess_detections, filter_detections, nms_detections, NMS_METHODS
+from result_cache import ResultCache, hash_image_source, make_cache_key
+from similarity_cache import SimilarityCache, frame_signature
+from model_loader import InferenceEngine
+from letterbox import parse_buckets, choose_bucket, letterbox, unletterbox_boxes
+from tiling import tile_windows, tile_budget_scale, tile_to_image_boxes, truncated_by_tile, merge_tile_detections
+from graph_optimizer import prepare_optimized_model
+from quantize import PRECISIONS, prepare_quantized_model
+from profiling import RequestTrace, TraceStore, activate, current_trace, record_stage
+from sizing import SizeRangeStore, load_camera_calibration, reference_pixels_per_cm, measure_detections
+from worker_pool import WorkerPool
+from model_registry import ModelRegistry, LoadedModel
+from tracking import StreamSessionManager
+from metrics import MetricsRegistry, process_rss_bytes
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Next.js frontend
@@ -63,147 +95,417 @@ CONFIDENCE_THRESHOLD = float(os.getenv('CONFIDENCE_THRESHOLD', '0.5'))  # Increa
 NMS_THRESHOLD = float(os.getenv('NMS_THRESHOLD', '0.4'))  # IoU threshold for Non-Maximum Suppression
 MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', '1280'))  # Max dimension for optimization (web-optimized)
 PORT = int(os.getenv('PORT', '5000'))
+MIN_BOX_SIZE = int(os.getenv('MIN_BOX_SIZE', '20'))  # Minimum box dimension in pixels (filters false positives)
+
+# NMS variant: 'hard' (default), 'soft_linear' or 'soft_gaussian'
+NMS_METHOD = os.getenv('NMS_METHOD', 'hard').lower()
+if NMS_METHOD not in NMS_METHODS:
+    logger.warning(f'Unknown NMS_METHOD "{NMS_METHOD}", falling back to hard NMS')
+    NMS_METHOD = 'hard'
+NMS_CLASS_AWARE = os.getenv('NMS_CLASS_AWARE', 'false').lower() in ('1', 'true', 'yes')  # Only suppress boxes of the same class
+SOFT_NMS_SIGMA = float(os.getenv('SOFT_NMS_SIGMA', '0.5'))  # Spread for gaussian soft-NMS
 
 # Web optimization: Process images at lower resolution for faster inference
 # Original model may expect larger images, but we optimize for web performance
-PROCESSING_RESOLUTION = int(os.getenv('PROCESSING_RESOLUTION', '640'))  # Default processing size
+PROCESSING_RESOLUTION = int(os.getenv('PROCESSING_RESOLUTION', '640'))  # Default processing size (0 = only MAX_IMAGE_SIZE applies)
+TARGET_IMAGE_SIZE = min(MAX_IMAGE_SIZE, PROCESSING_RESOLUTION) if PROCESSING_RESOLUTION > 0 else MAX_IMAGE_SIZE
+
+# Resampling filter for downscaling: lanczos (best quality), bicubic, bilinear, box or nearest (fastest)
+RESIZE_FILTERS = {
+    'lanczos': Image.Resampling.LANCZOS,
+    'bicubic': Image.Resampling.BICUBIC,
+    'bilinear': Image.Resampling.BILINEAR,
+    'box': Image.Resampling.BOX,
+    'nearest': Image.Resampling.NEAREST,
+}
+RESIZE_FILTER_NAME = os.getenv('RESIZE_FILTER', 'lanczos').lower()
+if RESIZE_FILTER_NAME not in RESIZE_FILTERS:
+    logger.warning(f'Unknown RESIZE_FILTER "{RESIZE_FILTER_NAME}", falling back to lanczos')
+    RESIZE_FILTER_NAME = 'lanczos'
+RESIZE_FILTER = RESIZE_FILTERS[RESIZE_FILTER_NAME]
+RESIZE_REDUCING_GAP = float(os.getenv('RESIZE_REDUCING_GAP', '3.0'))  # Lower is faster, higher is closer to a plain resize
+
+# Shape bucketing: letterbox inputs into a few fixed canvas sizes so sess.run only sees (and warms up) those shapes
+# "auto" (square, 4:3, 3:4 at the processing resolution), a list like "640x480,480x640", or empty to disable
+SHAPE_BUCKETS_SPEC = os.getenv('SHAPE_BUCKETS', '').strip()
+try:
+    SHAPE_BUCKETS = parse_buckets(SHAPE_BUCKETS_SPEC, TARGET_IMAGE_SIZE) if SHAPE_BUCKETS_SPEC else []
+except ValueError as e:
+    logger.warning(f'{e} - shape bucketing disabled')
+    SHAPE_BUCKETS = []
+
+# EXIF orientation tag and the transpose that undoes each orientation value
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSE_METHODS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Content types accepted as a raw image request body (no base64/JSON wrapping)
+RAW_IMAGE_MIMETYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+# Tiled high-resolution inference: overlapping full-resolution tiles instead of one downscaled image
+# "off", "auto" (images whose longest side exceeds TILE_AUTO_MIN_SIZE) or "always"; /detect?tiled=... overrides
+TILED_MODE = os.getenv('TILED_MODE', 'off').lower()
+if TILED_MODE not in ('off', 'auto', 'always'):
+    logger.warning(f'Unknown TILED_MODE "{TILED_MODE}", tiling disabled')
+    TILED_MODE = 'off'
+TILE_SIZE = int(os.getenv('TILE_SIZE', '640'))  # Tile side in pixels
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', '0.2'))  # Fraction of a tile shared with its neighbour
+TILE_AUTO_MIN_SIZE = int(os.getenv('TILE_AUTO_MIN_SIZE', '1600'))
+TILE_MAX_IMAGE_SIZE = int(os.getenv('TILE_MAX_IMAGE_SIZE', '4096'))  # Longest side decoded for tiling
+TILE_MAX_TILES = int(os.getenv('TILE_MAX_TILES', '24'))  # Images needing more tiles are downscaled until they fit
+TILE_BATCH_SIZE = int(os.getenv('TILE_BATCH_SIZE', '4'))  # Tiles per sess.run
+TILE_MAX_CONCURRENT = int(os.getenv('TILE_MAX_CONCURRENT', '2'))  # Tiled requests processed at once
+TILE_INCLUDE_FULL_IMAGE = os.getenv('TILE_INCLUDE_FULL_IMAGE', 'true').lower() in ('1', 'true', 'yes')  # Also detect on the downscaled image (fish larger than a tile)
+TILE_MERGE_IOU = float(os.getenv('TILE_MERGE_IOU', '0.5'))  # Overlap at which boxes from different tiles are fused
+
+# Dynamic micro-batching: concurrent /detect requests are grouped into one sess.run
+# Only images of the same size can share a batch, so "auto" (the default) batches only with SHAPE_BUCKETS;
+# without buckets nearly every batch would hold one image and just add BATCH_TIMEOUT_MS of latency
+ENABLE_BATCHING_SPEC = os.getenv('ENABLE_BATCHING', 'auto').lower()
+if ENABLE_BATCHING_SPEC == 'auto':
+    ENABLE_BATCHING = bool(SHAPE_BUCKETS)
+else:
+    ENABLE_BATCHING = ENABLE_BATCHING_SPEC in ('1', 'true', 'yes')
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))  # Max images per sess.run
+BATCH_TIMEOUT_MS = float(os.getenv('BATCH_TIMEOUT_MS', '10'))  # Latency budget for collecting a batch
+
+# Admission control: bound pending work and drop requests whose client deadline has passed
+MAX_PENDING_REQUESTS = int(os.getenv('MAX_PENDING_REQUESTS', '64'))  # Inference requests in the server at once (0 = unlimited)
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '64'))  # Images waiting for the batch scheduler (0 = unbounded)
+DEFAULT_REQUEST_TIMEOUT_MS = float(os.getenv('DEFAULT_REQUEST_TIMEOUT_MS', '0'))  # Deadline for requests without a deadline header (0 = none)
+# Streaming endpoints hold one admission slot for the whole request and check the deadline per image
+ADMISSION_ENDPOINTS = ('detect', 'stream_frame', 'detect_batch', 'stream_chunked')
+
+# Streaming detection: full detector every k frames (or on scene change), tracker in between
+STREAM_DETECT_EVERY = int(os.getenv('STREAM_DETECT_EVERY', '5'))
+STREAM_SCENE_CHANGE_THRESHOLD = float(os.getenv('STREAM_SCENE_CHANGE_THRESHOLD', '12'))  # Mean thumbnail pixel difference (0-255)
+STREAM_SESSION_TTL = float(os.getenv('STREAM_SESSION_TTL', '60'))  # Seconds before an idle stream session is dropped
+STREAM_MAX_SESSIONS = int(os.getenv('STREAM_MAX_SESSIONS', '100'))
+STREAM_MAX_FRAME_BYTES = int(os.getenv('STREAM_MAX_FRAME_BYTES', str(20 * 1024 * 1024)))
+
+# Batch endpoint: images are decoded in parallel and fed through the same (batched) inference path
+BATCH_DECODE_WORKERS = int(os.getenv('BATCH_DECODE_WORKERS', '4'))  # Images processed concurrently per batch request
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '500'))  # Maximum images per batch request
+BATCH_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')  # Archive members treated as images
+ARCHIVE_MIMETYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip', 'application/zip',
+                     'application/x-zip-compressed')
+
+# Multi-process inference: 0 runs a single in-process session, N > 0 pre-forks N worker processes
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '0'))
+THREADS_PER_WORKER = int(os.getenv('THREADS_PER_WORKER', '2'))  # TensorFlow inter/intra-op threads per session
+WORKER_STARTUP_TIMEOUT = float(os.getenv('WORKER_STARTUP_TIMEOUT', '300'))  # Seconds to wait for workers to load the model
+
+# Per-request TensorFlow profiling (FULL_TRACE sess.run -> Chrome trace files)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # Fraction of requests profiled at random
+PROFILE_ALLOW_REQUEST_FLAG = os.getenv('PROFILE_ALLOW_REQUEST_FLAG', 'false').lower() in ('1', 'true', 'yes')  # Honour ?profile=true from admins
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_MAX_TRACES = int(os.getenv('PROFILE_MAX_TRACES', '50'))  # Oldest traces are deleted beyond this
+
+# Admin endpoints (/profiles, /models, /sizing/reload) and ?profile=true require X-Admin-Token; disabled when unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', None)
+
+# Model registry: the MODEL_PATH model is "default"; a candidate can get a share of traffic or shadow traffic
+MODEL_CANDIDATE_PATH = os.getenv('MODEL_CANDIDATE_PATH', None)  # Loaded in the background after the default model
+MODEL_CANDIDATE_PERCENT = float(os.getenv('MODEL_CANDIDATE_PERCENT', '0'))  # Share of requests served by the candidate
+MODEL_CANDIDATE_SHADOW = os.getenv('MODEL_CANDIDATE_SHADOW', 'false').lower() in ('1', 'true', 'yes')  # Mirror requests to it instead
+MODEL_CANDIDATE_PRECISION = os.getenv('MODEL_CANDIDATE_PRECISION', '').lower() or None  # Weight precision of the candidate (default: MODEL_PRECISION)
+SHADOW_QUEUE_SIZE = int(os.getenv('SHADOW_QUEUE_SIZE', '8'))  # Shadow runs waiting before copies are dropped
+DEFAULT_MODEL_NAME = 'default'
+CANDIDATE_MODEL_NAME = 'candidate'
+
+# Serving: 'threaded' (Flask development server) or 'async' (uvicorn event loop + handler thread pool)
+SERVER_MODE = os.getenv('SERVER_MODE', 'threaded').lower()
+if SERVER_MODE not in ('threaded', 'async'):
+    raise ValueError(f'Unknown SERVER_MODE "{SERVER_MODE}" (expected threaded or async)')
+HTTP_WORKER_THREADS = int(os.getenv('HTTP_WORKER_THREADS', '32'))  # Request handlers running at once (decode, inference wait)
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', '2048'))  # Open connections before new ones get 503 (0 = unlimited)
+KEEP_ALIVE_SECONDS = float(os.getenv('KEEP_ALIVE_SECONDS', '75'))  # Idle keep-alive connection timeout
+SHUTDOWN_GRACE_SECONDS = float(os.getenv('SHUTDOWN_GRACE_SECONDS', '30'))  # In-flight requests get this long to finish on shutdown
+MAX_REQUEST_BODY_MB = float(os.getenv('MAX_REQUEST_BODY_MB', '64'))  # Largest buffered request body (0 = unlimited)
+# Endpoints that read their body incrementally get it streamed instead of buffered
+STREAMING_BODY_ENDPOINTS = ('detect_batch', 'stream_chunked')
+
+# Detection result cache: repeated uploads of the same image skip decode and inference
+ENABLE_RESULT_CACHE = os.getenv('ENABLE_RESULT_CACHE', 'true').lower() in ('1', 'true', 'yes')
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', '32'))  # Memory budget for cached results
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', '300'))  # How long a cached result is valid
+
+# Near-duplicate frames: /detect requests with a camera_id/session_id reuse the detections of a recent similar frame
+ENABLE_SIMILARITY_CACHE = os.getenv('ENABLE_SIMILARITY_CACHE', 'true').lower() in ('1', 'true', 'yes')
+SIMILARITY_MAX_DISTANCE = int(os.getenv('SIMILARITY_MAX_DISTANCE', '4'))  # Differing bits (of 64) for a frame to count as a duplicate
+SIMILARITY_REFRESH_EVERY = int(os.getenv('SIMILARITY_REFRESH_EVERY', '10'))  # Reuses before a full re-detection (0 = no limit)
+SIMILARITY_TTL_SECONDS = float(os.getenv('SIMILARITY_TTL_SECONDS', '30'))  # How long a frame's detections can be reused
+SIMILARITY_ENTRIES_PER_CAMERA = int(os.getenv('SIMILARITY_ENTRIES_PER_CAMERA', '8'))  # Recent frames compared per camera
+SIMILARITY_MAX_CAMERAS = int(os.getenv('SIMILARITY_MAX_CAMERAS', '256'))
+SIMILARITY_MAX_THUMBNAIL_DIFFERENCE = float(os.getenv('SIMILARITY_MAX_THUMBNAIL_DIFFERENCE', '12'))  # Largest 16x16 thumbnail pixel change (0-255) for a duplicate (0 = hash only)
+
+# Load-time graph optimization: the rewritten graph is cached on disk per model hash + TF version
+OPTIMIZE_GRAPH = os.getenv('OPTIMIZE_GRAPH', 'true').lower() in ('1', 'true', 'yes')
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache'))
+
+# Weight precision: 'fp32' (as exported), 'fp16' or 'int8' weight-only variants (built once, cached in MODEL_CACHE_DIR)
+MODEL_PRECISION = os.getenv('MODEL_PRECISION', 'fp32').lower()
+if MODEL_PRECISION not in PRECISIONS:
+    logger.warning(f'Unknown MODEL_PRECISION "{MODEL_PRECISION}", falling back to fp32')
+    MODEL_PRECISION = 'fp32'
+
+# Server-side fish measurement and size classification (/detect?measure=true)
+MEASURE_SIZES = os.getenv('MEASURE_SIZES', 'false').lower() in ('1', 'true', 'yes')  # Measure by default
+SIZE_RANGES_PATH = os.getenv('SIZE_RANGES_PATH', None)  # JSON or SQL export of fish_size_ranges (built-in defaults if unset)
+DEFAULT_PIXELS_PER_CM = float(os.getenv('DEFAULT_PIXELS_PER_CM', '12.5'))  # Same as the client's 0.08 cm per pixel
+CAMERA_CALIBRATION_PATH = os.getenv('CAMERA_CALIBRATION_PATH', None)  # JSON map of camera id -> pixels per cm
 
 # Global variables for model
-detection_graph = None
-sess = None
 model_loaded = False
+model_lock = threading.Lock()  # Serializes load_model() across request threads
+
+result_cache = ResultCache(RESULT_CACHE_MAX_MB * 1024 * 1024, RESULT_CACHE_TTL_SECONDS) if ENABLE_RESULT_CACHE else None
+
+similarity_cache = SimilarityCache(
+    SIMILARITY_MAX_DISTANCE, SIMILARITY_REFRESH_EVERY, SIMILARITY_TTL_SECONDS,
+    SIMILARITY_ENTRIES_PER_CAMERA, SIMILARITY_MAX_CAMERAS, SIMILARITY_MAX_THUMBNAIL_DIFFERENCE
+) if ENABLE_SIMILARITY_CACHE else None
+
+admission = AdmissionController(MAX_PENDING_REQUESTS) if MAX_PENDING_REQUESTS > 0 else None
+
+trace_store = TraceStore(PROFILE_DIR, PROFILE_MAX_TRACES)
+
+size_ranges = SizeRangeStore(SIZE_RANGES_PATH)
+camera_calibration = {}  # camera id -> pixels per cm, see load_calibration()
+
+# Tiled requests hold a slot for their whole run, which bounds peak decode and tile memory
+tile_slots = threading.BoundedSemaphore(max(1, TILE_MAX_CONCURRENT))
+# Tile chunks run in parallel across inference workers (one at a time in-process)
+tile_executor = ThreadPoolExecutor(max(1, INFERENCE_WORKERS), thread_name_prefix='tile-runner')
+
+stream_sessions = StreamSessionManager(
+    STREAM_DETECT_EVERY, STREAM_SCENE_CHANGE_THRESHOLD, STREAM_SESSION_TTL, STREAM_MAX_SESSIONS
+)
+
+# Prometheus metrics (served on /metrics)
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    'fish_detection_stage_seconds',
+    'Time spent per pipeline stage (body_decode, phash, image_decode, resize, letterbox, inference, postprocess, serialize)',
+    ['stage']
+)
+REQUEST_SECONDS = metrics.histogram('fish_detection_request_seconds', 'Request latency by endpoint', ['endpoint'])
+REQUESTS_TOTAL = metrics.counter('fish_detection_requests_total', 'Requests by endpoint and status', ['endpoint', 'status'])
+ERRORS_TOTAL = metrics.counter('fish_detection_errors_total', 'Requests that returned an error status', ['endpoint'])
+DETECTIONS_TOTAL = metrics.counter('fish_detection_detections_total', 'Detections returned after NMS')
+REUSED_TOTAL = metrics.counter('fish_detection_reused_frames_total', 'Frames answered with the detections of a near-duplicate frame')
+BATCH_SIZE = metrics.histogram('fish_detection_batch_size', 'Images per sess.run', buckets=(1, 2, 4, 8, 16, 32, 64))
+IN_FLIGHT = metrics.gauge('fish_detection_in_flight_requests', 'Requests currently being processed')
+REJECTED_TOTAL = metrics.counter(
+    'fish_detection_rejected_requests_total',
+    'Requests turned away: queue_full (429), inference_queue_full (503), deadline (504)',
+    ['reason']
+)
+metrics.gauge(
+    'fish_detection_pending_requests', 'Requests admitted and not yet finished',
+    callback=lambda: admission.pending() if admission is not None else 0
+)
+SIZE_CATEGORY_TOTAL = metrics.counter('fish_detection_size_category_total', 'Measured fish by size category', ['category'])
+BUCKET_TOTAL = metrics.counter('fish_detection_shape_bucket_total', 'Images letterboxed into each shape bucket', ['bucket'])
+metrics.gauge(
+    'fish_detection_queue_depth', 'Images waiting for the batch scheduler',
+    callback=lambda: batch_scheduler.queue_depth() if batch_scheduler is not None else 0
+)
+metrics.gauge('process_resident_memory_bytes', 'Resident memory size in bytes', callback=process_rss_bytes)
+IN_FLIGHT.set(0)
+
+def observe_stage(stage, seconds):
+    """Record a pipeline stage duration (metrics, and the trace of a profiled request)"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    record_stage(stage, seconds)
+
+@contextmanager
+def stage_timer(stage):
+    """observe_stage for the duration of the with-block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def warmup_shapes():
+    """
+    (batch, height, width) inputs to warm up: every shape bucket at batch size 1 and the max batch size,
+    and a full chunk of tiles when tiling is enabled (None: the default single-image warmup)
+    """
+    shapes = []
+    if SHAPE_BUCKETS:
+        batch_sizes = sorted({1, BATCH_MAX_SIZE if ENABLE_BATCHING else 1})
+        shapes.extend((batch, height, width) for width, height in SHAPE_BUCKETS for batch in batch_sizes)
+    if TILED_MODE != 'off':
+        if not shapes:
+            shapes.append((1, 640, 640))
+        shapes.append((max(1, TILE_BATCH_SIZE), TILE_SIZE, TILE_SIZE))
+    return shapes or None
 
 def load_model():
-    """Load the TensorFlow detection model"""
-    global detection_graph, sess, model_loaded
-    
-    # Check if already loaded and session exists
-    if model_loaded and sess is not None and detection_graph is not None:
+    """
+    Load the TensorFlow detection model (or start the inference worker pool).
+    Safe to call from concurrent request threads: the first caller loads, the rest wait for it.
+    """
+    if model_loaded:
         return True
+    with model_lock:
+        if model_loaded:
+            return True
+        return _load_model()
+
+def _load_model():
+    """Load the default model (and start loading the candidate) - caller holds model_lock"""
+    global model_loaded
     
-    try:
-        logger.info(f'Loading model from: {MODEL_PATH}')
-        
-        if not os.path.exists(MODEL_PATH):
-            logger.error(f'Model file not found: {MODEL_PATH}')
-            return False
-        
-        # Use compat.v1 APIs for TensorFlow 2.x compatibility
-        # These APIs work with both TensorFlow 1.x and 2.x
-        detection_graph = tf.compat.v1.Graph()
-        with detection_graph.as_default():
-            od_graph_def = tf.compat.v1.GraphDef()
-            
-            # Read model file using TensorFlow file API
-            # tf.io.gfile.GFile works in TensorFlow 2.x
-            # For compatibility, we can also use tf.compat.v1.gfile.GFile
-            try:
-                # Use tf.io.gfile for TensorFlow 2.x (preferred)
-                with tf.io.gfile.GFile(MODEL_PATH, 'rb') as fid:
-                    serialized_graph = fid.read()
-            except (AttributeError, TypeError):
-                # Fallback: use compat.v1.gfile (works in both TF 1.x and 2.x)
-                try:
-                    with tf.compat.v1.gfile.GFile(MODEL_PATH, 'rb') as fid:
-                        serialized_graph = fid.read()
-                except (AttributeError, TypeError):
-                    # Last resort: standard Python file I/O
-                    logger.warning('Using standard file I/O instead of TensorFlow file API')
-                    with open(MODEL_PATH, 'rb') as fid:
-                        serialized_graph = fid.read()
-            
-            od_graph_def.ParseFromString(serialized_graph)
-            tf.compat.v1.import_graph_def(od_graph_def, name='')
-        
-        # Create session with optimizations for web performance
-        # Use compat.v1 APIs which work with both TensorFlow 1.x and 2.x
-        config = tf.compat.v1.ConfigProto()
-        
-        # GPU optimizations (if available)
-        try:
-            gpu_options = tf.compat.v1.GPUOptions(allow_growth=True)
-            config.gpu_options.CopyFrom(gpu_options)
-        except (AttributeError, TypeError):
-            # GPU options not available or not supported
-            pass
-        
-        # CPU optimizations for web performance
-        config.allow_soft_placement = True
-        config.log_device_placement = False  # Disable logging for performance
-        config.inter_op_parallelism_threads = 2  # Optimize for web requests
-        config.intra_op_parallelism_threads = 2  # Optimize for web requests
-        
-        sess = tf.compat.v1.Session(graph=detection_graph, config=config)
-        logger.info('TensorFlow session created successfully')
-        
-        # Set model_loaded flag after session is created
-        model_loaded = True
-        
-        # Warm up the model (run a dummy inference)
-        logger.info('Warming up model...')
+    if not os.path.exists(MODEL_PATH):
+        logger.error(f'Model file not found: {MODEL_PATH}')
+        return False
+    if not model_registry.load(DEFAULT_MODEL_NAME, MODEL_PATH, activate=True, wait=True):
+        return False
+    model_loaded = True
+    logger.info('✅ Model loaded successfully!')
+    
+    if MODEL_CANDIDATE_PATH or MODEL_CANDIDATE_PRECISION:
+        def route_candidate(model):
+            model_registry.set_candidate(model.name, MODEL_CANDIDATE_PERCENT, MODEL_CANDIDATE_SHADOW)
+            logger.info(f'Candidate model {model.label}: '
+                        f'{"shadow traffic" if MODEL_CANDIDATE_SHADOW else f"{MODEL_CANDIDATE_PERCENT:g}% of traffic"}')
+        # A candidate precision alone canaries a reduced-precision variant of the default model
+        model_registry.load(CANDIDATE_MODEL_NAME, MODEL_CANDIDATE_PATH or MODEL_PATH, on_loaded=route_candidate,
+                            options={'precision': MODEL_CANDIDATE_PRECISION or MODEL_PRECISION})
+    return True
+
+def build_model(name, path, version, precision=None):
+    """
+    Load and warm up one model version for the registry: graph optimization (cached),
+    the reduced-precision variant (cached, default MODEL_PRECISION), then an
+    InferenceEngine or, with INFERENCE_WORKERS, a worker pool
+    """
+    precision = precision or MODEL_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision "{precision}"')
+    logger.info(f'Loading model {name} ({precision}) from: {path}')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'Model file not found: {path}')
+    
+    # Identify the model by path, size and modification time
+    model_stat = os.stat(path)
+    model_id = f'{os.path.abspath(path)}:{model_stat.st_size}:{int(model_stat.st_mtime)}'
+    
+    # Optimize the graph once (or pick up the cached optimized graph)
+    graph_path = path
+    graph_info = {'graph': 'original', 'path': path, 'reason': 'OPTIMIZE_GRAPH disabled'}
+    if OPTIMIZE_GRAPH:
         try:
-            # Get tensor handles for warmup
-            image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
-            boxes_tensor = detection_graph.get_tensor_by_name('detection_boxes:0')
-            scores_tensor = detection_graph.get_tensor_by_name('detection_scores:0')
-            classes_tensor = detection_graph.get_tensor_by_name('detection_classes:0')
-            num_detections_tensor = detection_graph.get_tensor_by_name('num_detections:0')
-            
-            # Create dummy image for warmup
-            dummy_image = np.zeros((640, 640, 3), dtype=np.uint8)
-            dummy_image_expanded = np.expand_dims(dummy_image, axis=0)
-            
-            # Run warmup inference
-            sess.run(
-                [boxes_tensor, scores_tensor, classes_tensor, num_detections_tensor],
-                feed_dict={image_tensor: dummy_image_expanded}
-            )
-            logger.info('Model warmed up successfully')
+            graph_info = prepare_optimized_model(path, MODEL_CACHE_DIR)
+            graph_path = graph_info['path']
         except Exception as e:
-            logger.warning(f'Model warmup failed (non-critical): {str(e)}')
-            # Don't fail if warmup fails - model is still loaded
-            import traceback
-            logger.debug(traceback.format_exc())
-        
-        logger.info('✅ Model loaded successfully!')
-        return True
-        
-    except Exception as e:
-        logger.error(f'Error loading model: {str(e)}')
-        import traceback
-        traceback.print_exc()
-        return False
+            logger.warning(f'Graph optimization unavailable, using original graph: {str(e)}')
+            graph_info = {'graph': 'original', 'path': path, 'reason': f'optimization failed: {e}'}
+    
+    # Quantize the (optimized) graph's weights - after optimization, so folded batch norms are quantized too
+    if precision != 'fp32':
+        quantized_info = prepare_quantized_model(graph_path, precision, MODEL_CACHE_DIR)
+        graph_path = quantized_info['path']
+        graph_info = dict(graph_info, precision=precision, quantization=quantized_info)
+    model_id = f'{model_id}:{graph_info["graph"]}:{precision}'
+    
+    # Multi-process mode: every worker loads and warms up its own session
+    if INFERENCE_WORKERS > 0:
+        pool = WorkerPool(graph_path, INFERENCE_WORKERS, THREADS_PER_WORKER, warmup_shapes())
+        pool.start()
+        if not pool.wait_ready(timeout=WORKER_STARTUP_TIMEOUT):
+            pool.stop()
+            raise RuntimeError('No inference worker could load the model')
+        logger.info(f'Model {name} loaded in worker pool')
+        return LoadedModel(name, version, path, pool, model_id, graph_info)
+    
+    # Session with optimizations for web performance, tensors resolved once
+    loaded_engine = InferenceEngine(graph_path, THREADS_PER_WORKER)
+    logger.info('TensorFlow session created successfully')
+    
+    # Warm up the model (run a dummy inference)
+    # Don't fail if warmup fails - model is still loaded
+    logger.info('Warming up model...')
+    if loaded_engine.warmup(shapes=warmup_shapes()):
+        logger.info('Model warmed up successfully')
+    
+    return LoadedModel(name, version, path, loaded_engine, model_id, graph_info)
 
-def preprocess_image(image_bytes, max_size=MAX_IMAGE_SIZE):
+model_registry = ModelRegistry(build_model, shadow_queue_size=SHADOW_QUEUE_SIZE)
+
+def preprocess_image(image_source, max_size=TARGET_IMAGE_SIZE):
     """
     Preprocess image for detection
     Optimized: Resize large images to improve performance
+    Accepts raw bytes or a seekable file-like object (e.g. a multipart upload stream)
+    
+    JPEGs are decoded directly at a reduced scale (DCT-domain downscaling via
+    PIL draft mode), the resize runs before EXIF rotation, and the image is only
+    converted to a NumPy array once at the end.
     """
     try:
-        # Decode image
-        image = Image.open(io.BytesIO(image_bytes))
-        image_np = np.array(image)
+        # Decode image header (file-like sources are handed to PIL without copying)
+        if isinstance(image_source, (bytes, bytearray, memoryview)):
+            image_source = io.BytesIO(image_source)
+        decode_start = time.perf_counter()
+        image = Image.open(image_source)
         
-        # Convert RGBA to RGB if needed
-        if len(image_np.shape) == 3 and image_np.shape[2] == 4:
-            image_np = image_np[:, :, :3]
+        # Stored (unrotated) size, and the EXIF orientation to apply afterwards
+        width, height = image.size
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        transpose = EXIF_TRANSPOSE_METHODS.get(orientation)
+        
+        # Original dimensions as the user sees the photo (for coordinate scaling)
+        if orientation in (5, 6, 7, 8):
+            original_height, original_width = width, height
+        else:
+            original_height, original_width = height, width
         
         # Web optimization: Resize images for faster processing
         # Most TensorFlow models work well at 640x640 or similar sizes
-        height, width = image_np.shape[:2]
-        original_height, original_width = height, width
-        
-        # Resize if image is larger than max_size (optimization for web)
+        new_width, new_height = width, height
         if max(height, width) > max_size:
             scale = max_size / max(height, width)
             new_width = int(width * scale)
             new_height = int(height * scale)
-            image = Image.fromarray(image_np)
-            # Use high-quality resampling for better accuracy
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            image_np = np.array(image)
+            
+            # JPEG: let the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+            # (never below the target size, so the final resize still sets the exact size)
+            if image.format == 'JPEG':
+                image.draft('RGB', (new_width, new_height))
+        
+        # Decode (at draft scale for JPEGs)
+        image.load()
+        observe_stage('image_decode', time.perf_counter() - decode_start)
+        
+        resize_start = time.perf_counter()
+        
+        # Drop alpha/palette/grayscale modes straight to RGB
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        if image.size != (new_width, new_height):
+            # reducing_gap does a fast integer-factor reduction before the filter runs
+            image = image.resize((new_width, new_height), RESIZE_FILTER, reducing_gap=RESIZE_REDUCING_GAP)
             logger.debug(f'Resized image from {width}x{height} to {new_width}x{new_height} for faster processing')
         
+        # Respect EXIF orientation (cheaper on the already-downscaled image)
+        if transpose is not None:
+            image = image.transpose(transpose)
+        
+        image_np = np.asarray(image)
+        observe_stage('resize', time.perf_counter() - resize_start)
+        
         # Return processed image and original dimensions (for coordinate scaling)
         return image_np, original_height, original_width
         
@@ -211,206 +513,684 @@ def preprocess_image(image_bytes, max_size=MAX_IMAGE_SIZE):
         logger.error(f'Error preprocessing image: {str(e)}')
         raise
 
-def run_inference(image_np):
+def run_inference_batch(images, model=None):
     """
-    Run inference on preprocessed image
-    Optimized: Reuses session and graph
+    Run inference on a batch of preprocessed images
+    Takes a 4D [N, H, W, 3] array or a list of N same-shape [H, W, 3] images;
+    outputs keep the leading N axis. Runs on the given registry model (default: the primary).
     """
-    global detection_graph, sess, model_loaded
+    BATCH_SIZE.observe(len(images))
     
-    # Check if session and graph exist (primary check)
-    if sess is None:
-        raise RuntimeError('Model not loaded - session is None')
+    if model is None:
+        model = model_registry.primary()
+        if model is None:
+            raise RuntimeError('Model not loaded - no model in the registry')
     
-    if detection_graph is None:
-        raise RuntimeError('Model not loaded - graph is None')
+    # Profiled request: full-trace run, the timeline goes into the request's trace
+    trace = current_trace()
     
-    # Secondary check on model_loaded flag
-    if not model_loaded:
-        raise RuntimeError('Model not loaded - model_loaded flag is False')
-    
-    # Expand dimensions since the model expects 4D: [1, None, None, 3]
-    image_np_expanded = np.expand_dims(image_np, axis=0)
-    
-    # Get tensors from the graph (using compat.v1 for TensorFlow 2.x compatibility)
-    image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
-    boxes_tensor = detection_graph.get_tensor_by_name('detection_boxes:0')
-    scores_tensor = detection_graph.get_tensor_by_name('detection_scores:0')
-    classes_tensor = detection_graph.get_tensor_by_name('detection_classes:0')
-    num_detections_tensor = detection_graph.get_tensor_by_name('num_detections:0')
-    
-    # Run inference
-    (boxes, scores, classes, num_detections) = sess.run(
-        [boxes_tensor, scores_tensor, classes_tensor, num_detections_tensor],
-        feed_dict={image_tensor: image_np_expanded}
-    )
+    # Precompiled sess.run over a pooled input buffer, or the least-loaded worker in multi-process mode
+    with stage_timer('inference'):
+        if trace is None:
+            return model_registry.run(model, images)
+        outputs, chrome_trace = model_registry.run(model, images, traced=True)
     
-    return boxes, scores, classes, num_detections
+    trace.add_run(chrome_trace)
+    return outputs
 
-def calculate_iou(box1, box2):
+# Batch scheduler in front of run_inference_batch (None when batching is disabled)
+# With a worker pool, one batch per worker can run at the same time
+batch_scheduler = BatchScheduler(
+    run_inference_batch, BATCH_MAX_SIZE, BATCH_TIMEOUT_MS,
+    max_concurrent_batches=max(1, INFERENCE_WORKERS),
+    max_queue_size=INFERENCE_QUEUE_SIZE
+) if ENABLE_BATCHING else None
+
+def run_inference(image_np, deadline=None, model=None):
     """
-    Calculate Intersection over Union (IoU) of two bounding boxes.
-    Boxes are in format [y1, x1, y2, x2] (normalized 0-1).
+    Run inference on preprocessed image
+    Optimized: Reuses session and graph, and batches concurrent requests when enabled
+    Raises DeadlineExceededError instead of running if the monotonic deadline has passed
     """
-    y1_1, x1_1, y2_1, x2_1 = box1['bbox']
-    y1_2, x1_2, y2_2, x2_2 = box2['bbox']
+    if deadline_expired(deadline):
+        raise DeadlineExceededError('Request deadline passed before inference')
+    
+    # Profiled requests run on their own so the trace only covers this image
+    # Only requests routed to the same model share a batch
+    if batch_scheduler is not None and current_trace() is None:
+        return batch_scheduler.submit(image_np, deadline=deadline, key=model)
+    
+    # The model expects 4D: [1, None, None, 3]
+    return run_inference_batch([image_np], model)
+
+def detect_preprocessed(image_np, original_height, original_width, deadline=None, model=None, shadow=None):
+    """
+    Run inference and post-processing on a preprocessed image
+    Uses the given registry model (and shadow model), or routes the image itself
+    Returns (detections, image_size) in the /detect response format
+    """
+    if model is None:
+        model, shadow = model_registry.route()
+    
+    # Get processed image dimensions (may be different from original if resized)
+    # Boxes are normalized 0-1, so they apply to the original image as-is
+    processed_height, processed_width = image_np.shape[:2]
+    
+    # Shape bucketing: pad into the closest fixed canvas size
+    bucket = None
+    if SHAPE_BUCKETS:
+        bucket = choose_bucket(processed_width, processed_height, SHAPE_BUCKETS)
+        with stage_timer('letterbox'):
+            image_np, processed_width, processed_height = letterbox(image_np, bucket, RESIZE_FILTER)
+        BUCKET_TOTAL.inc(bucket=f'{bucket[0]}x{bucket[1]}')
     
-    # Calculate intersection area
-    x1_i = max(x1_1, x1_2)
-    y1_i = max(y1_1, y1_2)
-    x2_i = min(x2_1, x2_2)
-    y2_i = min(y2_1, y2_2)
+    outputs = run_inference(image_np, deadline, model)
+    boxes, scores, classes, num_detections = outputs
     
-    if x2_i <= x1_i or y2_i <= y1_i:
-        return 0.0
+    # Shadow model: same input, run off the request path for comparison
+    if shadow is not None:
+        model_registry.shadow(shadow, np.expand_dims(image_np, axis=0), outputs, CONFIDENCE_THRESHOLD)
     
-    intersection = (x2_i - x1_i) * (y2_i - y1_i)
+    # Boxes are normalized to the canvas - map them back to the image content
+    if bucket is not None:
+        boxes = unletterbox_boxes(boxes, processed_width, processed_height, bucket)
     
-    # Calculate union area
-    area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
-    area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
-    union = area1 + area2 - intersection
+    # Filter by confidence and box size, then apply Non-Maximum Suppression (NMS)
+    # to remove redundant detections - all vectorized over the raw output arrays
+    with stage_timer('postprocess'):
+        detections = postprocess_detections(
+            boxes, scores, classes, num_detections,
+            processed_width, processed_height,
+            CONFIDENCE_THRESHOLD, NMS_THRESHOLD,
+            min_box_size=MIN_BOX_SIZE,
+            class_aware=NMS_CLASS_AWARE,
+            method=NMS_METHOD,
+            sigma=SOFT_NMS_SIGMA
+        )
+    DETECTIONS_TOTAL.inc(len(detections))
     
-    return intersection / union if union > 0 else 0.0
+    image_size = {
+        'width': original_width, 
+        'height': original_height,
+        'processed_width': processed_width,
+        'processed_height': processed_height
+    }
+    return detections, image_size
 
-def apply_nms(detections, iou_threshold):
+def detect_image(image_source, deadline=None):
     """
-    Apply Non-Maximum Suppression to remove redundant detections.
-    Keeps detections with highest confidence scores and removes overlapping ones.
+    Decode, run inference and post-process a single image
+    Returns (detections, image_size) in the /detect response format
     """
-    if len(detections) == 0:
-        return []
-    
-    # Sort detections by confidence score (highest first)
-    sorted_detections = sorted(detections, key=lambda x: x['score'], reverse=True)
-    selected = []
+    image_np, original_height, original_width = preprocess_image(image_source)
+    return detect_preprocessed(image_np, original_height, original_width, deadline)
+
+def image_dimensions(image_source):
+    """(width, height) from the image header without decoding; file-like sources are rewound"""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(image_source)).size
+    start = image_source.tell()
+    try:
+        return Image.open(image_source).size
+    finally:
+        image_source.seek(start)
+
+def use_tiling(image_source):
+    """Whether this /detect request runs tiled (TILED_MODE, overridden by ?tiled=true|false|auto)"""
+    mode = request.args.get('tiled', TILED_MODE).lower()
+    if mode in ('1', 'true', 'yes', 'always'):
+        return True
+    if mode != 'auto':
+        return False
+    try:
+        return max(image_dimensions(image_source)) > TILE_AUTO_MIN_SIZE
+    except Exception:
+        # Unreadable header - let the regular path report the decode error
+        return False
+
+def detect_tiled(image_source, deadline=None, model=None):
+    """
+    Detect on overlapping full-resolution tiles (plus the downscaled whole image) and merge across tiles
+    All tiles run on one registry model (routed here if not given)
+    Returns (detections, image_size) like detect_image
+    """
+    if model is None:
+        model, _ = model_registry.route()
     
-    while len(sorted_detections) > 0:
-        # Take the detection with highest confidence
-        best = sorted_detections.pop(0)
-        selected.append(best)
+    with tile_slots:
+        image_np, original_height, original_width = preprocess_image(image_source, max_size=TILE_MAX_IMAGE_SIZE)
+        height, width = image_np.shape[:2]
+        
+        # Memory cap: shrink the image until it fits in TILE_MAX_TILES tiles
+        scale = tile_budget_scale(width, height, TILE_SIZE, TILE_OVERLAP, TILE_MAX_TILES)
+        if scale < 1.0:
+            width, height = max(1, int(width * scale)), max(1, int(height * scale))
+            with stage_timer('resize'):
+                image_np = np.asarray(Image.fromarray(image_np).resize(
+                    (width, height), RESIZE_FILTER, reducing_gap=RESIZE_REDUCING_GAP))
         
-        # Remove all detections that overlap significantly with the selected one
-        remaining = []
-        for det in sorted_detections:
-            iou = calculate_iou(best, det)
-            if iou < iou_threshold:
-                remaining.append(det)
+        # Tiles are views into the image; chunks of TILE_BATCH_SIZE are run together
+        windows = tile_windows(width, height, TILE_SIZE, TILE_OVERLAP)
+        tiles = [image_np[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+        chunk_size = max(1, TILE_BATCH_SIZE)
         
-        sorted_detections = remaining
+        def run_chunk(chunk):
+            # Checked before every chunk: the rest of the tiles aren't run once the client has given up
+            if deadline_expired(deadline):
+                raise DeadlineExceededError('Request deadline passed before inference')
+            # Through the batch scheduler like any other image, so its queue bound and deadline
+            # handling apply and tiles can share sess.run calls with concurrent requests
+            if batch_scheduler is not None and current_trace() is None:
+                return batch_scheduler.submit_many(chunk, deadline=deadline, key=model)
+            return run_inference_batch(chunk, model)
+        
+        # Chunks run in the request's context so a profiled request traces them too
+        futures = [tile_executor.submit(contextvars.copy_context().run, run_chunk, tiles[i:i + chunk_size])
+                   for i in range(0, len(tiles), chunk_size)]
+        
+        boxes_list, scores_list, classes_list, tile_ids, truncated = [], [], [], [], []
+        
+        # Whole image at the processing resolution, for fish larger than a tile
+        if TILE_INCLUDE_FULL_IMAGE and len(windows) > 1:
+            overview_scale = min(1.0, TARGET_IMAGE_SIZE / max(width, height))
+            overview_size = (max(1, int(width * overview_scale)), max(1, int(height * overview_scale)))
+            overview = np.asarray(Image.fromarray(image_np).resize(
+                overview_size, RESIZE_FILTER, reducing_gap=RESIZE_REDUCING_GAP))
+            boxes, scores, classes, num_detections = run_inference(overview, deadline, model)
+            boxes, scores, classes = filter_detections(
+                boxes, scores, classes, num_detections, overview_size[0], overview_size[1],
+                CONFIDENCE_THRESHOLD, MIN_BOX_SIZE
+            )
+            boxes_list.append(boxes)
+            scores_list.append(scores)
+            classes_list.append(classes)
+            tile_ids.append(np.full(len(scores), -1))
+            truncated.append(np.zeros(len(scores), dtype=bool))
+        
+        for chunk, future in enumerate(futures):
+            try:
+                boxes, scores, classes, num_detections = future.result()
+            except Exception:
+                # Don't run the remaining chunks of a request that has failed
+                for pending in futures[chunk + 1:]:
+                    pending.cancel()
+                raise
+            for j in range(len(boxes)):
+                index = chunk * chunk_size + j
+                window = windows[index]
+                tile_boxes, tile_scores, tile_classes = filter_detections(
+                    boxes[j], scores[j], classes[j], num_detections[j:j + 1],
+                    window[2] - window[0], window[3] - window[1],
+                    CONFIDENCE_THRESHOLD, MIN_BOX_SIZE
+                )
+                boxes_list.append(tile_to_image_boxes(tile_boxes, window, width, height))
+                scores_list.append(tile_scores)
+                classes_list.append(tile_classes)
+                tile_ids.append(np.full(len(tile_scores), index))
+                truncated.append(truncated_by_tile(tile_boxes, window, width, height))
+    
+    # Fuse duplicates across tiles, then the regular NMS over the whole image
+    with stage_timer('postprocess'):
+        boxes, scores, classes = merge_tile_detections(
+            np.concatenate(boxes_list), np.concatenate(scores_list), np.concatenate(classes_list),
+            np.concatenate(tile_ids), np.concatenate(truncated),
+            iou_threshold=TILE_MERGE_IOU, class_aware=NMS_CLASS_AWARE
+        )
+        detections = nms_detections(
+            boxes, scores, classes, NMS_THRESHOLD, CONFIDENCE_THRESHOLD,
+            class_aware=NMS_CLASS_AWARE, method=NMS_METHOD, sigma=SOFT_NMS_SIGMA
+        )
+    DETECTIONS_TOTAL.inc(len(detections))
+    
+    image_size = {
+        'width': original_width,
+        'height': original_height,
+        'processed_width': width,
+        'processed_height': height,
+        'tiles': len(windows)
+    }
+    return detections, image_size
+
+@app.before_request
+def track_request_start():
+    """Count in-flight requests and remember when the request started"""
+    g.request_start = time.perf_counter()
+    g.in_flight = True
+    IN_FLIGHT.inc()
+
+@app.after_request
+def track_request_end(response):
+    """Record latency, status and errors per endpoint"""
+    endpoint = request.endpoint or 'unknown'
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=response.status_code)
+    if response.status_code >= 400:
+        ERRORS_TOTAL.inc(endpoint=endpoint)
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def track_request_teardown(exc):
+    if g.pop('in_flight', False):
+        IN_FLIGHT.dec()
+    if g.pop('admitted', False):
+        admission.release(time.perf_counter() - g.request_start)
+
+def load_calibration():
+    """(Re)load the per-camera calibration map; keeps the current one if the file can't be read"""
+    global camera_calibration
+    if not CAMERA_CALIBRATION_PATH:
+        return False
+    try:
+        camera_calibration = load_camera_calibration(CAMERA_CALIBRATION_PATH)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        logger.warning(f'Could not load camera calibration from {CAMERA_CALIBRATION_PATH}: {e}')
+        return False
+    logger.info(f'Loaded calibration for {len(camera_calibration)} cameras')
+    return True
+
+load_calibration()
+
+def request_option(name):
+    """A /detect option from the query string, or from the JSON body for base64 uploads"""
+    value = request.args.get(name)
+    if value is None and request.mimetype == 'application/json':
+        value = (request.get_json(silent=True) or {}).get(name)
+    return value
+
+def parse_measurement_request():
+    """
+    Measurement options for this request, or None if it doesn't ask for sizes.
+    Calibration: pixels_per_cm, else a reference object (reference_bbox + reference_length_cm),
+    else the camera's calibration (camera_id or X-Camera-Id), else DEFAULT_PIXELS_PER_CM.
+    Raises ValueError for malformed options.
+    """
+    measure = request_option('measure')
+    if not (str(measure).lower() in ('1', 'true', 'yes') if measure is not None else MEASURE_SIZES):
+        return None
+
+    pixels_per_cm = request_option('pixels_per_cm')
+    if pixels_per_cm is not None:
+        pixels_per_cm = float(pixels_per_cm)
+        if pixels_per_cm <= 0:
+            raise ValueError('pixels_per_cm must be positive')
+        return {'pixels_per_cm': pixels_per_cm, 'source': 'request'}
+
+    reference_bbox = request_option('reference_bbox')
+    if reference_bbox is not None:
+        if isinstance(reference_bbox, str):
+            reference_bbox = reference_bbox.split(',')
+        reference_bbox = [float(v) for v in reference_bbox]
+        if len(reference_bbox) != 4 or reference_bbox[2] <= reference_bbox[0] or reference_bbox[3] <= reference_bbox[1]:
+            raise ValueError('reference_bbox must be a non-empty y1,x1,y2,x2 box (normalized)')
+        length_cm = float(request_option('reference_length_cm'))
+        if length_cm <= 0:
+            raise ValueError('reference_length_cm must be positive')
+        return {'reference': {'bbox': reference_bbox, 'length_cm': length_cm}, 'source': 'reference'}
+
+    camera_id = request_option('camera_id') or request.headers.get('X-Camera-Id')
+    if camera_id is not None and str(camera_id) in camera_calibration:
+        return {'pixels_per_cm': camera_calibration[str(camera_id)], 'source': f'camera:{camera_id}'}
+    return {'pixels_per_cm': DEFAULT_PIXELS_PER_CM, 'source': 'default'}
+
+def request_camera_key():
+    """The camera or stream session a /detect request comes from (camera_id/X-Camera-Id, session_id/X-Session-Id), or None"""
+    camera_id = request_option('camera_id') or request.headers.get('X-Camera-Id')
+    if camera_id:
+        return f'camera:{camera_id}'
+    session_id = request_option('session_id') or request.headers.get('X-Session-Id')
+    if session_id:
+        return f'session:{session_id}'
+    return None
+
+def measure_response(detections, image_size, measurement):
+    """Measured detections and the extra /detect response fields (size histogram, calibration)"""
+    pixels_per_cm = measurement.get('pixels_per_cm')
+    if pixels_per_cm is None:
+        pixels_per_cm = reference_pixels_per_cm(measurement['reference'], image_size['width'], image_size['height'])
+    detections, histogram = measure_detections(
+        detections, image_size['width'], image_size['height'], pixels_per_cm, size_ranges.get()
+    )
+    for category, count in histogram.items():
+        if count:
+            SIZE_CATEGORY_TOTAL.inc(count, category=category)
+    return detections, {
+        'size_histogram': histogram,
+        'calibration': {'pixels_per_cm': round(pixels_per_cm, 4), 'source': measurement['source']}
+    }
+
+def record_rejection(reason):
+    """Count a request (or one image of a streaming request) turned away by admission control"""
+    REJECTED_TOTAL.inc(reason=reason)
+    if reason == 'deadline' and admission is not None:
+        admission.record_dropped()
+
+def reject_request(reason, status, error, retry_after=None):
+    """Error response for a request turned away by admission control"""
+    record_rejection(reason)
+    body = {'success': False, 'error': error}
+    if retry_after is not None:
+        body['retry_after'] = retry_after
+    response = jsonify(body)
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def overload_response(exc):
+    """Map admission errors raised during inference to responses (None for any other error)"""
+    if isinstance(exc, DeadlineExceededError):
+        return reject_request('deadline', 504, 'Request deadline exceeded')
+    if isinstance(exc, QueueFullError):
+        retry_after = admission.retry_after() if admission is not None else 1
+        return reject_request('inference_queue_full', 503, 'Inference queue is full, retry later', retry_after)
+    return None
+
+@app.before_request
+def admit_request():
+    """
+    Admission control for inference endpoints: a request whose deadline has already
+    passed is dropped, and one that would exceed MAX_PENDING_REQUESTS gets 429 + Retry-After
+    """
+    if request.endpoint not in ADMISSION_ENDPOINTS:
+        return None
+    g.deadline = parse_deadline(request.headers, DEFAULT_REQUEST_TIMEOUT_MS)
+    if deadline_expired(g.deadline):
+        return reject_request('deadline', 504, 'Request deadline exceeded')
+    if admission is not None:
+        if not admission.try_acquire():
+            return reject_request('queue_full', 429, 'Server is at capacity, retry later', admission.retry_after())
+        g.admitted = True
+    return None
+
+def require_admin():
+    """Error response unless the request carries ADMIN_TOKEN; admin endpoints stay closed while none is configured"""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Admin endpoints are disabled (ADMIN_TOKEN is not set)'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'success': False, 'error': 'Admin token required'}), 403
+    return None
+
+def start_profile():
+    """A RequestTrace if this request is profiled (?profile=true, or sampled at PROFILE_SAMPLE_RATE), else None"""
+    flag = request.args.get('profile', '').lower() in ('1', 'true', 'yes')
+    if flag and PROFILE_ALLOW_REQUEST_FLAG and require_admin() is None:
+        return RequestTrace(request.endpoint)
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return RequestTrace(request.endpoint)
+    return None
+
+def profiled(view):
+    """
+    Run a view with profiling when start_profile() selects the request: stages and
+    traced sess.run calls are saved to the trace store, the id is returned in X-Profile-Id
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        trace = start_profile()
+        if trace is None:
+            return view(*args, **kwargs)
+        start_time = time.time()
+        with activate(trace):
+            response = app.make_response(view(*args, **kwargs))
+        primary = model_registry.primary()
+        try:
+            trace_store.save(trace, {
+                'path': request.full_path.rstrip('?'),
+                'status': response.status_code,
+                'request_ms': round((time.time() - start_time) * 1000, 2),
+                'model_id': primary.model_id if primary is not None else None
+            })
+            response.headers['X-Profile-Id'] = trace.trace_id
+        except OSError as e:
+            logger.error(f'Could not save profile trace: {str(e)}')
+        return response
+    return wrapper
+
+def require_model():
+    """Load the model on first use; returns an error response if it can't be loaded"""
+    if not model_loaded:
+        if not load_model():
+            return jsonify({
+                'success': False,
+                'error': 'Model not loaded. Please check model path and try again.'
+            }), 500
+    return None
+
+def read_image_upload():
+    """
+    Extract the uploaded image from the current request.
+    Supports three upload modes:
+    - Raw body: Content-Type image/jpeg, image/png, ... (no base64 overhead)
+    - multipart/form-data: file field 'image' (or the first uploaded file)
+    - JSON: {"imageData": "<base64 or data URL>"} (original contract)
+    
+    Returns (image_source, error). image_source is bytes or a file-like object.
+    """
+    mimetype = request.mimetype
+    
+    # Raw image body: read once and hand the bytes straight to the decoder
+    if mimetype in RAW_IMAGE_MIMETYPES:
+        image_bytes = request.get_data(cache=False)
+        if not image_bytes:
+            return None, 'Empty image body'
+        return image_bytes, None
+    
+    # Multipart upload: the file stream is seekable, so PIL can read it directly
+    if mimetype == 'multipart/form-data':
+        upload = request.files.get('image') or next(iter(request.files.values()), None)
+        if upload is None:
+            return None, 'No image file provided'
+        return upload.stream, None
     
-    return selected
+    # JSON with base64 image data
+    data = request.get_json(silent=True)
+    if not data:
+        return None, 'No JSON data provided'
+    
+    image_data = data.get('imageData')
+    if not image_data:
+        return None, 'No imageData provided'
+    
+    try:
+        # Handle data URL format (data:image/jpeg;base64,...)
+        prefix_end = image_data.find(',')
+        if prefix_end != -1:
+            image_data = image_data[prefix_end + 1:]
+        
+        return base64.b64decode(image_data), None
+    except Exception as e:
+        logger.error(f'Error decoding base64: {str(e)}')
+        return None, 'Invalid base64 image data'
+
+def streams_request_body(method, path):
+    """Whether the async server should stream this request's body to the handler"""
+    try:
+        endpoint, _ = app.url_map.bind('localhost').match(path, method)
+    except HTTPException:
+        return False
+    return endpoint in STREAMING_BODY_ENDPOINTS
+
+def shutdown_services():
+    """Stop the batch scheduler, tile runners and inference workers after the server has drained"""
+    if batch_scheduler is not None:
+        batch_scheduler.stop()
+    tile_executor.shutdown(wait=True)
+    model_registry.close()
+    logger.info('Inference services stopped')
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
+    primary = model_registry.primary()
+    status = 'ok'
+    worker_pool = None
+    if primary is not None and isinstance(primary.backend, WorkerPool):
+        pool_stats = primary.backend.stats()
+        worker_pool = {key: pool_stats[key] for key in ('num_workers', 'workers_ready', 'degraded')}
+        if pool_stats['degraded']:
+            status = 'degraded'
     return jsonify({
-        'status': 'ok',
+        'status': status,
         'model_loaded': model_loaded,
         'model_path': MODEL_PATH,
-        'model_exists': os.path.exists(MODEL_PATH) if MODEL_PATH else False
+        'model_exists': os.path.exists(MODEL_PATH) if MODEL_PATH else False,
+        'model': primary.label if primary is not None else None,
+        'graph': primary.graph_info['graph'] if primary is not None and primary.graph_info else None,
+        'worker_pool': worker_pool
     })
 
+def reused_result_response(result, start_time, measurement, model, cached=False, reused=False, reuse_distance=None):
+    """/detect response for detections taken from the result cache or a near-duplicate frame"""
+    DETECTIONS_TOTAL.inc(len(result['detections']))
+    detections, sizes = result['detections'], {}
+    if measurement is not None:
+        detections, sizes = measure_response(detections, result['image_size'], measurement)
+    response = {
+        'success': True,
+        'detections': detections,
+        'processing_time_ms': round((time.time() - start_time) * 1000, 2),
+        'image_size': result['image_size'],
+        'cached': cached,
+        'reused': reused,
+        'model': model.label,
+        **sizes
+    }
+    if reuse_distance is not None:
+        response['reuse_distance'] = reuse_distance
+    return jsonify(response)
+
 @app.route('/detect', methods=['POST'])
+@profiled
 def detect():
     """
     Fish detection endpoint
-    Optimized for web: handles base64 images, resizing, caching
+    Optimized for web: handles raw, multipart and base64 images, resizing, caching
     """
     try:
         start_time = time.time()
         
         # Check if model is loaded
-        if not model_loaded:
-            if not load_model():
-                return jsonify({
-                    'success': False,
-                    'error': 'Model not loaded. Please check model path and try again.'
-                }), 500
-        
-        # Get image data from request
-        data = request.get_json()
-        if not data:
-            return jsonify({'success': False, 'error': 'No JSON data provided'}), 400
-        
-        image_data = data.get('imageData')
-        if not image_data:
-            return jsonify({'success': False, 'error': 'No imageData provided'}), 400
-        
-        # Decode base64 image
-        try:
-            # Handle data URL format (data:image/jpeg;base64,...)
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            
-            image_bytes = base64.b64decode(image_data)
-        except Exception as e:
-            logger.error(f'Error decoding base64: {str(e)}')
-            return jsonify({'success': False, 'error': 'Invalid base64 image data'}), 400
+        error_response = require_model()
+        if error_response:
+            return error_response
         
-        # Preprocess image (with optimization)
-        try:
-            image_np, original_height, original_width = preprocess_image(image_bytes)
-        except Exception as e:
-            logger.error(f'Error preprocessing image: {str(e)}')
-            return jsonify({'success': False, 'error': f'Image preprocessing failed: {str(e)}'}), 400
+        # Get image data from request (raw body, multipart upload or base64 JSON)
+        with stage_timer('body_decode'):
+            image_source, error = read_image_upload()
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        tiled = use_tiling(image_source)
         
-        # Run inference
         try:
-            boxes, scores, classes, num_detections = run_inference(image_np)
-        except Exception as e:
-            logger.error(f'Error running inference: {str(e)}')
-            return jsonify({'success': False, 'error': f'Inference failed: {str(e)}'}), 500
-        
-        # Process results and scale coordinates back to original image size
-        # Note: Model outputs coordinates relative to processed image size
-        # We need to scale them back to original image dimensions
-        raw_detections = []
-        num_det = int(num_detections[0])
-        
-        # Get processed image dimensions (may be different from original if resized)
-        processed_height, processed_width = image_np.shape[:2]
-        scale_x = original_width / processed_width
-        scale_y = original_height / processed_height
-        
-        # First pass: filter by confidence threshold
-        for i in range(num_det):
-            if scores[0][i] >= CONFIDENCE_THRESHOLD:
-                # Box format: [y1, x1, y2, x2] (normalized 0-1 relative to processed image)
-                y1, x1, y2, x2 = boxes[0][i]
-                
-                # Filter out very small detections (likely false positives)
-                box_width = (x2 - x1) * processed_width
-                box_height = (y2 - y1) * processed_height
-                min_box_size = 20  # Minimum box dimension in pixels
-                
-                if box_width >= min_box_size and box_height >= min_box_size:
-                    raw_detections.append({
-                        'bbox': [float(y1), float(x1), float(y2), float(x2)],  # Normalized 0-1
-                        'score': float(scores[0][i]),
-                        'class': int(classes[0][i])
-                    })
-        
-        # Apply Non-Maximum Suppression (NMS) to remove redundant detections
-        detections = apply_nms(raw_detections, NMS_THRESHOLD)
+            measurement = parse_measurement_request()
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'Invalid measurement options: {str(e)}'}), 400
+        
+        # Pick the model (primary, or candidate for its share of traffic) once per request
+        model, shadow = model_registry.route()
+        
+        # Everything besides the image that affects the detections
+        detection_settings = make_cache_key(
+            model.model_id,
+            CONFIDENCE_THRESHOLD, NMS_THRESHOLD, NMS_METHOD, NMS_CLASS_AWARE, SOFT_NMS_SIGMA,
+            MIN_BOX_SIZE, TARGET_IMAGE_SIZE, RESIZE_FILTER_NAME, SHAPE_BUCKETS,
+            (TILE_SIZE, TILE_OVERLAP, TILE_MAX_IMAGE_SIZE, TILE_MAX_TILES, TILE_INCLUDE_FULL_IMAGE,
+             TILE_MERGE_IOU) if tiled else None
+        )
+        
+        # Return the cached result if this exact image was processed recently
+        # (profiled requests always run, they are about the real pipeline)
+        cache_key = None
+        if result_cache is not None and current_trace() is None:
+            cache_key = make_cache_key(hash_image_source(image_source), detection_settings)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f'Detection cache hit: {len(cached["detections"])} fish')
+                return reused_result_response(cached, start_time, measurement, model, cached=True)
+        
+        # Otherwise the detections of a near-duplicate recent frame from the same camera/session
+        # (?reuse=false forces a full detection, which then becomes the frame others are compared with)
+        camera_key, phash, thumbnail = None, None, None
+        if similarity_cache is not None and current_trace() is None:
+            camera_key = request_camera_key()
+        if camera_key is not None:
+            try:
+                with stage_timer('phash'):
+                    phash, thumbnail = frame_signature(image_source)
+            except Exception:
+                phash = None  # Undecodable - preprocessing reports the error
+            reuse = request_option('reuse')
+            similar = None
+            if phash is not None and (reuse is None or str(reuse).lower() in ('1', 'true', 'yes')):
+                similar = similarity_cache.get(camera_key, phash, detection_settings, thumbnail)
+            if similar is not None:
+                result, distance = similar
+                REUSED_TOTAL.inc()
+                logger.info(f'Near-duplicate frame ({camera_key}, distance {distance}): '
+                            f'reusing {len(result["detections"])} detections')
+                return reused_result_response(result, start_time, measurement, model, reused=True,
+                                              reuse_distance=distance)
+        
+        if tiled:
+            # Full-resolution tiles: decode, inference and cross-tile merging
+            try:
+                detections, image_size = detect_tiled(image_source, g.deadline, model)
+            except (DeadlineExceededError, QueueFullError) as e:
+                return overload_response(e)
+            except Exception as e:
+                logger.error(f'Error running tiled detection: {str(e)}')
+                return jsonify({'success': False, 'error': f'Tiled detection failed: {str(e)}'}), 500
+        else:
+            # Preprocess image (with optimization)
+            try:
+                image_np, original_height, original_width = preprocess_image(image_source)
+            except Exception as e:
+                logger.error(f'Error preprocessing image: {str(e)}')
+                return jsonify({'success': False, 'error': f'Image preprocessing failed: {str(e)}'}), 400
+            
+            # Run inference and post-processing
+            try:
+                detections, image_size = detect_preprocessed(
+                    image_np, original_height, original_width, g.deadline, model, shadow
+                )
+            except (DeadlineExceededError, QueueFullError) as e:
+                return overload_response(e)
+            except Exception as e:
+                logger.error(f'Error running inference: {str(e)}')
+                return jsonify({'success': False, 'error': f'Inference failed: {str(e)}'}), 500
         
         # Calculate processing time
         processing_time = (time.time() - start_time) * 1000  # Convert to ms
         
         logger.info(f'Detection completed: {len(detections)} fish found in {processing_time:.2f}ms '
-                   f'(processed: {processed_width}x{processed_height}, original: {original_width}x{original_height})')
+                   f'(processed: {image_size["processed_width"]}x{image_size["processed_height"]}, '
+                   f'original: {image_size["width"]}x{image_size["height"]}'
+                   f'{", tiles: " + str(image_size["tiles"]) if tiled else ""})')
         
-        return jsonify({
-            'success': True,
-            'detections': detections,
-            'processing_time_ms': round(processing_time, 2),
-            'image_size': {
-                'width': original_width, 
-                'height': original_height,
-                'processed_width': processed_width,
-                'processed_height': processed_height
-            }
-        })
+        if cache_key is not None:
+            result_cache.put(cache_key, {'detections': detections, 'image_size': image_size})
+        if phash is not None:
+            similarity_cache.put(camera_key, phash, detection_settings,
+                                 {'detections': detections, 'image_size': image_size}, thumbnail)
+        
+        # Measurements are computed per request (not cached): calibration and ranges can change
+        sizes = {}
+        if measurement is not None:
+            detections, sizes = measure_response(detections, image_size, measurement)
+        
+        with stage_timer('serialize'):
+            return jsonify({
+                'success': True,
+                'detections': detections,
+                'processing_time_ms': round(processing_time, 2),
+                'image_size': image_size,
+                'cached': False,
+                'reused': False,
+                'model': model.label,
+                **sizes
+            })
         
     except Exception as e:
         logger.error(f'Error in detect endpoint: {str(e)}')
@@ -422,16 +1202,456 @@ def detect():
             'traceback': traceback.format_exc() if app.debug else None
         }), 500
 
+def read_exact(stream, size):
+    """Read exactly size bytes from a stream (fewer only at end of stream)"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def iter_batch_images():
+    """
+    Yield (name, image_source) for every image in a batch request
+    Supports multipart/form-data (any number of files) and tar/tar.gz/zip archives.
+    Tar archives are read as a stream, so images are yielded while the upload is still arriving.
+    """
+    mimetype = request.mimetype
+    
+    if mimetype == 'multipart/form-data':
+        for field in request.files:
+            for upload in request.files.getlist(field):
+                yield upload.filename or field, upload.stream
+        return
+    
+    if mimetype in ('application/zip', 'application/x-zip-compressed'):
+        # Zip needs random access: spool the body (to disk once it gets large)
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as spool:
+            while True:
+                chunk = request.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                spool.write(chunk)
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and is_batch_image_name(info.filename):
+                        yield info.filename, archive.read(info)
+        return
+    
+    # Tar (optionally gzip-compressed), read sequentially from the request stream
+    with tarfile.open(fileobj=request.stream, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and is_batch_image_name(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+def is_batch_image_name(name):
+    """True for archive members that look like images (skips hidden and macOS metadata files)"""
+    base = os.path.basename(name)
+    return not base.startswith('.') and '__MACOSX' not in name and base.lower().endswith(BATCH_IMAGE_EXTENSIONS)
+
+def image_deadline(headers):
+    """
+    Deadline for one image of a streaming request (/detect/batch, /stream/<session_id>):
+    X-Request-Timeout-Ms is a budget per image counted from when the image has arrived,
+    so a long upload doesn't expire its last images; X-Request-Deadline stays absolute
+    """
+    return parse_deadline(headers, DEFAULT_REQUEST_TIMEOUT_MS)
+
+def overload_error(exc):
+    """Count an admission error raised for one image of a streaming request; its error message"""
+    if isinstance(exc, DeadlineExceededError):
+        record_rejection('deadline')
+        return 'Request deadline exceeded'
+    record_rejection('inference_queue_full')
+    return 'Inference queue is full, retry later'
+
+def streamed_response(generate):
+    """
+    NDJSON response streamed from generate(); the request keeps its admission slot until
+    the response is closed (teardown_request runs as soon as the view returns)
+    """
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    if g.pop('admitted', False):
+        # No service time: a stream's duration says nothing about when a slot frees up
+        response.call_on_close(admission.release)
+    return response
+
+def detect_batch_item(index, name, image_source, deadline=None):
+    """Detect one image of a batch; errors are reported in the result instead of raised"""
+    start_time = time.time()
+    try:
+        if deadline_expired(deadline):
+            # Waited too long for a decode worker: don't decode an image nobody is waiting for
+            raise DeadlineExceededError('Request deadline passed before inference')
+        detections, image_size = detect_image(image_source, deadline)
+        result = {
+            'index': index,
+            'name': name,
+            'success': True,
+            'detections': detections,
+            'image_size': image_size
+        }
+    except (DeadlineExceededError, QueueFullError) as e:
+        result = {'index': index, 'name': name, 'success': False, 'error': overload_error(e)}
+    except Exception as e:
+        logger.error(f'Error processing batch image {name}: {str(e)}')
+        result = {'index': index, 'name': name, 'success': False, 'error': str(e)}
+    result['processing_time_ms'] = round((time.time() - start_time) * 1000, 2)
+    return result
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    """
+    Batch detection endpoint
+    Accepts many images in one request (multipart files or a tar/zip archive) and streams
+    back one NDJSON line per image as soon as it finishes, then a summary line.
+    Images are decoded in parallel and their inferences share sess.run calls through
+    the batch scheduler. A failing image doesn't fail the rest of the batch; one whose
+    deadline passes (see image_deadline) is reported as failed without running inference.
+    """
+    error_response = require_model()
+    if error_response:
+        return error_response
+    
+    if request.mimetype != 'multipart/form-data' and request.mimetype not in ARCHIVE_MIMETYPES:
+        return jsonify({
+            'success': False,
+            'error': 'Send images as multipart/form-data or a tar/zip archive'
+        }), 400
+    
+    headers = request.headers
+    
+    def generate():
+        start_time = time.time()
+        images = 0
+        succeeded = 0
+        max_in_flight = max(1, BATCH_DECODE_WORKERS) * 2  # Bounds memory held by queued images
+        
+        with ThreadPoolExecutor(max_workers=max(1, BATCH_DECODE_WORKERS)) as executor:
+            pending = set()
+            try:
+                for name, image_source in iter_batch_images():
+                    if images >= BATCH_MAX_IMAGES:
+                        yield json.dumps({
+                            'success': False,
+                            'error': f'Batch limit of {BATCH_MAX_IMAGES} images reached - remaining images skipped'
+                        }) + '\n'
+                        break
+                    pending.add(executor.submit(detect_batch_item, images, name, image_source,
+                                                image_deadline(headers)))
+                    images += 1
+                    
+                    # Stream out whatever has finished; block only when too much is queued
+                    done, pending = wait(pending, timeout=None if len(pending) >= max_in_flight else 0,
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        succeeded += result['success']
+                        yield json.dumps(result) + '\n'
+            except (tarfile.TarError, zipfile.BadZipFile) as e:
+                yield json.dumps({'success': False, 'error': f'Invalid archive: {str(e)}'}) + '\n'
+            
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    succeeded += result['success']
+                    yield json.dumps(result) + '\n'
+        
+        total_time = (time.time() - start_time) * 1000
+        logger.info(f'Batch detection completed: {succeeded}/{images} images in {total_time:.2f}ms')
+        yield json.dumps({
+            'success': True,
+            'summary': {
+                'images': images,
+                'succeeded': succeeded,
+                'failed': images - succeeded,
+                'total_time_ms': round(total_time, 2)
+            }
+        }) + '\n'
+    
+    return streamed_response(generate)
+
+@app.route('/stream/<session_id>/frame', methods=['POST'])
+@profiled
+def stream_frame(session_id):
+    """
+    Streaming detection: submit the next frame of a camera session
+    Accepts the same upload formats as /detect. The full detector only runs every
+    STREAM_DETECT_EVERY frames or on a scene change; other frames are answered by
+    the tracker. Detections carry a stable track_id.
+    """
+    try:
+        start_time = time.time()
+        
+        error_response = require_model()
+        if error_response:
+            return error_response
+        
+        with stage_timer('body_decode'):
+            image_source, error = read_image_upload()
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        deadline = g.deadline
+        try:
+            result = stream_sessions.get(session_id).process_frame(
+                image_source, lambda source: detect_image(source, deadline))
+        except (DeadlineExceededError, QueueFullError) as e:
+            return overload_response(e)
+        except Exception as e:
+            logger.error(f'Error processing stream frame: {str(e)}')
+            return jsonify({'success': False, 'error': f'Frame processing failed: {str(e)}'}), 500
+        
+        result['success'] = True
+        result['session_id'] = session_id
+        result['processing_time_ms'] = round((time.time() - start_time) * 1000, 2)
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f'Error in stream endpoint: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/stream/<session_id>', methods=['POST'])
+def stream_chunked(session_id):
+    """
+    Streaming detection over a single chunked HTTP request
+    Request body: a sequence of frames, each a 4-byte big-endian length followed by
+    the JPEG/PNG bytes. Response: NDJSON, one result line per frame as it is processed.
+    A frame whose deadline passes (see image_deadline) gets an error line and the stream goes on.
+    """
+    error_response = require_model()
+    if error_response:
+        return error_response
+    
+    session = stream_sessions.get(session_id)
+    stream = request.stream
+    headers = request.headers
+    
+    def generate():
+        while True:
+            header = read_exact(stream, 4)
+            if len(header) < 4:
+                break
+            (frame_size,) = struct.unpack('>I', header)
+            if frame_size > STREAM_MAX_FRAME_BYTES:
+                yield json.dumps({'success': False, 'error': f'Frame too large ({frame_size} bytes)'}) + '\n'
+                break
+            frame_bytes = read_exact(stream, frame_size)
+            if len(frame_bytes) < frame_size:
+                yield json.dumps({'success': False, 'error': 'Truncated frame'}) + '\n'
+                break
+            
+            start_time = time.time()
+            deadline = image_deadline(headers)
+            try:
+                result = session.process_frame(frame_bytes, lambda source: detect_image(source, deadline))
+                result['success'] = True
+            except (DeadlineExceededError, QueueFullError) as e:
+                result = {'success': False, 'error': overload_error(e)}
+            except Exception as e:
+                logger.error(f'Error processing stream frame: {str(e)}')
+                result = {'success': False, 'error': f'Frame processing failed: {str(e)}'}
+            result['processing_time_ms'] = round((time.time() - start_time) * 1000, 2)
+            yield json.dumps(result) + '\n'
+        
+        yield json.dumps({'success': True, 'summary': session.summary()}) + '\n'
+    
+    return streamed_response(generate)
+
+@app.route('/stream/<session_id>', methods=['DELETE'])
+def stream_close(session_id):
+    """End a streaming session and return its totals (frames, detector runs, unique fish)"""
+    summary = stream_sessions.close(session_id)
+    if summary is None:
+        return jsonify({'success': False, 'error': 'Unknown session'}), 404
+    return jsonify({'success': True, 'summary': summary})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics: per-stage latency histograms, request/error/detection counters, queue depth, RSS"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/sizing', methods=['GET'])
+def sizing_info():
+    """Size ranges and calibration used by /detect?measure=true"""
+    return jsonify({
+        'measure_by_default': MEASURE_SIZES,
+        'default_pixels_per_cm': DEFAULT_PIXELS_PER_CM,
+        'cameras': camera_calibration,
+        'size_ranges': size_ranges.stats()
+    })
+
+@app.route('/sizing/reload', methods=['POST'])
+def sizing_reload():
+    """Reload the size ranges (SIZE_RANGES_PATH) and camera calibration (CAMERA_CALIBRATION_PATH)"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    ranges_reloaded = size_ranges.reload()
+    calibration_reloaded = load_calibration()
+    return jsonify({
+        'success': True,
+        'size_ranges_reloaded': ranges_reloaded,
+        'calibration_reloaded': calibration_reloaded,
+        'cameras': camera_calibration,
+        'size_ranges': size_ranges.stats()
+    })
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Stored profile traces, newest first (id, endpoint, status, stage timings, size)"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    return jsonify({'success': True, 'profiles': trace_store.list(), **trace_store.stats()})
+
+@app.route('/profiles/<trace_id>', methods=['GET'])
+def download_profile(trace_id):
+    """Download a profile as a Chrome trace (open in chrome://tracing or ui.perfetto.dev)"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    path = trace_store.path(trace_id)
+    if path is None or not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Unknown profile'}), 404
+    return send_file(path, mimetype='application/json', as_attachment=True, download_name=f'profile-{trace_id}.json')
+
+def json_option(data, name, default=None):
+    value = data.get(name, default)
+    return value.lower() in ('1', 'true', 'yes') if isinstance(value, str) else bool(value)
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Loaded models with per-model latency, routing and background loads"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    return jsonify({'success': True, **model_registry.stats()})
+
+@app.route('/models/<name>', methods=['PUT'])
+def load_registry_model(name):
+    """
+    Load (or reload) a model in the background: {"path": "...", "precision": "int8", "activate": false}
+    The current version of the same name keeps serving until the new one is warmed up
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    data = request.get_json(silent=True) or {}
+    current = model_registry.stats()['models'].get(name)
+    path = data.get('path') or (current['path'] if current is not None else None)
+    if not path or not os.path.exists(path):
+        return jsonify({'success': False, 'error': f'Model file not found: {path}'}), 400
+    precision = str(data.get('precision') or (current['precision'] if current is not None else MODEL_PRECISION)).lower()
+    if precision not in PRECISIONS:
+        return jsonify({'success': False, 'error': f'precision must be one of {", ".join(PRECISIONS)}'}), 400
+    try:
+        status = model_registry.load(name, path, activate=json_option(data, 'activate', False),
+                                     options={'precision': precision})
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True, 'name': name, 'load': status}), 202
+
+@app.route('/models/<name>/activate', methods=['POST'])
+def activate_registry_model(name):
+    """Make a loaded model the primary (the previous one stays loaded for rollback)"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    try:
+        model_registry.activate(name)
+    except KeyError:
+        return jsonify({'success': False, 'error': f'Unknown model {name}'}), 404
+    return jsonify({'success': True, 'routing': model_registry.stats()['routing']})
+
+@app.route('/models/routing', methods=['POST'])
+def route_registry_model():
+    """
+    Send traffic to a candidate: {"candidate": "name", "percent": 10} or {"candidate": "name", "shadow": true};
+    {"candidate": null} stops it
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    data = request.get_json(silent=True) or {}
+    candidate = data.get('candidate')
+    try:
+        if candidate is None:
+            model_registry.clear_candidate()
+        else:
+            model_registry.set_candidate(candidate, float(data.get('percent', 0)), json_option(data, 'shadow', False))
+    except KeyError:
+        return jsonify({'success': False, 'error': f'Unknown model {candidate}'}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'routing': model_registry.stats()['routing']})
+
+@app.route('/models/<name>', methods=['DELETE'])
+def unload_registry_model(name):
+    """Unload a model that isn't the primary (after its in-flight requests finish)"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    try:
+        model_registry.unload(name)
+    except KeyError:
+        return jsonify({'success': False, 'error': f'Unknown model {name}'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True})
+
 @app.route('/model/info', methods=['GET'])
 def model_info():
     """Get model information"""
+    primary = model_registry.primary()
+    backend = primary.backend if primary is not None else None
     return jsonify({
         'model_loaded': model_loaded,
         'model_path': MODEL_PATH,
         'model_exists': os.path.exists(MODEL_PATH) if MODEL_PATH else False,
         'confidence_threshold': CONFIDENCE_THRESHOLD,
         'nms_threshold': NMS_THRESHOLD,
-        'max_image_size': MAX_IMAGE_SIZE
+        'nms_method': NMS_METHOD,
+        'nms_class_aware': NMS_CLASS_AWARE,
+        'min_box_size': MIN_BOX_SIZE,
+        'max_image_size': MAX_IMAGE_SIZE,
+        'processing_resolution': TARGET_IMAGE_SIZE,
+        'resize_filter': RESIZE_FILTER_NAME,
+        'shape_buckets': [f'{width}x{height}' for width, height in SHAPE_BUCKETS],
+        'tiling': {
+            'mode': TILED_MODE,
+            'tile_size': TILE_SIZE,
+            'overlap': TILE_OVERLAP,
+            'auto_min_size': TILE_AUTO_MIN_SIZE,
+            'max_image_size': TILE_MAX_IMAGE_SIZE,
+            'max_tiles': TILE_MAX_TILES,
+            'batch_size': TILE_BATCH_SIZE,
+            'max_concurrent': TILE_MAX_CONCURRENT,
+            'include_full_image': TILE_INCLUDE_FULL_IMAGE
+        },
+        'model_id': primary.model_id if primary is not None else None,
+        'graph': primary.graph_info if primary is not None else None,
+        'precision': primary.graph_info.get('precision', 'fp32') if primary is not None else None,
+        # Full registry stats (model paths, backends) are admin information, like GET /models
+        'models': model_registry.stats() if require_admin() is None else model_registry.summary(),
+        'batching': batch_scheduler.stats() if batch_scheduler is not None else {'enabled': False},
+        'result_cache': result_cache.stats() if result_cache is not None else {'enabled': False},
+        'similarity_cache': similarity_cache.stats() if similarity_cache is not None else {'enabled': False},
+        'worker_pool': backend.stats() if isinstance(backend, WorkerPool) else {'enabled': False},
+        'admission': admission.stats() if admission is not None else {'enabled': False},
+        'profiling': {
+            'sample_rate': PROFILE_SAMPLE_RATE,
+            'allow_request_flag': PROFILE_ALLOW_REQUEST_FLAG,
+            **trace_store.stats()
+        },
+        'inference_engine': backend.stats() if isinstance(backend, InferenceEngine) else None,
+        'streaming': stream_sessions.stats()
     })
 
 if __name__ == '__main__':
@@ -446,7 +1666,29 @@ if __name__ == '__main__':
         model_size = os.path.getsize(MODEL_PATH) / (1024 * 1024)  # MB
         logger.info(f'Model size: {model_size:.2f} MB')
     logger.info(f'Confidence threshold: {CONFIDENCE_THRESHOLD}')
-    logger.info(f'Max image size: {MAX_IMAGE_SIZE}')
+    logger.info(f'Max image size: {MAX_IMAGE_SIZE} (processing at {TARGET_IMAGE_SIZE}, {RESIZE_FILTER_NAME})')
+    if TILED_MODE != 'off':
+        logger.info(f'Tiling: {TILED_MODE} ({TILE_SIZE}px tiles, {TILE_OVERLAP:.0%} overlap, max {TILE_MAX_TILES} tiles)')
+    if SHAPE_BUCKETS:
+        logger.info(f'Shape buckets: {", ".join(f"{w}x{h}" for w, h in SHAPE_BUCKETS)}')
+    logger.info(f'Graph optimization: {"enabled" if OPTIMIZE_GRAPH else "disabled"} (cache: {MODEL_CACHE_DIR})')
+    if MODEL_PRECISION != 'fp32':
+        logger.info(f'Model precision: {MODEL_PRECISION} weights')
+    if INFERENCE_WORKERS > 0:
+        logger.info(f'Inference workers: {INFERENCE_WORKERS} x {THREADS_PER_WORKER} threads')
+    else:
+        logger.info(f'Inference threads: {THREADS_PER_WORKER}')
+    if ENABLE_BATCHING:
+        logger.info(f'Batching: max {BATCH_MAX_SIZE} images, {BATCH_TIMEOUT_MS}ms window')
+    elif ENABLE_BATCHING_SPEC == 'auto':
+        logger.info('Batching: disabled (no SHAPE_BUCKETS; ENABLE_BATCHING=true turns it on)')
+    else:
+        logger.info('Batching: disabled')
+    if SERVER_MODE == 'async':
+        logger.info(f'Server: async ({HTTP_WORKER_THREADS} handler threads, max {MAX_CONNECTIONS} connections, '
+                    f'{KEEP_ALIVE_SECONDS:g}s keep-alive)')
+    else:
+        logger.info('Server: threaded (Flask development server)')
     logger.info(f'Port: {PORT}')
     logger.info('=' * 50)
     
@@ -459,10 +1701,31 @@ if __name__ == '__main__':
         logger.info('=' * 50)
         logger.info('Endpoints:')
         logger.info(f'  - POST http://localhost:{PORT}/detect')
+        logger.info(f'  - POST http://localhost:{PORT}/detect/batch')
+        logger.info(f'  - POST http://localhost:{PORT}/stream/<session_id>/frame')
         logger.info(f'  - GET  http://localhost:{PORT}/health')
         logger.info(f'  - GET  http://localhost:{PORT}/model/info')
+        logger.info(f'  - GET  http://localhost:{PORT}/metrics')
+        logger.info(f'  - GET  http://localhost:{PORT}/sizing')
+        logger.info(f'  - GET  http://localhost:{PORT}/profiles')
+        logger.info(f'  - GET  http://localhost:{PORT}/models')
+        if not ADMIN_TOKEN:
+            logger.warning('ADMIN_TOKEN is not set: /models, /profiles and /sizing/reload are disabled')
         logger.info('=' * 50)
-        app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
+        if SERVER_MODE == 'async':
+            from async_server import serve
+            serve(
+                app, '0.0.0.0', PORT,
+                worker_threads=HTTP_WORKER_THREADS,
+                max_connections=MAX_CONNECTIONS,
+                keep_alive=KEEP_ALIVE_SECONDS,
+                graceful_timeout=SHUTDOWN_GRACE_SECONDS,
+                max_body_size=int(MAX_REQUEST_BODY_MB * 1024 * 1024),
+                stream_body=streams_request_body,
+                on_shutdown=shutdown_services
+            )
+        else:
+            app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
     else:
         logger.error('=' * 50)
         logger.error('❌ Failed to load model. Server not started.')
@@ -0,0 +1,81 @@
+"""
+Test script for shape bucketing: bucket parsing and choice, letterboxing into
+the canvas and mapping boxes back to the original image.
+
+Run with: python test_letterbox.py  (or: python -m pytest test_letterbox.py)
+"""
+
+import numpy as np
+
+from letterbox import choose_bucket, letterbox, parse_buckets, unletterbox_boxes
+
+
+def test_parse_buckets():
+    assert parse_buckets('640x480, 480x640,,640x480') == [(640, 480), (480, 640)]
+    assert parse_buckets('auto', default_size=640) == [(640, 640), (640, 480), (480, 640)]
+    for spec in ('640', '640x-1', 'wide x tall'):
+        try:
+            parse_buckets(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f'{spec!r} should be rejected')
+
+
+def test_choose_bucket_keeps_resolution_then_least_padding():
+    buckets = [(640, 640), (640, 480), (480, 640)]
+    assert choose_bucket(640, 480, buckets) == (640, 480)
+    assert choose_bucket(480, 640, buckets) == (480, 640)
+    # Fits all of them unscaled: the tightest canvas wins
+    assert choose_bucket(400, 300, buckets) == (640, 480)
+    # Only the square bucket keeps the full width and height
+    assert choose_bucket(600, 600, buckets) == (640, 640)
+
+
+def test_letterbox_pads_top_left():
+    image = np.full((300, 400, 3), 200, dtype=np.uint8)
+    canvas, content_width, content_height = letterbox(image, (640, 480))
+    assert canvas.shape == (480, 640, 3)
+    assert (content_width, content_height) == (400, 300)
+    assert (canvas[:300, :400] == 200).all()
+    assert canvas[300:].max() == 0 and canvas[:, 400:].max() == 0
+
+    # An exact fit comes back as is; a larger image is downscaled keeping its aspect ratio
+    assert letterbox(canvas, (640, 480))[0] is canvas
+    _, content_width, content_height = letterbox(np.zeros((960, 1280, 3), dtype=np.uint8), (640, 640))
+    assert (content_width, content_height) == (640, 480)
+
+
+def test_boxes_round_trip_to_original_image():
+    width, height = 1280, 720
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    # A fish in original pixel coordinates: [y1, x1, y2, x2]
+    fish = np.array([180.0, 320.0, 540.0, 960.0])
+    image[180:540, 320:960] = 255
+
+    bucket = (640, 640)
+    canvas, content_width, content_height = letterbox(image, bucket)
+    assert (content_width, content_height) == (640, 360)
+
+    # Where the model would see the fish on the canvas, normalized to the canvas
+    rows = np.flatnonzero(canvas[..., 0].max(axis=1) > 127)
+    cols = np.flatnonzero(canvas[..., 0].max(axis=0) > 127)
+    canvas_box = np.array([rows[0], cols[0], rows[-1] + 1, cols[-1] + 1]) / [640, 640, 640, 640]
+
+    mapped = unletterbox_boxes(canvas_box[None], content_width, content_height, bucket)[0]
+    np.testing.assert_allclose(mapped * [height, width, height, width], fish, atol=2.0)
+
+    # Boxes reaching into the padding are clipped to the image
+    padded = unletterbox_boxes([[0.5, 0.5, 0.9, 1.0]], content_width, content_height, bucket)
+    np.testing.assert_allclose(padded, [[0.5 * 640 / 360, 0.5, 1.0, 1.0]], rtol=1e-6)
+
+
+if __name__ == '__main__':
+    tests = [
+        test_parse_buckets,
+        test_choose_bucket_keeps_resolution_then_least_padding,
+        test_letterbox_pads_top_left,
+        test_boxes_round_trip_to_original_image,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
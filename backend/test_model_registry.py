@@ -0,0 +1,189 @@
+"""
+Test script for the model registry: primary/candidate/shadow routing,
+background loads that retire the replaced version, unloading, and the public
+per-model summary.
+
+Run with: python test_model_registry.py  (or: python -m pytest test_model_registry.py)
+"""
+
+import random
+import threading
+import time
+
+import numpy as np
+
+import model_registry
+from model_registry import LoadedModel, ModelClosedError, ModelRegistry
+
+
+class FakeBackend:
+    """Returns `detections` boxes with score 0.9 per image; run() can be held with a gate"""
+
+    def __init__(self, detections=1):
+        self.detections = detections
+        self.gate = threading.Event()
+        self.gate.set()
+        self.closed = False
+
+    def run(self, batch_np):
+        self.gate.wait(5)
+        n = len(batch_np)
+        scores = np.zeros((n, 4), dtype=np.float32)
+        scores[:, :self.detections] = 0.9
+        return np.zeros((n, 4, 4), dtype=np.float32), scores, np.ones((n, 4), dtype=np.float32), np.full(n, 4.0)
+
+    def close(self):
+        self.closed = True
+
+
+def make_registry(backends=None):
+    backends = {} if backends is None else backends
+
+    def load_fn(name, path, version, **options):
+        backend = backends.setdefault(path, FakeBackend())
+        return LoadedModel(name, version, path, backend, model_id=f'{path}@{version}')
+
+    registry = ModelRegistry(load_fn)
+    assert registry.load('default', 'a.pb', wait=True)
+    assert registry.load('candidate', 'b.pb', wait=True)
+    return registry
+
+
+def images(n=1):
+    return np.zeros((n, 8, 8, 3), dtype=np.uint8)
+
+
+def test_candidate_gets_its_share_of_traffic():
+    registry = make_registry()
+    primary = registry.primary()
+    assert primary.name == 'default'
+
+    registry.set_candidate('candidate', percent=25)
+    random.seed(0)
+    routed = [registry.route() for _ in range(4000)]
+    to_candidate = sum(1 for model, _ in routed if model.name == 'candidate')
+    assert 800 < to_candidate < 1200
+    assert all(shadow is None for _, shadow in routed)
+
+    registry.set_candidate('candidate', percent=0)
+    assert all(registry.route()[0] is primary for _ in range(100))
+    registry.set_candidate('candidate', percent=100)
+    assert all(registry.route()[0].name == 'candidate' for _ in range(100))
+
+    routing = registry.stats()['routing']
+    assert routing['routed'] == {'default@1': 4100 - to_candidate, 'candidate@2': to_candidate + 100}
+    try:
+        registry.set_candidate('default', percent=50)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('the primary cannot be its own candidate')
+    registry.close()
+
+
+def test_shadow_mirrors_primary_traffic():
+    backends = {'a.pb': FakeBackend(detections=1), 'b.pb': FakeBackend(detections=3)}
+    registry = make_registry(backends)
+    registry.set_candidate('candidate', percent=50, shadow=True)
+
+    model, shadow = registry.route()
+    assert model.name == 'default' and shadow.name == 'candidate'
+    outputs = registry.run(model, images(2))
+    registry.shadow(shadow, images(2), outputs, score_threshold=0.5)
+    registry._shadow_executor.shutdown(wait=True)
+
+    stats = registry.stats()['shadow']
+    # Two images, two more detections each on the shadow model
+    assert (stats['runs'], stats['count_diff_total'], stats['mean_count_diff']) == (1, 4, 4.0)
+    roles = {model['name']: model['role'] for model in registry.summary()}
+    assert roles == {'default': 'primary', 'candidate': 'shadow'}
+    registry.close()
+
+
+def test_reload_retires_previous_version_once_idle():
+    real_delay, real_poll = model_registry.RETIRE_DELAY, model_registry.RETIRE_POLL_INTERVAL
+    model_registry.RETIRE_DELAY, model_registry.RETIRE_POLL_INTERVAL = 0.0, 0.01
+    try:
+        backends = {}
+        registry = make_registry(backends)
+        old = registry.primary()
+
+        # A run still in flight on the old version when the new one is swapped in
+        backends['a.pb'].gate.clear()
+        in_flight = threading.Thread(target=old.run, args=(images(),))
+        in_flight.start()
+        while old.in_flight() == 0:
+            time.sleep(0.01)
+
+        assert registry.load('default', 'a2.pb', activate=True, wait=True)
+        new = registry.primary()
+        assert new.version == 3 and new.name == 'default'
+        time.sleep(0.1)
+        assert old.stats()['state'] == 'retired' and not backends['a.pb'].closed
+
+        backends['a.pb'].gate.set()
+        in_flight.join()
+        deadline = time.monotonic() + 5
+        while not backends['a.pb'].closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert backends['a.pb'].closed and old.stats()['state'] == 'closed'
+
+        # A request routed to the old version before the swap is served by the new primary
+        try:
+            old.run(images())
+        except ModelClosedError:
+            pass
+        else:
+            raise AssertionError('a closed model must not run')
+        registry.run(old, images())
+        assert new.latency.stats()['runs'] == 1
+        registry.close()
+    finally:
+        model_registry.RETIRE_DELAY, model_registry.RETIRE_POLL_INTERVAL = real_delay, real_poll
+
+
+def test_unload_and_summary():
+    registry = make_registry()
+    registry.set_candidate('candidate', percent=10)
+    try:
+        registry.unload('default')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('the primary cannot be unloaded')
+
+    random.seed(1)
+    for _ in range(20):
+        model, _ = registry.route()
+        registry.run(model, images())
+    summary = registry.summary()
+    assert [(model['name'], model['role'], model['traffic_percent']) for model in summary] == [
+        ('default', 'primary', None), ('candidate', 'candidate', 10.0)]
+    assert sum(model['requests'] for model in summary) == 20
+    assert all(model['runs'] == model['requests'] for model in summary)
+    # No paths or backend details in the public view
+    assert all(set(model) == {'name', 'version', 'role', 'traffic_percent', 'requests', 'runs',
+                              'p50_ms', 'p95_ms', 'p99_ms'} for model in summary)
+
+    registry.unload('candidate')
+    assert registry.stats()['routing']['candidate'] is None
+    assert [model['name'] for model in registry.summary()] == ['default']
+    try:
+        registry.unload('candidate')
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('unknown models cannot be unloaded')
+    registry.close()
+
+
+if __name__ == '__main__':
+    tests = [
+        test_candidate_gets_its_share_of_traffic,
+        test_shadow_mirrors_primary_traffic,
+        test_reload_retires_previous_version_once_idle,
+        test_unload_and_summary,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
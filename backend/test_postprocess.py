@@ -0,0 +1,158 @@
+"""
+Test script to verify the vectorized post-processing produces the same
+detections as the original per-detection Python loop + list-based NMS.
+
+Run with: python test_postprocess.py  (or: python -m pytest test_postprocess.py)
+"""
+
+import numpy as np
+
+from postprocess import postprocess_detections, apply_nms, nms
+
+
+# Reference implementation (original start_server.py code)
+
+def reference_calculate_iou(box1, box2):
+    y1_1, x1_1, y2_1, x2_1 = box1['bbox']
+    y1_2, x1_2, y2_2, x2_2 = box2['bbox']
+
+    x1_i = max(x1_1, x1_2)
+    y1_i = max(y1_1, y1_2)
+    x2_i = min(x2_1, x2_2)
+    y2_i = min(y2_1, y2_2)
+
+    if x2_i <= x1_i or y2_i <= y1_i:
+        return 0.0
+
+    intersection = (x2_i - x1_i) * (y2_i - y1_i)
+
+    area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
+    area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
+    union = area1 + area2 - intersection
+
+    return intersection / union if union > 0 else 0.0
+
+
+def reference_apply_nms(detections, iou_threshold):
+    if len(detections) == 0:
+        return []
+
+    sorted_detections = sorted(detections, key=lambda x: x['score'], reverse=True)
+    selected = []
+
+    while len(sorted_detections) > 0:
+        best = sorted_detections.pop(0)
+        selected.append(best)
+
+        remaining = []
+        for det in sorted_detections:
+            iou = reference_calculate_iou(best, det)
+            if iou < iou_threshold:
+                remaining.append(det)
+
+        sorted_detections = remaining
+
+    return selected
+
+
+def reference_postprocess(boxes, scores, classes, num_detections, processed_width, processed_height,
+                          score_threshold, iou_threshold):
+    raw_detections = []
+    num_det = int(num_detections[0])
+
+    for i in range(num_det):
+        if scores[0][i] >= score_threshold:
+            y1, x1, y2, x2 = boxes[0][i]
+
+            box_width = (x2 - x1) * processed_width
+            box_height = (y2 - y1) * processed_height
+            min_box_size = 20
+
+            if box_width >= min_box_size and box_height >= min_box_size:
+                raw_detections.append({
+                    'bbox': [float(y1), float(x1), float(y2), float(x2)],
+                    'score': float(scores[0][i]),
+                    'class': int(classes[0][i])
+                })
+
+    return reference_apply_nms(raw_detections, iou_threshold)
+
+
+def make_model_output(rng, num_boxes=300, max_detections=300):
+    """Random model output shaped like sess.run results ([1, N, ...] float32)"""
+    centers = rng.uniform(0.0, 1.0, size=(num_boxes, 2))
+    sizes = rng.uniform(0.005, 0.3, size=(num_boxes, 2))
+    y1x1 = np.clip(centers - sizes / 2, 0.0, 1.0)
+    y2x2 = np.clip(centers + sizes / 2, 0.0, 1.0)
+    boxes = np.concatenate([y1x1, y2x2], axis=1).astype(np.float32)
+
+    # Quantized scores produce ties, which exercises the stable ordering
+    scores = np.round(rng.uniform(0.0, 1.0, size=num_boxes), 2).astype(np.float32)
+    classes = rng.integers(1, 3, size=num_boxes).astype(np.float32)
+
+    pad = max_detections - num_boxes
+    boxes = np.concatenate([boxes, np.zeros((pad, 4), np.float32)])[None]
+    scores = np.concatenate([scores, np.zeros(pad, np.float32)])[None]
+    classes = np.concatenate([classes, np.zeros(pad, np.float32)])[None]
+    num_detections = np.array([num_boxes], dtype=np.float32)
+    return boxes, scores, classes, num_detections
+
+
+def test_postprocess_matches_reference():
+    rng = np.random.default_rng(1234)
+    for trial in range(50):
+        num_boxes = int(rng.integers(0, 300))
+        boxes, scores, classes, num_det = make_model_output(rng, num_boxes)
+        width, height = int(rng.integers(100, 1280)), int(rng.integers(100, 1280))
+        score_threshold = float(rng.choice([0.0, 0.3, 0.5]))
+        iou_threshold = float(rng.choice([0.2, 0.4, 0.6]))
+
+        expected = reference_postprocess(boxes, scores, classes, num_det, width, height,
+                                         score_threshold, iou_threshold)
+        actual = postprocess_detections(boxes, scores, classes, num_det, width, height,
+                                        score_threshold, iou_threshold)
+        assert actual == expected, f'Mismatch in trial {trial}'
+
+
+def test_apply_nms_matches_reference():
+    rng = np.random.default_rng(42)
+    boxes, scores, classes, num_det = make_model_output(rng, 200)
+    detections = [
+        {'bbox': [float(v) for v in boxes[0][i]], 'score': float(scores[0][i]), 'class': int(classes[0][i])}
+        for i in range(200)
+    ]
+    assert apply_nms(detections, 0.4) == reference_apply_nms(detections, 0.4)
+    assert apply_nms([], 0.4) == []
+
+
+def test_class_aware_nms_keeps_overlapping_classes():
+    boxes = np.array([[0.1, 0.1, 0.5, 0.5], [0.1, 0.1, 0.5, 0.5]])
+    scores = np.array([0.9, 0.8])
+    keep, _ = nms(boxes, scores, 0.4)
+    assert keep.tolist() == [0]
+    keep, _ = nms(boxes, scores, 0.4, classes=np.array([1, 2]))
+    assert keep.tolist() == [0, 1]
+
+
+def test_soft_nms_decays_overlapping_scores():
+    boxes = np.array([[0.1, 0.1, 0.5, 0.5], [0.12, 0.12, 0.52, 0.52], [0.6, 0.6, 0.9, 0.9]])
+    scores = np.array([0.9, 0.8, 0.7])
+    keep, kept_scores = nms(boxes, scores, 0.4, method='soft_gaussian', score_threshold=0.1)
+    assert keep.tolist() == [0, 2, 1]
+    assert kept_scores[0] == 0.9 and kept_scores[1] == 0.7
+    assert kept_scores[2] < 0.8
+
+    keep, _ = nms(boxes, scores, 0.4, method='soft_linear', score_threshold=0.5)
+    assert keep.tolist() == [0, 2]
+
+
+if __name__ == '__main__':
+    tests = [
+        test_postprocess_matches_reference,
+        test_apply_nms_matches_reference,
+        test_class_aware_nms_keeps_overlapping_classes,
+        test_soft_nms_decays_overlapping_scores,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
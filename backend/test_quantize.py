@@ -0,0 +1,92 @@
+"""
+Test script for the weight-only quantization: int8 rounding error, which
+constants are rewritten, and fp16/int8 round trips of the benchmark stub model
+(benchmarks/make_stub_model.py) against its float32 outputs.
+
+Run with: python test_quantize.py  (or: python -m pytest test_quantize.py)
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from graph_optimizer import _run_graph, read_graph_def
+from quantize import quantize_graph_def, quantize_weights_int8, weight_constants
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+from make_stub_model import build_stub_model  # noqa: E402
+
+# Largest allowed score change on the stub model (scores are sigmoids, 0-1)
+SCORE_TOLERANCE = {'fp16': 1e-3, 'int8': 1e-2}
+
+
+def stub_graph_def():
+    with tempfile.TemporaryDirectory() as directory:
+        return read_graph_def(build_stub_model(os.path.join(directory, 'stub.pb')))
+
+
+def test_int8_error_within_half_a_step_per_channel():
+    rng = np.random.default_rng(0)
+    weights = rng.normal(0, 1, size=(3, 3, 8, 4)).astype(np.float32)
+    weights[..., 3] *= 100  # One channel with a much larger range keeps its own scale
+    values, scale = quantize_weights_int8(weights)
+    assert values.dtype == np.int8 and scale.shape == (4,)
+    assert np.abs(values).max() <= 127
+    error = np.abs(values * scale - weights)
+    assert (error <= scale / 2 + 1e-6).all()
+
+    # All-zero channels don't divide by zero
+    values, scale = quantize_weights_int8(np.zeros((2, 3), dtype=np.float32))
+    assert not values.any() and (scale == 1.0).all()
+
+
+def test_only_layer_weights_are_rewritten():
+    graph_def = stub_graph_def()
+    shapes = {node.name: tuple(dim.size for dim in node.attr['value'].tensor.tensor_shape.dim)
+              for node in graph_def.node if node.op == 'Const'}
+    weights = weight_constants(graph_def)
+    # The convolution kernel is a weight; the box priors are only tiled into the outputs
+    assert [shapes[name] for name in weights if name in shapes] == [(3, 3, 3, 16)]
+    assert (100, 4) in shapes.values()
+
+    _, report = quantize_graph_def(graph_def, 'int8', min_elements=1)
+    assert report['tensors'] == 1
+    assert report['skipped_non_weight'] >= 1
+    # int8 values plus one float32 scale per output channel
+    assert report['weight_bytes_after'] == 3 * 3 * 3 * 16 + 16 * 4
+    assert report['weight_bytes_before'] == 3 * 3 * 3 * 16 * 4
+
+    # The default threshold leaves the stub's small kernel alone
+    _, report = quantize_graph_def(graph_def, 'int8')
+    assert report['tensors'] == 0
+
+
+def test_stub_model_round_trip_within_tolerance():
+    graph_def = stub_graph_def()
+    image_np = np.random.default_rng(0).integers(0, 256, size=(2, 96, 128, 3), dtype=np.uint8)
+    expected_boxes, expected_scores, expected_classes, expected_num = _run_graph(graph_def, image_np)
+
+    for precision in ('fp16', 'int8'):
+        quantized_def, report = quantize_graph_def(graph_def, precision, min_elements=1)
+        assert report['tensors'] == 1
+        boxes, scores, classes, num = _run_graph(quantized_def, image_np)
+        # Box priors stay float32, so boxes, classes and counts are unchanged
+        np.testing.assert_array_equal(boxes, expected_boxes)
+        np.testing.assert_array_equal(classes, expected_classes)
+        np.testing.assert_array_equal(num, expected_num)
+        assert np.abs(scores - expected_scores).max() <= SCORE_TOLERANCE[precision]
+    # The rewritten kernel really is in the int8 graph: its rounding shows in the scores
+    assert not np.array_equal(scores, expected_scores)
+
+
+if __name__ == '__main__':
+    tests = [
+        test_int8_error_within_half_a_step_per_channel,
+        test_only_layer_weights_are_rewritten,
+        test_stub_model_round_trip_within_tolerance,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
@@ -0,0 +1,103 @@
+"""
+Test script for the content-addressed result cache: the blake2b image hash,
+cache keys, LRU eviction under the memory budget and TTL expiry.
+
+Run with: python test_result_cache.py  (or: python -m pytest test_result_cache.py)
+"""
+
+import hashlib
+import io
+
+import result_cache
+from result_cache import ResultCache, hash_image_source, make_cache_key
+
+
+class FakeClock:
+    """Stands in for the time module so TTLs can be tested without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_hash_is_blake2b_of_bytes_and_rewinds_streams():
+    data = b'\xff\xd8' + bytes(range(256)) * 10000
+    expected = hashlib.blake2b(data, digest_size=20).hexdigest()
+    assert hash_image_source(data) == expected
+    assert hash_image_source(memoryview(data)) == expected
+
+    # Read in chunks from the current position, then rewound so the image can still be decoded
+    stream = io.BytesIO(b'header' + data)
+    stream.seek(6)
+    assert hash_image_source(stream) == expected
+    assert stream.tell() == 6
+
+
+def test_key_includes_model_and_settings():
+    image_hash = hash_image_source(b'same image')
+    key = make_cache_key(image_hash, 'model-v1', 0.5, 0.4, 'hard', (640, 480))
+    assert key.startswith(image_hash + '|')
+    # A new model version or any changed parameter gives a different key
+    assert key != make_cache_key(image_hash, 'model-v2', 0.5, 0.4, 'hard', (640, 480))
+    assert key != make_cache_key(image_hash, 'model-v1', 0.6, 0.4, 'hard', (640, 480))
+    assert key != make_cache_key(image_hash, 'model-v1', 0.5, 0.4, 'soft_gaussian', (640, 480))
+    assert key != make_cache_key(image_hash, 'model-v1', 0.5, 0.4, 'hard', None)
+    assert key == make_cache_key(image_hash, 'model-v1', 0.5, 0.4, 'hard', (640, 480))
+
+
+def test_lru_eviction_within_budget():
+    value = {'detections': [{'bbox': [0.1, 0.2, 0.3, 0.4], 'score': 0.9}]}
+    entry_size = len('key-0') + len('{"detections":[{"bbox":[0.1,0.2,0.3,0.4],"score":0.9}]}')
+    cache = ResultCache(max_bytes=entry_size * 3, ttl_seconds=60)
+    for i in range(3):
+        cache.put(f'key-{i}', value)
+    # key-0 was used last, so key-1 is the least recently used one
+    assert cache.get('key-0') == value
+    cache.put('key-3', value)
+
+    assert cache.get('key-1') is None
+    assert all(cache.get(key) == value for key in ('key-0', 'key-2', 'key-3'))
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 3
+    assert stats['size_bytes'] <= stats['max_bytes']
+
+    # A value larger than the whole budget is not cached (and evicts nothing)
+    cache.put('huge', {'data': 'x' * entry_size * 3})
+    assert cache.get('huge') is None and cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    real_time, result_cache.time = result_cache.time, clock
+    try:
+        cache = ResultCache(max_bytes=1024, ttl_seconds=30)
+        cache.put('key', {'detections': []})
+        clock.now += 29.9
+        assert cache.get('key') == {'detections': []}
+        clock.now += 0.1
+        assert cache.get('key') is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries'], stats['size_bytes']) == (1, 1, 0, 0)
+
+        # Storing again restarts the TTL
+        cache.put('key', {'detections': []})
+        clock.now += 20
+        cache.put('key', {'detections': [1]})
+        clock.now += 20
+        assert cache.get('key') == {'detections': [1]}
+    finally:
+        result_cache.time = real_time
+
+
+if __name__ == '__main__':
+    tests = [
+        test_hash_is_blake2b_of_bytes_and_rewinds_streams,
+        test_key_includes_model_and_settings,
+        test_lru_eviction_within_budget,
+        test_entries_expire_after_ttl,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
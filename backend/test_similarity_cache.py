@@ -0,0 +1,152 @@
+"""
+Test script for the near-duplicate frame cache: the dHash, the Hamming distance
+threshold, reuse limits, TTL expiry and per-camera eviction.
+
+Run with: python test_similarity_cache.py  (or: python -m pytest test_similarity_cache.py)
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+import similarity_cache
+from similarity_cache import SimilarityCache, frame_signature, hamming_distance, perceptual_hash
+
+
+class FakeClock:
+    """Stands in for the time module so TTLs can be tested without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def encode(pixels, fmt='PNG', **options):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def random_image(seed, width=320, height=240):
+    # Blocky random content, so the 9x8 thumbnail keeps it
+    blocks = np.random.default_rng(seed).integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    return np.kron(blocks, np.ones((height // 6, width // 8, 1), dtype=np.uint8))
+
+
+def test_dhash_bits_and_distance():
+    # Brightness increasing to the right: every "right pixel is brighter" bit is set
+    gradient = np.tile(np.linspace(0, 255, 320, dtype=np.uint8), (240, 1))
+    assert perceptual_hash(encode(gradient)) == (1 << 64) - 1
+    assert perceptual_hash(encode(gradient[:, ::-1].copy())) == 0
+
+    assert hamming_distance(0b1011, 0b0001) == 2
+    assert hamming_distance((1 << 64) - 1, 0) == 64
+
+    # Re-encoding the same frame stays within the default threshold; different content doesn't
+    frame = random_image(1)
+    phash = perceptual_hash(encode(frame))
+    assert hamming_distance(phash, perceptual_hash(encode(frame, 'JPEG', quality=60))) <= 4
+    assert hamming_distance(phash, perceptual_hash(encode(random_image(2)))) > 4
+
+
+def test_hash_rewinds_streams():
+    stream = io.BytesIO(encode(random_image(3)))
+    stream.seek(0)
+    phash = perceptual_hash(stream)
+    assert stream.tell() == 0
+    assert perceptual_hash(stream) == phash
+
+
+def test_reuse_within_distance_threshold():
+    cache = SimilarityCache(max_distance=4, refresh_every=0)
+    cache.put('camera:1', 0b0000, 'settings', {'detections': ['fish']})
+    # 4 differing bits: a duplicate; 5: a new frame
+    assert cache.get('camera:1', 0b1111, 'settings') == ({'detections': ['fish']}, 4)
+    assert cache.get('camera:1', 0b11111, 'settings') is None
+    # Other cameras and other detection settings never match
+    assert cache.get('camera:2', 0b0000, 'settings') is None
+    assert cache.get('camera:1', 0b0000, 'other settings') is None
+
+    # The closest of several recent frames wins
+    cache.put('camera:1', 0b11110000, 'settings', {'detections': []})
+    assert cache.get('camera:1', 0b11100000, 'settings') == ({'detections': []}, 1)
+
+
+def gradient_scene(fish=None, brightness=0, seed=0):
+    """Lighting gradient with sensor noise and optionally a dark fish at (x, y, length)"""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 255, 480)[:, None]
+    x = np.linspace(0, 255, 640)[None, :]
+    pixels = np.broadcast_to((x + y) / 2, (480, 640)) + brightness + rng.normal(0, 12, (480, 640))
+    if fish is not None:
+        x0, y0, length = fish
+        pixels[y0:y0 + length // 2, x0:x0 + length] = 20
+    return encode(np.clip(pixels, 0, 255).astype(np.uint8), 'JPEG', quality=90)
+
+
+def test_gradient_scene_needs_thumbnail_match():
+    cache = SimilarityCache(max_distance=4, refresh_every=0)
+    empty_phash, empty_thumbnail = frame_signature(gradient_scene())
+    cache.put('camera:1', empty_phash, 'settings', {'detections': []}, empty_thumbnail)
+
+    # Noise and a global brightness change: still the same frame
+    for frame in (gradient_scene(seed=1), gradient_scene(brightness=10, seed=2)):
+        phash, thumbnail = frame_signature(frame)
+        assert cache.get('camera:1', phash, 'settings', thumbnail) is not None
+
+    # A fish entering barely changes the gradient's hash, but it does change the thumbnail
+    for fish in ((300, 200, 40), (100, 100, 160)):
+        phash, thumbnail = frame_signature(gradient_scene(fish, seed=3))
+        assert hamming_distance(phash, empty_phash) <= 4
+        assert cache.get('camera:1', phash, 'settings', thumbnail) is None
+
+
+def test_refresh_after_reuse_limit():
+    cache = SimilarityCache(max_distance=4, refresh_every=2)
+    cache.put('camera:1', 0, 'settings', {'detections': []})
+    assert cache.get('camera:1', 1, 'settings') is not None
+    assert cache.get('camera:1', 1, 'settings') is not None
+    # Detected again; the fresh frame replaces its near-duplicate
+    assert cache.get('camera:1', 1, 'settings') is None
+    cache.put('camera:1', 1, 'settings', {'detections': ['fish']})
+    assert cache.get('camera:1', 0, 'settings') == ({'detections': ['fish']}, 1)
+    stats = cache.stats()
+    assert (stats['hits'], stats['refreshes'], stats['entries']) == (3, 1, 1)
+
+
+def test_ttl_and_camera_eviction():
+    clock = FakeClock()
+    real_time, similarity_cache.time = similarity_cache.time, clock
+    try:
+        cache = SimilarityCache(ttl_seconds=30, max_cameras=2)
+        cache.put('camera:1', 0, 'settings', {'detections': []})
+        clock.now += 30
+        assert cache.get('camera:1', 0, 'settings') is None
+
+        cache.put('camera:1', 0, 'settings', {'detections': []})
+        cache.put('camera:2', 0, 'settings', {'detections': []})
+        cache.get('camera:1', 0, 'settings')
+        # camera:2 is the least recently seen
+        cache.put('camera:3', 0, 'settings', {'detections': []})
+        assert cache.get('camera:2', 0, 'settings') is None
+        assert cache.get('camera:1', 0, 'settings') is not None
+        assert cache.stats()['cameras'] == 2
+    finally:
+        similarity_cache.time = real_time
+
+
+if __name__ == '__main__':
+    tests = [
+        test_dhash_bits_and_distance,
+        test_hash_rewinds_streams,
+        test_reuse_within_distance_threshold,
+        test_gradient_scene_needs_thumbnail_match,
+        test_refresh_after_reuse_limit,
+        test_ttl_and_camera_eviction,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
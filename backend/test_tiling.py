@@ -0,0 +1,121 @@
+"""
+Test script for the tiled-inference helpers: tile windows, mapping tile boxes
+back to the image, and the cross-tile fusion of duplicate and cut-off boxes.
+
+Run with: python test_tiling.py  (or: python -m pytest test_tiling.py)
+"""
+
+import numpy as np
+
+from tiling import (merge_tile_detections, tile_budget_scale, tile_to_image_boxes, tile_windows,
+                    truncated_by_tile)
+
+
+def test_tile_windows_cover_image():
+    windows = tile_windows(1000, 600, 400, overlap=0.25)
+    assert {(x1 - x0, y1 - y0) for x0, y0, x1, y1 in windows} == {(400, 400)}
+    # Stride 300; the last tile on each axis is aligned to the far edge
+    assert sorted({x0 for x0, _, _, _ in windows}) == [0, 300, 600]
+    assert sorted({y0 for _, y0, _, _ in windows}) == [0, 200]
+    assert max(x1 for _, _, x1, _ in windows) == 1000 and max(y1 for _, _, _, y1 in windows) == 600
+
+    # An image smaller than a tile is a single window of its own size
+    assert tile_windows(300, 200, 640) == [(0, 0, 300, 200)]
+    assert len(tile_windows(4000, 3000, 640, 0.2)) > 4
+    scale = tile_budget_scale(4000, 3000, 640, 0.2, max_tiles=4)
+    assert len(tile_windows(int(4000 * scale), int(3000 * scale), 640, 0.2)) <= 4
+
+
+def test_tile_boxes_map_to_image():
+    # Right half of a 200 x 100 image, as a 100 x 100 tile
+    window = (100, 0, 200, 100)
+    boxes = np.array([[0.0, 0.0, 1.0, 1.0], [0.25, 0.5, 0.75, 1.0]])
+    mapped = tile_to_image_boxes(boxes, window, 200, 100)
+    np.testing.assert_allclose(mapped, [[0.0, 0.5, 1.0, 1.0], [0.25, 0.75, 0.75, 1.0]])
+
+
+def test_truncated_only_at_inner_tile_edges():
+    # Left tile of a 200 x 100 image: its right edge is inside the image
+    window = (0, 0, 100, 100)
+    boxes = np.array([
+        [0.2, 0.0, 0.4, 0.3],   # touches the image's left edge: complete
+        [0.2, 0.7, 0.4, 1.0],   # touches the tile's right edge: continues in the next tile
+        [0.3, 0.3, 0.6, 0.6],   # inside the tile
+    ])
+    assert truncated_by_tile(boxes, window, 200, 100).tolist() == [False, True, False]
+
+
+def test_duplicate_across_tiles_is_fused():
+    boxes = np.array([[0.10, 0.40, 0.30, 0.60], [0.11, 0.41, 0.31, 0.61]])
+    merged_boxes, merged_scores, merged_classes = merge_tile_detections(
+        boxes, np.array([0.9, 0.6]), np.array([1, 1]), tile_ids=np.array([0, 1]),
+        truncated=np.array([False, False]))
+    assert len(merged_boxes) == 1
+    assert merged_scores[0] == 0.9 and merged_classes[0] == 1
+    # Score-weighted mean of the two complete boxes
+    np.testing.assert_allclose(merged_boxes[0], (boxes[0] * 0.9 + boxes[1] * 0.6) / 1.5)
+
+
+def test_cut_off_box_is_replaced_by_complete_box():
+    # Tile 0 only sees the left part of the fish; tile 1 sees all of it (IoU ~0.4, below the threshold)
+    complete = np.array([0.2, 0.40, 0.4, 0.70])
+    partial = np.array([0.2, 0.40, 0.4, 0.52])
+    merged_boxes, merged_scores, _ = merge_tile_detections(
+        np.stack([partial, complete]), np.array([0.95, 0.8]), np.array([1, 1]),
+        tile_ids=np.array([0, 1]), truncated=np.array([True, False]))
+    assert len(merged_boxes) == 1
+    np.testing.assert_allclose(merged_boxes[0], complete)
+    assert merged_scores[0] == 0.95
+
+    # Without the truncation flag they are two different fish
+    merged_boxes, _, _ = merge_tile_detections(
+        np.stack([partial, complete]), np.array([0.95, 0.8]), np.array([1, 1]),
+        tile_ids=np.array([0, 1]), truncated=np.array([False, False]))
+    assert len(merged_boxes) == 2
+
+
+def test_all_truncated_group_becomes_enclosing_box():
+    # A fish straddling the border: each tile has its half
+    left = np.array([0.3, 0.40, 0.5, 0.50])
+    right = np.array([0.3, 0.45, 0.5, 0.60])
+    merged_boxes, _, _ = merge_tile_detections(
+        np.stack([left, right]), np.array([0.7, 0.8]), np.array([1, 1]),
+        tile_ids=np.array([0, 1]), truncated=np.array([True, True]), ios_threshold=0.5)
+    np.testing.assert_allclose(merged_boxes, [[0.3, 0.40, 0.5, 0.60]])
+
+
+def test_same_tile_and_other_class_are_not_merged():
+    boxes = np.array([[0.1, 0.1, 0.3, 0.3], [0.1, 0.1, 0.3, 0.3]])
+    scores = np.array([0.9, 0.8])
+    # Two boxes from one tile: the model already separated them
+    merged_boxes, _, _ = merge_tile_detections(
+        boxes, scores, np.array([1, 1]), tile_ids=np.array([2, 2]), truncated=np.array([False, False]))
+    assert len(merged_boxes) == 2
+
+    # Different classes are only kept apart when class-aware
+    merged_boxes, _, merged_classes = merge_tile_detections(
+        boxes, scores, np.array([1, 2]), tile_ids=np.array([0, 1]), truncated=np.array([False, False]),
+        class_aware=True)
+    assert sorted(merged_classes.tolist()) == [1, 2]
+    merged_boxes, _, _ = merge_tile_detections(
+        boxes, scores, np.array([1, 2]), tile_ids=np.array([0, 1]), truncated=np.array([False, False]))
+    assert len(merged_boxes) == 1
+
+    empty = merge_tile_detections(np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64),
+                                  np.zeros(0), np.zeros(0, dtype=bool))
+    assert [len(part) for part in empty] == [0, 0, 0]
+
+
+if __name__ == '__main__':
+    tests = [
+        test_tile_windows_cover_image,
+        test_tile_boxes_map_to_image,
+        test_truncated_only_at_inner_tile_edges,
+        test_duplicate_across_tiles_is_fused,
+        test_cut_off_box_is_replaced_by_complete_box,
+        test_all_truncated_group_becomes_enclosing_box,
+        test_same_tile_and_other_class_are_not_merged,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
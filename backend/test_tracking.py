@@ -0,0 +1,129 @@
+"""
+Test script for the streaming tracker: track ID reuse across frames, expiry
+after missed detector runs, and when a stream session runs the detector.
+
+Run with: python test_tracking.py  (or: python -m pytest test_tracking.py)
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+import tracking
+from tracking import IoUTracker, StreamSessionManager
+
+
+class FakeClock:
+    """Stands in for the time module so session expiry can be tested without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def fish(y1, x1, y2, x2, score=0.9):
+    return {'bbox': [y1, x1, y2, x2], 'score': score, 'class': 1}
+
+
+def encode(pixels):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_moving_fish_keeps_its_track_id():
+    tracker = IoUTracker(iou_threshold=0.3, min_hits=2)
+    first = tracker.update([fish(0.1, 0.1, 0.3, 0.3), fish(0.6, 0.6, 0.8, 0.8)], frame=0)
+    assert [det['track_id'] for det in first] == [1, 2]
+    assert tracker.confirmed_ids == set()
+
+    # Both fish moved a little; the matches keep their IDs and confirm them
+    second = tracker.update([fish(0.62, 0.62, 0.82, 0.82), fish(0.12, 0.12, 0.32, 0.32)], frame=2)
+    assert sorted((det['track_id'], det['bbox'][0]) for det in second) == [(1, 0.12), (2, 0.62)]
+    assert tracker.confirmed_ids == {1, 2}
+
+    # Skipped frames are extrapolated with the estimated velocity
+    predicted = {det['track_id']: det for det in tracker.predict(frame=4)}
+    assert predicted[1]['predicted']
+    np.testing.assert_allclose(predicted[1]['bbox'], [0.13, 0.13, 0.33, 0.33])
+
+    # A detection that doesn't overlap any track starts a new one
+    third = tracker.update([fish(0.14, 0.14, 0.34, 0.34), fish(0.4, 0.0, 0.5, 0.1)], frame=4)
+    assert sorted(det['track_id'] for det in third) == [1, 3]
+
+
+def test_tracks_expire_after_max_misses():
+    tracker = IoUTracker(max_misses=2)
+    tracker.update([fish(0.1, 0.1, 0.3, 0.3)], frame=0)
+    # Missed detector runs hide the track but keep it for a while
+    assert tracker.update([], frame=1) == []
+    assert tracker.update([], frame=2) == []
+    assert len(tracker.tracks) == 1
+    reappeared = tracker.update([fish(0.1, 0.1, 0.3, 0.3)], frame=3)
+    assert [det['track_id'] for det in reappeared] == [1]
+
+    # One miss too many and the same box becomes a new fish
+    for frame in (4, 5, 6):
+        tracker.update([], frame=frame)
+    assert tracker.tracks == []
+    assert [det['track_id'] for det in tracker.update([fish(0.1, 0.1, 0.3, 0.3)], frame=7)] == [2]
+
+
+def test_session_runs_detector_on_interval_and_scene_change():
+    calls = []
+
+    def detect_fn(image_source):
+        calls.append(image_source)
+        return [fish(0.1, 0.1, 0.3, 0.3)], [64, 64]
+
+    manager = StreamSessionManager(detect_every=3, scene_change_threshold=12.0)
+    session = manager.get('camera:1')
+    assert manager.get('camera:1') is session
+
+    dark = encode(np.full((64, 64), 40, dtype=np.uint8))
+    bright = encode(np.full((64, 64), 200, dtype=np.uint8))
+    reasons = [session.process_frame(frame, detect_fn)['reason'] for frame in (dark, dark, dark, dark, bright)]
+    assert reasons == ['first_frame', 'tracked', 'tracked', 'interval', 'scene_change']
+    assert len(calls) == 3
+
+    result = session.process_frame(bright, detect_fn)
+    assert not result['detector_ran']
+    assert [det['track_id'] for det in result['detections']] == [1]
+    assert result['unique_fish'] == 1
+    assert manager.close('camera:1')['detector_runs'] == 3
+    assert manager.close('camera:1') is None
+
+
+def test_idle_sessions_expire():
+    clock = FakeClock()
+    real_time, tracking.time = tracking.time, clock
+    try:
+        manager = StreamSessionManager(session_ttl=60, max_sessions=2)
+        first = manager.get('camera:1')
+        clock.now += 61
+        assert manager.get('camera:1') is not first
+
+        clock.now += 1
+        manager.get('camera:2')
+        clock.now += 1
+        # The least recently seen session makes room for a new one
+        manager.get('camera:3')
+        assert manager.stats()['active_sessions'] == 2
+        assert manager.close('camera:1') is None
+    finally:
+        tracking.time = real_time
+
+
+if __name__ == '__main__':
+    tests = [
+        test_moving_fish_keeps_its_track_id,
+        test_tracks_expire_after_max_misses,
+        test_session_runs_detector_on_interval_and_scene_change,
+        test_idle_sessions_expire,
+    ]
+    for test in tests:
+        test()
+        print(f'[SUCCESS] {test.__name__}')
@@ -0,0 +1,157 @@
+"""
+Tiled high-resolution inference helpers
+
+Downscaling a wide pond shot to the processing resolution shrinks small fry
+below what the detector (and MIN_BOX_SIZE) can see. In tiled mode the image
+is kept at (close to) full resolution and cut into overlapping fixed-size
+tiles that run through the model as a batch. Tile detections are mapped back
+to image coordinates and merged across tiles: duplicates of the same fish
+seen by neighbouring tiles are fused, and a box cut off by a tile edge is
+replaced by (or merged with) the complete box from the tile that saw it whole.
+
+Windows are [x0, y0, x1, y1] in pixels; boxes are [y1, x1, y2, x2] (normalized 0-1).
+"""
+
+import numpy as np
+
+from postprocess import box_iou
+
+
+def _starts(length, tile, overlap):
+    """Tile start offsets along one axis; the last tile is aligned to the far edge"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1.0 - overlap)))
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_windows(width, height, tile_size, overlap=0.2):
+    """
+    Overlapping windows covering a width x height image.
+    All windows share one size (tile_size, or the image size along an axis that is smaller).
+    """
+    tile_width = min(tile_size, width)
+    tile_height = min(tile_size, height)
+    return [
+        (x, y, x + tile_width, y + tile_height)
+        for y in _starts(height, tile_height, overlap)
+        for x in _starts(width, tile_width, overlap)
+    ]
+
+
+def tile_budget_scale(width, height, tile_size, overlap, max_tiles):
+    """Largest scale (<= 1) at which the image needs at most max_tiles tiles"""
+    scale = 1.0
+    while scale > 0.05:
+        scaled_width = max(1, int(width * scale))
+        scaled_height = max(1, int(height * scale))
+        if len(tile_windows(scaled_width, scaled_height, tile_size, overlap)) <= max_tiles:
+            return scale
+        scale *= 0.9
+    return scale
+
+
+def tile_to_image_boxes(boxes, window, width, height):
+    """Map [N, 4] boxes normalized to a tile into boxes normalized to the whole image"""
+    x0, y0, x1, y1 = window
+    boxes = np.asarray(boxes, dtype=np.float64)
+    mapped = np.empty_like(boxes)
+    mapped[:, 0::2] = (y0 + boxes[:, 0::2] * (y1 - y0)) / height
+    mapped[:, 1::2] = (x0 + boxes[:, 1::2] * (x1 - x0)) / width
+    return mapped
+
+
+def truncated_by_tile(boxes, window, width, height, margin=2):
+    """
+    [N] mask of tile boxes that touch an edge of their tile which is not an image edge -
+    these fish continue into a neighbouring tile and the box is probably partial.
+    Boxes are normalized to the tile.
+    """
+    x0, y0, x1, y1 = window
+    boxes = np.asarray(boxes, dtype=np.float64)
+    tile_width, tile_height = x1 - x0, y1 - y0
+    top = boxes[:, 0] * tile_height <= margin
+    left = boxes[:, 1] * tile_width <= margin
+    bottom = boxes[:, 2] * tile_height >= tile_height - margin
+    right = boxes[:, 3] * tile_width >= tile_width - margin
+    return ((top & (y0 > 0)) | (left & (x0 > 0)) |
+            (bottom & (y1 < height)) | (right & (x1 < width)))
+
+
+def box_ios(box, boxes):
+    """Intersection over the smaller area of a single [4] box against [N, 4] boxes"""
+    y1 = np.maximum(box[0], boxes[:, 0])
+    x1 = np.maximum(box[1], boxes[:, 1])
+    y2 = np.minimum(box[2], boxes[:, 2])
+    x2 = np.minimum(box[3], boxes[:, 3])
+
+    intersection = np.clip(x2 - x1, 0.0, None) * np.clip(y2 - y1, 0.0, None)
+    area = (box[3] - box[1]) * (box[2] - box[0])
+    areas = (boxes[:, 3] - boxes[:, 1]) * (boxes[:, 2] - boxes[:, 0])
+    smaller = np.minimum(area, areas)
+
+    ios = np.zeros_like(intersection)
+    np.divide(intersection, smaller, out=ios, where=smaller > 0)
+    return ios
+
+
+def merge_tile_detections(boxes, scores, classes, tile_ids, truncated, iou_threshold=0.5,
+                          ios_threshold=0.6, class_aware=False):
+    """
+    Cross-tile box fusion.
+
+    Boxes from different tiles are the same fish when they overlap by at least
+    iou_threshold, or - if one of them is cut off by a tile edge - when the
+    smaller one lies mostly inside the other (ios_threshold). Boxes from the same
+    tile are never merged here; the model already separated them.
+
+    Each group becomes one box: the score-weighted mean of its complete boxes,
+    or the enclosing box if every member is truncated. It keeps the group's
+    highest score and class.
+
+    Returns (boxes, scores, classes) sorted by score (highest first).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    classes = np.asarray(classes)
+    tile_ids = np.asarray(tile_ids)
+    truncated = np.asarray(truncated, dtype=bool)
+
+    order = np.argsort(-scores, kind='stable')
+    used = np.zeros(len(scores), dtype=bool)
+    merged_boxes, merged_scores, merged_classes = [], [], []
+
+    for i in order:
+        if used[i]:
+            continue
+        candidates = ~used & (tile_ids != tile_ids[i])
+        if class_aware:
+            candidates &= classes == classes[i]
+        idx = np.flatnonzero(candidates)
+
+        members = np.array([i], dtype=np.int64)
+        if len(idx):
+            iou = box_iou(boxes[i], boxes[idx])
+            ios = box_ios(boxes[i], boxes[idx])
+            partial = truncated[i] | truncated[idx]
+            match = (iou >= iou_threshold) | (partial & (ios >= ios_threshold))
+            members = np.concatenate([members, idx[match]])
+        used[members] = True
+
+        complete = members[~truncated[members]]
+        if len(complete):
+            weights = scores[complete]
+            box = (boxes[complete] * weights[:, None]).sum(axis=0) / weights.sum()
+        else:
+            group = boxes[members]
+            box = np.concatenate([group[:, :2].min(axis=0), group[:, 2:].max(axis=0)])
+
+        merged_boxes.append(box)
+        merged_scores.append(scores[i])
+        merged_classes.append(classes[i])
+
+    if not merged_boxes:
+        return np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=classes.dtype)
+    return np.array(merged_boxes), np.array(merged_scores), np.array(merged_classes)
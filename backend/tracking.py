@@ -0,0 +1,284 @@
+"""
+Streaming frame detection with tracker-assisted frame skipping
+
+For continuous tank monitoring the full detector only runs every k frames,
+or earlier when the scene changes. In between, a lightweight IoU tracker
+carries the last detections forward with a constant-velocity motion model,
+so frame rate is bound by the tracker and a tiny thumbnail decode rather
+than by sess.run. Tracks keep stable IDs across frames for counting.
+
+Boxes are in format [y1, x1, y2, x2] (normalized 0-1).
+"""
+
+import io
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from postprocess import box_iou
+
+# Side length of the grayscale thumbnail used for scene change detection
+THUMBNAIL_SIZE = 32
+
+
+def frame_thumbnail(image_source, size=THUMBNAIL_SIZE):
+    """
+    Decode a small grayscale thumbnail of a frame (cheap: JPEGs decode at 1/8 scale).
+    File-like sources are rewound so the frame can still be fully decoded afterwards.
+    """
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(image_source)
+        start = None
+    else:
+        stream = image_source
+        start = stream.tell()
+
+    image = Image.open(stream)
+    image.draft('L', (size, size))
+    thumbnail = np.asarray(image.convert('L').resize((size, size), Image.Resampling.BILINEAR), dtype=np.float32)
+
+    if start is not None:
+        stream.seek(start)
+    return thumbnail
+
+
+def scene_difference(thumbnail_a, thumbnail_b):
+    """Mean absolute pixel difference (0-255) between two thumbnails"""
+    return float(np.mean(np.abs(thumbnail_a - thumbnail_b)))
+
+
+class Track:
+    """A single tracked fish"""
+
+    def __init__(self, track_id, box, score, cls, frame):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float64)
+        self.velocity = np.zeros(4, dtype=np.float64)  # Box change per frame
+        self.score = score
+        self.cls = cls
+        self.last_frame = frame
+        self.hits = 1
+        self.misses = 0
+
+    def predict(self, frame):
+        """Box extrapolated to the given frame index, clipped to the image"""
+        box = self.box + self.velocity * (frame - self.last_frame)
+        return np.clip(box, 0.0, 1.0)
+
+
+class IoUTracker:
+    """
+    Greedy IoU tracker with a constant-velocity motion model.
+
+    Args:
+        iou_threshold: Minimum IoU between a predicted track and a detection to match them
+        max_misses: Detector runs a track may go unmatched before it is dropped
+        min_hits: Detector matches before a track counts as a confirmed fish
+        velocity_smoothing: Weight of the newest velocity estimate (0-1)
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, min_hits=2, velocity_smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.velocity_smoothing = velocity_smoothing
+        self.tracks = []
+        self._next_id = 1
+        self.confirmed_ids = set()
+
+    def update(self, detections, frame):
+        """Match detector output for this frame to existing tracks; returns tracked detections"""
+        boxes = np.array([det['bbox'] for det in detections], dtype=np.float64).reshape(-1, 4)
+        unmatched_dets = set(range(len(detections)))
+        matched_tracks = set()
+
+        if self.tracks and len(detections):
+            predicted = np.array([track.predict(frame) for track in self.tracks])
+            iou = np.stack([box_iou(box, boxes) for box in predicted])
+
+            # Greedy matching, highest IoU first
+            for flat in np.argsort(-iou, axis=None):
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or d not in unmatched_dets:
+                    continue
+                matched_tracks.add(t)
+                unmatched_dets.discard(d)
+                self._apply_match(self.tracks[t], detections[d], boxes[d], frame)
+
+        # Age out tracks the detector didn't see this time
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for d in sorted(unmatched_dets):
+            det = detections[d]
+            track = Track(self._next_id, boxes[d], det['score'], det['class'], frame)
+            self._next_id += 1
+            self.tracks.append(track)
+            if track.hits >= self.min_hits:
+                self.confirmed_ids.add(track.track_id)
+
+        return self._output(frame, predicted=False)
+
+    def predict(self, frame):
+        """Carry current tracks forward to a frame the detector skipped"""
+        return self._output(frame, predicted=True)
+
+    def _apply_match(self, track, det, box, frame):
+        elapsed = max(1, frame - track.last_frame)
+        velocity = (box - track.box) / elapsed
+        a = self.velocity_smoothing
+        track.velocity = a * velocity + (1 - a) * track.velocity
+        track.box = box
+        track.score = det['score']
+        track.cls = det['class']
+        track.last_frame = frame
+        track.hits += 1
+        track.misses = 0
+        if track.hits >= self.min_hits:
+            self.confirmed_ids.add(track.track_id)
+
+    def _output(self, frame, predicted):
+        # Only report tracks the detector saw on its latest run
+        return [
+            {
+                'bbox': [float(v) for v in (track.predict(frame) if predicted else track.box)],
+                'score': float(track.score),
+                'class': int(track.cls),
+                'track_id': track.track_id,
+                'predicted': predicted
+            }
+            for track in self.tracks if track.misses == 0
+        ]
+
+
+class StreamSession:
+    """Per-camera state: frame counter, tracker and the last detector frame's thumbnail"""
+
+    def __init__(self, session_id, detect_every, scene_change_threshold, tracker_kwargs=None):
+        self.session_id = session_id
+        self.detect_every = max(1, int(detect_every))
+        self.scene_change_threshold = scene_change_threshold
+        self.tracker = IoUTracker(**(tracker_kwargs or {}))
+        self.lock = threading.Lock()
+        self.frame_index = -1
+        self.last_detect_frame = None
+        self.last_thumbnail = None
+        self.image_size = None
+        self.last_seen = time.monotonic()
+        self.frames = 0
+        self.detector_runs = 0
+
+    def process_frame(self, image_source, detect_fn):
+        """
+        Process the next frame of the stream.
+        detect_fn(image_source) must return (detections, image_size) like /detect.
+        """
+        with self.lock:
+            self.last_seen = time.monotonic()
+            self.frame_index += 1
+            self.frames += 1
+            frame = self.frame_index
+
+            thumbnail = frame_thumbnail(image_source)
+            reason = None
+            if self.last_detect_frame is None:
+                reason = 'first_frame'
+            elif frame - self.last_detect_frame >= self.detect_every:
+                reason = 'interval'
+            elif scene_difference(thumbnail, self.last_thumbnail) > self.scene_change_threshold:
+                reason = 'scene_change'
+
+            if reason is not None:
+                detections, image_size = detect_fn(image_source)
+                tracked = self.tracker.update(detections, frame)
+                self.last_detect_frame = frame
+                self.last_thumbnail = thumbnail
+                self.image_size = image_size
+                self.detector_runs += 1
+            else:
+                tracked = self.tracker.predict(frame)
+
+            return {
+                'frame': frame,
+                'detector_ran': reason is not None,
+                'reason': reason or 'tracked',
+                'detections': tracked,
+                'image_size': self.image_size,
+                'active_tracks': len(tracked),
+                'unique_fish': len(self.tracker.confirmed_ids)
+            }
+
+    def summary(self):
+        return {
+            'session_id': self.session_id,
+            'frames': self.frames,
+            'detector_runs': self.detector_runs,
+            'unique_fish': len(self.tracker.confirmed_ids),
+            'active_tracks': sum(1 for track in self.tracker.tracks if track.misses == 0)
+        }
+
+
+class StreamSessionManager:
+    """
+    Thread-safe registry of stream sessions with idle expiry.
+
+    Args:
+        detect_every: Run the full detector at least every k frames
+        scene_change_threshold: Thumbnail difference (0-255) that forces a detector run
+        session_ttl: Seconds of inactivity before a session is discarded
+        max_sessions: Upper bound on concurrent sessions (oldest idle ones are evicted)
+    """
+
+    def __init__(self, detect_every=5, scene_change_threshold=12.0, session_ttl=60.0, max_sessions=100,
+                 tracker_kwargs=None):
+        self.detect_every = detect_every
+        self.scene_change_threshold = scene_change_threshold
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.tracker_kwargs = tracker_kwargs
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the session for this id, creating it if needed"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    oldest = min(self._sessions.values(), key=lambda s: s.last_seen)
+                    del self._sessions[oldest.session_id]
+                session = StreamSession(session_id, self.detect_every, self.scene_change_threshold,
+                                        self.tracker_kwargs)
+                self._sessions[session_id] = session
+            return session
+
+    def close(self, session_id):
+        """Remove a session and return its summary (None if unknown)"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        return session.summary() if session is not None else None
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {
+                'active_sessions': len(self._sessions),
+                'detect_every': self.detect_every,
+                'scene_change_threshold': self.scene_change_threshold
+            }
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_seen > self.session_ttl]:
+            del self._sessions[session_id]
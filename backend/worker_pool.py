@@ -0,0 +1,307 @@
+"""
+Multi-process inference worker pool
+
+A single TensorFlow session with a handful of threads can't use all cores
+on a large box. This pool pre-forks N worker processes, each holding its own
+session over the same frozen graph, and dispatches every inference to the
+worker with the fewest requests in flight. Workers that die are detected by
+a monitor thread, their in-flight requests are failed, and they are restarted.
+A worker that keeps failing to start (e.g. it can't load the model) is
+restarted with exponential backoff and given up on after MAX_FAILED_STARTS
+attempts in a row; the pool then reports itself degraded.
+"""
+
+import contextlib
+import itertools
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Seconds between liveness checks, and minimum delay before restarting a worker
+MONITOR_INTERVAL = 0.5
+RESTART_BACKOFF = 2.0
+
+# A worker that exits before becoming ready waits twice as long before each further restart,
+# up to MAX_RESTART_BACKOFF, and is not restarted again after MAX_FAILED_STARTS in a row
+MAX_RESTART_BACKOFF = 60.0
+MAX_FAILED_STARTS = 5
+
+# Serializes worker starts, which briefly modify the __main__ module
+_spawn_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _main_module_hidden():
+    """
+    Hide the parent's __main__ script from multiprocessing while a worker is started.
+    A spawned process re-imports it (as __mp_main__) before running its target, which for
+    `python start_server.py` would rerun the whole server setup - Flask app, caches, schedulers,
+    background threads - in every worker. Workers only need model_loader.
+    """
+    main = sys.modules.get('__main__')
+    if main is None:
+        yield
+        return
+    with _spawn_lock:
+        saved = {name: main.__dict__[name] for name in ('__file__', '__spec__') if name in main.__dict__}
+        main.__dict__.pop('__file__', None)
+        main.__spec__ = None
+        try:
+            yield
+        finally:
+            del main.__spec__
+            main.__dict__.update(saved)
+
+
+class _Worker:
+    """Parent-side bookkeeping for one worker process"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.task_queue = None
+        self.pid = None
+        self.ready = False
+        self.failed = False  # Last start attempt couldn't load the model
+        self.in_flight = {}  # task_id -> Future
+        self.completed = 0
+        self.restarts = 0
+        self.started_at = 0.0
+        self.failed_starts = 0  # Consecutive starts that exited before becoming ready
+        self.counted_failure = False  # The current start's failure is already in failed_starts
+        self.gave_up = False
+
+    def restart_delay(self):
+        if not self.failed_starts:
+            return RESTART_BACKOFF
+        return min(RESTART_BACKOFF * 2 ** (self.failed_starts - 1), MAX_RESTART_BACKOFF)
+
+
+class WorkerPool:
+    """
+    Pool of inference worker processes fronted by a least-loaded dispatcher.
+
+    Args:
+        model_path: Path to the frozen inference graph loaded by every worker
+        num_workers: Number of worker processes
+        threads_per_worker: TensorFlow inter/intra-op threads per worker session
+        warmup_shapes: (batch, height, width) inputs each worker runs before reporting ready
+    """
+
+    def __init__(self, model_path, num_workers, threads_per_worker=2, warmup_shapes=None):
+        self.model_path = model_path
+        self.num_workers = max(1, int(num_workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.warmup_shapes = warmup_shapes
+
+        # spawn: TensorFlow is not fork-safe once it has been initialized
+        self._ctx = multiprocessing.get_context('spawn')
+        self._result_queue = self._ctx.Queue()
+        self._workers = [_Worker(i) for i in range(self.num_workers)]
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._task_ids = itertools.count()
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        """Spawn all workers and the collector/monitor threads"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for worker in self._workers:
+                self._spawn(worker)
+
+        for target, name in ((self._collect_results, 'worker-pool-collector'),
+                             (self._monitor, 'worker-pool-monitor')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f'Started {self.num_workers} inference workers '
+                    f'({self.threads_per_worker} threads each)')
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until every worker has either loaded the model or failed to (or the timeout expires).
+        Returns True if at least one worker is ready.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            while not all(worker.ready or worker.failed for worker in self._workers):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            return any(worker.ready for worker in self._workers)
+
+    def stop(self):
+        """Stop all workers and fail anything still in flight"""
+        with self._lock:
+            self._running = False
+            workers = list(self._workers)
+        for worker in workers:
+            if worker.task_queue is not None:
+                worker.task_queue.put(None)
+        for worker in workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            self._fail_in_flight(worker, RuntimeError('Worker pool stopped'))
+        self._result_queue.put(None)
+
+    def run(self, batch_np, timeout=None):
+        """Run one [N, H, W, 3] batch on the least-loaded worker and return its outputs"""
+        return self._submit(batch_np, False).result(timeout=timeout)
+
+    def run_traced(self, batch_np, timeout=None):
+        """Like run, with a full TensorFlow trace; returns (outputs, Chrome trace JSON string)"""
+        return self._submit(batch_np, True).result(timeout=timeout)
+
+    def _submit(self, batch_np, traced):
+        future = Future()
+        with self._lock:
+            candidates = [w for w in self._workers if w.ready]
+            if not candidates:
+                raise RuntimeError('No inference workers available')
+            worker = min(candidates, key=lambda w: len(w.in_flight))
+            task_id = next(self._task_ids)
+            worker.in_flight[task_id] = future
+            worker.task_queue.put((task_id, batch_np, traced))
+        return future
+
+    def in_flight(self):
+        with self._lock:
+            return sum(len(w.in_flight) for w in self._workers)
+
+    def _degraded(self):
+        """A worker has been given up on, or none is ready - caller holds the lock"""
+        return any(w.gave_up for w in self._workers) or not any(w.ready for w in self._workers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'num_workers': self.num_workers,
+                'threads_per_worker': self.threads_per_worker,
+                'workers_ready': sum(w.ready for w in self._workers),
+                'degraded': self._degraded(),
+                'workers': [
+                    {
+                        'index': w.index,
+                        'pid': w.pid,
+                        'ready': w.ready,
+                        'alive': w.process is not None and w.process.is_alive(),
+                        'in_flight': len(w.in_flight),
+                        'completed': w.completed,
+                        'restarts': w.restarts,
+                        'failed_starts': w.failed_starts,
+                        'gave_up': w.gave_up
+                    }
+                    for w in self._workers
+                ]
+            }
+
+    def _spawn(self, worker):
+        """Start (or restart) a worker process - caller holds the lock"""
+        worker.task_queue = self._ctx.Queue()
+        worker.ready = False
+        worker.failed = False
+        worker.pid = None
+        worker.counted_failure = False
+        worker.started_at = time.monotonic()
+        # Imported here so the parent process never pays for it when the pool is unused
+        from model_loader import worker_main
+
+        worker.process = self._ctx.Process(
+            target=worker_main,
+            args=(worker.index, self.model_path, self.threads_per_worker, self.warmup_shapes,
+                  worker.task_queue, self._result_queue),
+            name=f'inference-worker-{worker.index}',
+            daemon=True
+        )
+        with _main_module_hidden():
+            worker.process.start()
+
+    def _fail_in_flight(self, worker, error):
+        with self._lock:
+            pending = list(worker.in_flight.values())
+            worker.in_flight.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def _collect_results(self):
+        while True:
+            message = self._result_queue.get()
+            if message is None:
+                return
+            kind, index, task_id, payload = message
+            worker = self._workers[index]
+
+            if kind == 'ready':
+                with self._ready:
+                    worker.ready = True
+                    worker.pid = payload
+                    worker.failed_starts = 0
+                    self._ready.notify_all()
+                logger.info(f'Inference worker {index} ready (pid {payload})')
+                continue
+
+            if kind == 'failed':
+                with self._ready:
+                    worker.failed = True
+                    self._ready.notify_all()
+                logger.error(f'Inference worker {index} failed to load model: {payload}')
+                continue
+
+            with self._lock:
+                future = worker.in_flight.pop(task_id, None)
+                if kind == 'result':
+                    worker.completed += 1
+            if future is None or future.done():
+                continue
+            if kind == 'result':
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _monitor(self):
+        """Restart workers whose process has exited"""
+        while True:
+            time.sleep(MONITOR_INTERVAL)
+            with self._lock:
+                if not self._running:
+                    return
+                dead = [w for w in self._workers
+                        if w.process is not None and not w.gave_up and not w.process.is_alive()]
+
+            for worker in dead:
+                self._fail_in_flight(worker, RuntimeError(f'Inference worker {worker.index} crashed'))
+                with self._lock:
+                    if not self._running:
+                        return
+                    if not worker.ready and worker.pid is None and not worker.counted_failure:
+                        # Exited before it was ever ready this time: counts as a failed start
+                        worker.failed_starts += 1
+                        worker.counted_failure = True
+                    worker.ready = False
+                    if worker.failed_starts >= MAX_FAILED_STARTS:
+                        worker.gave_up = True
+                        logger.error(f'Inference worker {worker.index} failed to start {worker.failed_starts} times '
+                                     f'in a row - not restarting it (worker pool degraded)')
+                        continue
+                    # Back off (exponentially while starts keep failing) so a worker that can't load the model doesn't spin
+                    if time.monotonic() - worker.started_at < worker.restart_delay():
+                        continue
+                    logger.error(f'Inference worker {worker.index} exited '
+                                 f'(code {worker.process.exitcode}) - restarting')
+                    worker.restarts += 1
+                    self._spawn(worker)
@@ -39,17 +39,22 @@ export async function POST(request: NextRequest) {
 
         // Call Python backend (optimized for TensorFlow 1.x .pb models)
         const pythonBackendUrl = process.env.PYTHON_BACKEND_URL || 'http://localhost:5000';
+        const backendTimeoutMs = 10000;
 
         try {
             const startTime = Date.now();
             const response = await fetch(`${pythonBackendUrl}/detect`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: {
+                    'Content-Type': 'application/json',
+                    // Lets the backend drop this request instead of running it after we've given up
+                    'X-Request-Timeout-Ms': String(backendTimeoutMs),
+                },
                 body: JSON.stringify({
                     imageData: imageData,
                 }),
                 // Timeout for web optimization
-                signal: AbortSignal.timeout(10000), // 10 second timeout
+                signal: AbortSignal.timeout(backendTimeoutMs), // 10 second timeout
             });
 
             if (response.ok) {
@@ -59,7 +64,12 @@ export async function POST(request: NextRequest) {
                 return NextResponse.json(result);
             } else {
                 const errorText = await response.text();
-                console.warn(`Python backend error (${response.status}):`, errorText);
+                if (response.status === 429 || response.status === 503) {
+                    // Backend overloaded - fall back now rather than retrying (Retry-After is advisory)
+                    console.warn(`Python backend busy (${response.status}, retry after ${response.headers.get('Retry-After')}s)`);
+                } else {
+                    console.warn(`Python backend error (${response.status}):`, errorText);
+                }
                 throw new Error(`Backend returned ${response.status}`);
             }
         } catch (error: any) {
@@ -1,10 +1,11 @@
 import { NextRequest, NextResponse } from 'next/server';
-import { updateSensorData, getLatestSensorData } from './stream/route';
+import { updateSensorData, getLatestSensorData, getSensorDeviceIds } from './stream/route';
 
 export async function GET(request: NextRequest) {
     try {
-        // Get latest data from in-memory storage (real-time, no database)
-        const latestData = getLatestSensorData();
+        // Get latest data from in-memory storage (real-time, no database) - of one device with ?device_id=
+        const deviceId = request.nextUrl.searchParams.get('device_id');
+        const latestData = getLatestSensorData(deviceId);
 
         const response: any = {
             status: latestData.ph !== null || latestData.temperature !== null ? 'success' : 'fetched',
@@ -14,7 +15,9 @@ export async function GET(request: NextRequest) {
             data: {
                 ph: latestData.ph,
                 temperature: latestData.temperature,
+                device_id: latestData.deviceId,
             },
+            devices: getSensorDeviceIds(),
         };
 
         return NextResponse.json(response);
@@ -48,33 +51,79 @@ export async function POST(request: NextRequest) {
             };
         }
 
-        const phValue = parseFloat(body.ph_value);
-        const temperature = parseFloat(body.temperature);
-
-        // Validate data ranges
-        if (isNaN(phValue) || isNaN(temperature)) {
-            console.error('Invalid sensor data received:', { ph_value: body.ph_value, temperature: body.temperature });
+        // Batched uploads from the IoT uploader: { readings: [{ ph_value, temperature, status, timestamp }, ...] }
+        const readings: any[] = Array.isArray(body?.readings) ? body.readings : [body];
+        if (readings.length === 0) {
             return NextResponse.json(
-                { status: 'error', message: 'Invalid ph or temperature values' },
+                { status: 'error', message: 'No readings in request' },
                 { status: 400 }
             );
         }
 
-        // Validate reasonable ranges (optional but recommended)
-        if (phValue < 0 || phValue > 14) {
-            console.warn('pH value out of normal range:', phValue);
+        const parsed: { phValue: number; temperature: number; deviceId: string | null; readAt: number }[] = [];
+        // Invalid readings are skipped, not the whole batch: one bad probe mustn't discard the others' readings
+        let rejected = 0;
+        for (const reading of readings) {
+            const phValue = parseFloat(reading?.ph_value);
+            const temperature = parseFloat(reading?.temperature);
+
+            // Validate data ranges
+            if (!Number.isFinite(phValue) || !Number.isFinite(temperature)) {
+                console.error('Invalid sensor data received:', { ph_value: reading?.ph_value, temperature: reading?.temperature });
+                rejected++;
+                continue;
+            }
+
+            // Validate reasonable ranges (optional but recommended)
+            if (phValue < 0 || phValue > 14) {
+                console.warn('pH value out of normal range:', phValue);
+            }
+
+            if (temperature < -20 || temperature > 100) {
+                console.warn('Temperature value out of normal range:', temperature);
+            }
+
+            // Uploaders reading several probes tag each reading with the probe's device_id
+            const deviceId = typeof reading?.device_id === 'string' && reading.device_id.trim()
+                ? reading.device_id.trim().slice(0, 64)
+                : null;
+
+            // When the reading was taken: replayed backlogs can be hours old (future times are clamped to now)
+            const readTime = typeof reading?.timestamp === 'string' ? Date.parse(reading.timestamp) : NaN;
+            const readAt = Number.isFinite(readTime) ? Math.min(readTime, Date.now()) : Date.now();
+
+            parsed.push({ phValue, temperature, deviceId, readAt });
         }
 
-        if (temperature < -20 || temperature > 100) {
-            console.warn('Temperature value out of normal range:', temperature);
+        if (parsed.length === 0) {
+            return NextResponse.json(
+                { status: 'error', message: 'Invalid ph or temperature values', rejected },
+                { status: 400 }
+            );
         }
 
-        // Update in-memory data for real-time display (NO database storage)
-        updateSensorData(phValue, temperature);
+        // Update in-memory data for real-time display (NO database storage) - the newest reading of
+        // each device wins, unless the device already has a newer one (a replayed backlog isn't "live")
+        const newestByDevice = new Map<string | null, (typeof parsed)[number]>();
+        for (const reading of parsed) {
+            const newest = newestByDevice.get(reading.deviceId);
+            if (!newest || reading.readAt >= newest.readAt) {
+                newestByDevice.set(reading.deviceId, reading);
+            }
+        }
+        const newestReadings = Array.from(newestByDevice.values()).sort((a, b) => a.readAt - b.readAt);
+        const stale = newestReadings.filter(
+            (reading) => !updateSensorData(reading.phValue, reading.temperature, reading.deviceId, reading.readAt)
+        ).length;
+        const { phValue, temperature } = newestReadings[newestReadings.length - 1];
 
         console.log('✅ Sensor data updated in real-time (in-memory):', {
             ph: phValue,
             temperature: temperature,
+            readings: parsed.length,
+            rejected,
+            stale,
+            devices: newestByDevice.size,
             timestamp: new Date().toISOString(),
         });
 
@@ -84,6 +133,9 @@ export async function POST(request: NextRequest) {
             data: {
                 ph: phValue,
                 temperature: temperature,
+                readings: parsed.length,
+                rejected,
+                stale,
                 timestamp: new Date().toISOString(),
             },
         });
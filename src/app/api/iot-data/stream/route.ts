@@ -1,28 +1,63 @@
 import { NextRequest } from 'next/server';
 
+// timestamp: when the server stored the data; readAt: when the sensor read it (the uploader's timestamp)
+type SensorData = {
+    ph: number | null;
+    temperature: number | null;
+    timestamp: number;
+    readAt: number;
+    deviceId: string | null;
+};
+
 // Store the latest sensor data in memory for SSE (shared across requests)
 // Real-time data only - NO database storage
-let latestSensorData: { ph: number | null; temperature: number | null; timestamp: number } = {
+let latestSensorData: SensorData = {
     ph: null,
     temperature: null,
     timestamp: Date.now(),
+    readAt: 0,
+    deviceId: null,
 };
 
-// Function to update sensor data (called by POST endpoint)
-export function updateSensorData(ph: number, temperature: number) {
-    latestSensorData = {
+// Latest data of each device, keyed by device ID ('' for uploaders that send none)
+const latestByDevice = new Map<string, SensorData>();
+
+// Function to update sensor data (called by POST endpoint). Returns false, and changes nothing, when the
+// reading is older than the one already stored for its device - e.g. a backlog replayed after an outage
+export function updateSensorData(ph: number, temperature: number, deviceId: string | null = null, readAt: number = Date.now()) {
+    const key = deviceId ?? '';
+    const previous = latestByDevice.get(key);
+    if (previous && readAt < previous.readAt) {
+        return false;
+    }
+    const data: SensorData = {
         ph,
         temperature,
         timestamp: Date.now(),
+        readAt,
+        deviceId,
     };
-    console.log('Sensor data updated in memory:', latestSensorData);
+    latestByDevice.set(key, data);
+    if (latestSensorData.ph === null || latestSensorData.deviceId === deviceId || readAt >= latestSensorData.readAt) {
+        latestSensorData = data;
+    }
+    console.log('Sensor data updated in memory:', data);
+    return true;
 }
 
-// Get current sensor data
-export function getLatestSensorData() {
+// Get current sensor data (of one device, if given)
+export function getLatestSensorData(deviceId?: string | null): SensorData {
+    if (deviceId) {
+        return latestByDevice.get(deviceId) ?? { ph: null, temperature: null, timestamp: Date.now(), readAt: 0, deviceId };
+    }
     return latestSensorData;
 }
 
+// IDs of the devices that have sent data
+export function getSensorDeviceIds() {
+    return Array.from(latestByDevice.keys()).filter((deviceId) => deviceId !== '');
+}
+
 // SSE endpoint for real-time sensor data
 export async function GET(request: NextRequest) {
     const encoder = new TextEncoder();
@@ -30,7 +65,7 @@ export async function GET(request: NextRequest) {
     const stream = new ReadableStream({
         async start(controller) {
             // Send initial data
-            const sendData = (data: typeof latestSensorData) => {
+            const sendData = (data: SensorData) => {
                 const message = `data: ${JSON.stringify(data)}\n\n`;
                 controller.enqueue(encoder.encode(message));
             };